@@ -0,0 +1,59 @@
+import glob
+import os
+
+from utils import parseTestCase
+# normalize_move and replay_setup live with Position; they are imported here for the analysis tools
+from game_items.position import normalize_move, replay_setup
+
+
+def iter_game_files(paths):
+    """
+    Expand files, directories and glob patterns into a sorted list of game files.
+
+    :param paths: A list of paths. Directories contribute every .in file below them.
+    :return: A list of file paths.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names if name.endswith(".in"))
+        else:
+            files.extend(glob.glob(path) or [path])
+    return sorted(files)
+
+
+def output_paths(files, out_dir, extension=".out"):
+    """
+    Name an output file under a directory for every game file. The paths of the game
+    files below the deepest directory holding all of them are mirrored, so that files
+    of the same name in different directories do not collide.
+
+    :param files: A list of game file paths.
+    :param out_dir: The directory the outputs are written to.
+    :param extension: The extension replacing that of every game file.
+    :return: A dict mapping every game file to its output path.
+    """
+    if not files:
+        return {}
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in files])
+    outputs = {}
+    written_from = {}
+    for path in files:
+        name = os.path.splitext(os.path.relpath(os.path.abspath(path), root))[0] + extension
+        output = os.path.join(out_dir, name)
+        # Files differing only by extension still collide
+        if output in written_from:
+            raise ValueError(f"{written_from[output]} and {path} would both be written to {output}")
+        written_from[output] = path
+        outputs[path] = output
+    return outputs
+
+
+def replay_file(path):
+    """
+    Replay a game file, yielding every position reached. See replay_setup().
+
+    :param path: Path to the game file.
+    """
+    return replay_setup(parseTestCase(path))
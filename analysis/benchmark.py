@@ -0,0 +1,118 @@
+import os
+import random
+import subprocess
+import sys
+import time
+
+from game_items.gamevars import BOARD_SIZE
+
+
+def run_benchmark(plies=5000, seed=0):
+    """
+    Measure move generation, check detection and checkmate detection on the current
+    board size, for Position and for FileGame.
+
+    Random games are played from the starting position. A FileGame plays the same
+    moves as the Position, so that its move cache is used as in a real game. At every
+    ply both engines generate the moves of the player to move, test both Drives for
+    check and test the player to move for checkmate. FileGame generates moves with
+    all_possible_moves, which lists the squares the pieces reach without checking for
+    self-check or adding drops, so its move rates are not comparable with Position's.
+
+    :param plies: The number of plies to play.
+    :param seed: The random seed for the games.
+    :return: A dict with a dict of rates per second for 'position' and 'filegame':
+        'positions', 'moves', 'checks' and 'mates'.
+    """
+    from game_modes.filegame import FileGame
+    from game_modes.tournament import initial_position
+
+    rng = random.Random(seed)
+    position = initial_position()
+    game = FileGame()
+    position.apply_to(game)
+    counts = {"positions": 0, "moves": 0, "game_moves": 0}
+    times = {engine: {"moves": 0.0, "checks": 0.0, "mates": 0.0} for engine in ("position", "filegame")}
+    for _ in range(plies):
+        start = time.perf_counter()
+        legal_moves = position.legal_moves()
+        generated = time.perf_counter()
+        position.in_check("lower")
+        position.in_check("UPPER")
+        checked = time.perf_counter()
+        position.is_checkmate()
+        end = time.perf_counter()
+        times["position"]["moves"] += generated - start
+        times["position"]["checks"] += checked - generated
+        times["position"]["mates"] += end - checked
+
+        start = time.perf_counter()
+        game_moves = game.cur_player.all_possible_moves(game.board)
+        generated = time.perf_counter()
+        game.is_in_check()
+        game.switch_players()
+        game.is_in_check()
+        game.switch_players()
+        checked = time.perf_counter()
+        game.is_in_check() and game.is_checkmated()
+        end = time.perf_counter()
+        times["filegame"]["moves"] += generated - start
+        times["filegame"]["checks"] += checked - generated
+        times["filegame"]["mates"] += end - checked
+
+        counts["positions"] += 1
+        counts["moves"] += len(legal_moves)
+        counts["game_moves"] += len(game_moves)
+        if not legal_moves:
+            position = initial_position()
+            game = FileGame()
+            position.apply_to(game)
+            continue
+        move = rng.choice(legal_moves)
+        position = position.play(move)
+        split = move.split()
+        if split[0] == "move":
+            game.make_move(split)
+        else:
+            game.drop_move(split)
+        game.switch_players()
+
+    rates = {}
+    for engine, moves in (("position", counts["moves"]), ("filegame", counts["game_moves"])):
+        engine_times = times[engine]
+        rates[engine] = {
+            "positions": counts["positions"] / engine_times["moves"],
+            "moves": moves / engine_times["moves"],
+            "checks": 2 * counts["positions"] / engine_times["checks"],
+            "mates": counts["positions"] / engine_times["mates"],
+        }
+    return rates
+
+
+def print_benchmark():
+    """
+    Print the benchmark results for the current board size, one line per engine.
+    """
+    rates = run_benchmark()
+    for engine, name in (("position", "Position"), ("filegame", "FileGame")):
+        engine_rates = rates[engine]
+        print(f"{BOARD_SIZE}x{BOARD_SIZE} {name}: {engine_rates['positions']:.0f} positions/sec, "
+              f"{engine_rates['moves']:.0f} moves/sec, {engine_rates['checks']:.0f} checks/sec, "
+              f"{engine_rates['mates']:.0f} checkmate tests/sec")
+
+
+def run_benchmarks(sizes=(5, 7, 9)):
+    """
+    Run the benchmark at several board sizes. The board size is fixed when the game
+    modules are imported, so every size runs in its own interpreter.
+
+    :param sizes: The board sizes to measure.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for size in sizes:
+        env = dict(os.environ, BOXSHOGI_BOARD_SIZE=str(size))
+        subprocess.run([sys.executable, "-m", "analysis.benchmark"], cwd=root, env=env, check=True)
+
+
+if __name__ == "__main__":
+    print_benchmark()
@@ -0,0 +1,185 @@
+import mmap
+import struct
+from collections import namedtuple
+
+from utils import parseTestCase
+from game_items.gamevars import BOARD_SIZE, PROMOTION_ZONE
+from game_items.position import flip_move
+from game_modes.batchgame import replay_batch
+from analysis.archive import iter_game_files, replay_setup
+from analysis.export import action_index, action_move
+from analysis.positionindex import position_hash
+
+MAGIC = b"BXBK"
+VERSION = 1
+# magic, version, board size, promotion zone rows, plies mined per game, number of records
+HEADER = struct.Struct("<4sHBBHQ")
+# position hash, action index of the move, games, wins and losses of the player to move
+RECORD = struct.Struct("<QHIII")
+KEY = struct.Struct("<Q")
+
+DEFAULT_PLIES = 12
+
+# move: the move string. weight: share of the book games from the position that played
+# it. games, wins, draws, losses: the outcomes of those games for the player to move,
+# draws including games that did not finish.
+BookMove = namedtuple("BookMove", ["move", "weight", "games", "wins", "draws", "losses"])
+
+
+def build_book(paths, book_path, plies=DEFAULT_PLIES, progress=None):
+    """
+    Mine the first plies of every game file for the moves played and how the games
+    ended, and write them to a book file.
+
+    Positions are stored in canonical form, see Position.canonical(), so a position
+    and its color-flipped twin share their entries. Records are sorted by position
+    hash and move, so a probe is a binary search.
+
+    :param paths: Files, directories or glob patterns, see analysis.archive.iter_game_files().
+    :param book_path: The book file to write.
+    :param plies: The number of plies mined from the start of every game.
+    :param progress: Optional callable receiving a status string when done.
+    :return: The number of positions in the book.
+    """
+    game_setups = {}
+    for path in iter_game_files(paths):
+        try:
+            game_setups[path] = parseTestCase(path)
+        except Exception:
+            continue
+    results = replay_batch(game_setups)
+
+    stats = {}
+    games = 0
+    for path, game_setup in game_setups.items():
+        result = results[path]
+        if isinstance(result, Exception):
+            continue
+        games += 1
+        for ply, position, move in replay_setup(game_setup):
+            if move is None or ply >= plies or ply >= result.plies:
+                break
+            canonical, flipped = position.canonical()
+            key = (position_hash(canonical), action_index(flip_move(move) if flipped else move))
+            record = stats.setdefault(key, [0, 0, 0])
+            record[0] += 1
+            if result.winner == position.side:
+                record[1] += 1
+            elif result.winner is not None:
+                record[2] += 1
+
+    with open(book_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, BOARD_SIZE, PROMOTION_ZONE, plies, len(stats)))
+        for (key, action), (count, wins, losses) in sorted(stats.items()):
+            f.write(RECORD.pack(key, action, count, wins, losses))
+    positions = len(set(key for key, _ in stats))
+    if progress:
+        progress(f"mined {games} games, {positions} positions, {len(stats)} moves")
+    return positions
+
+
+class OpeningBook:
+    """
+    Read-only access to a book file written by build_book(). The file is
+    memory-mapped, so a probe binary searches the sorted records and reads only
+    the moves of the position.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The book file to open.
+        """
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, board_size, zone, self.plies, self.size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION or board_size != BOARD_SIZE or zone != PROMOTION_ZONE:
+            raise ValueError("Not an opening book for this board: " + path)
+        if len(self._mmap) != HEADER.size + self.size * RECORD.size:
+            raise ValueError("Corrupt opening book: " + path)
+
+    def close(self):
+        self._mmap.close()
+
+    def _key_at(self, i):
+        return KEY.unpack_from(self._mmap, HEADER.size + i * RECORD.size)[0]
+
+    def probe(self, position):
+        """
+        Look up the book moves of a position.
+
+        :param position: A Position.
+        :return: A list of BookMove, most played first, empty if the position is not in the book.
+        """
+        canonical, flipped = position.canonical()
+        key = position_hash(canonical)
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        records = []
+        while low < self.size:
+            record_key, action, games, wins, losses = RECORD.unpack_from(self._mmap, HEADER.size + low * RECORD.size)
+            if record_key != key:
+                break
+            move = action_move(action)
+            records.append((flip_move(move) if flipped else move, games, wins, losses))
+            low += 1
+
+        total = sum(games for _, games, _, _ in records)
+        moves = [BookMove(move, games / total, games, wins, games - wins - losses, losses)
+                 for move, games, wins, losses in records]
+        moves.sort(key=lambda book_move: (-book_move.games, book_move.move))
+        return moves
+
+    def choose(self, position, rng, legal_moves=None):
+        """
+        Pick a book move at random, weighted by how often it was played.
+
+        :param position: A Position.
+        :param rng: A random.Random instance.
+        :param legal_moves: Optional legal moves of the position; book moves not among them are skipped.
+        :return: A move string, or None if the position is out of book.
+        """
+        moves = self.probe(position)
+        if legal_moves is not None:
+            moves = [book_move for book_move in moves if book_move.move in legal_moves]
+        if not moves:
+            return None
+        return rng.choices([book_move.move for book_move in moves], [book_move.games for book_move in moves])[0]
+
+    def policy(self, fallback):
+        """
+        Wrap a move selection policy so it plays book moves while the game is in book.
+
+        :param fallback: A policy callable, see analysis.policies, used out of book.
+        :return: A policy callable.
+        """
+        def book_policy(position, moves, rng):
+            return self.choose(position, rng, moves) or fallback(position, moves, rng)
+        return book_policy
+
+
+def run_book_mode(book_path, paths, plies=DEFAULT_PLIES):
+    """
+    Build a book file from game files and print a summary.
+    """
+    positions = build_book(paths, book_path, plies, progress=print)
+    print(f"Wrote {positions} positions to {book_path}.")
+
+
+def run_probe_mode(book_path, position):
+    """
+    Print the book moves of a position with their weights and outcomes.
+    """
+    book = OpeningBook(book_path)
+    moves = book.probe(position)
+    if not moves:
+        print("Position is not in the book.")
+    for book_move in moves:
+        print(f"{book_move.move}  weight {book_move.weight:.2f}  games {book_move.games}  "
+              f"won {book_move.wins}  drawn {book_move.draws}  lost {book_move.losses}")
+    book.close()
@@ -0,0 +1,236 @@
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from utils import parseTestCase
+from game_items.position import PIECE_CODES, PIECE_REPRS, parse_square
+from game_modes.filegame import ILLEGAL_MOVE, CHECKMATE, TOO_MANY_MOVES, REPETITION, PERPETUAL_CHECK
+from game_modes.batchgame import replay_batch
+from analysis.archive import iter_game_files, replay_setup
+from analysis.export import action_index, action_move
+
+GAMES_FILE = "games.txt"
+
+# Column name and dtype of the per-move table, one row per move played
+PLY_COLUMNS = [
+    ("game", "int32"),        # game id, the line of the game in games.txt
+    ("ply", "int32"),         # number of plies played before the move
+    ("move", "int32"),        # the move, encoded by analysis.export.action_index()
+    ("captured", "uint8"),    # PIECE_CODES of the piece captured, 0 for none
+    ("check", "bool"),        # the move gives check
+]
+
+# Column name and dtype of the per-game table, one row per game
+GAME_COLUMNS = [
+    ("winner", "int8"),       # WINNERS index
+    ("reason", "uint8"),      # REASONS index
+    ("plies", "int32"),       # number of plies played
+    ("first_move", "int32"),  # action index of the first move, -1 if none was played
+    ("ply_start", "int64"),   # row of the game's first move in the per-move table
+]
+
+WINNERS = [None, "lower", "UPPER"]
+REASONS = [None, ILLEGAL_MOVE, CHECKMATE, TOO_MANY_MOVES, REPETITION, PERPETUAL_CHECK]
+
+
+def _column_path(directory, table, name):
+    return os.path.join(directory, f"{table}.{name}.npy")
+
+
+class ColumnStore:
+    """
+    Move and game statistics of an archive, kept as one memory-mapped .npy file per
+    column so that questions about the whole archive are answered with vectorized
+    operations instead of replaying every game.
+
+    Every game is replayed once, when it is ingested: with FileGame (through
+    game_modes.batchgame) for its result, and with Position for its moves.
+    """
+
+    def __init__(self, directory):
+        """
+        Open a store, creating an empty one if the directory does not hold one.
+
+        :param directory: The store directory.
+        """
+        if np is None:
+            raise ImportError("The column store requires numpy")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.game_paths = []
+        games_path = os.path.join(directory, GAMES_FILE)
+        if os.path.exists(games_path):
+            with open(games_path) as f:
+                self.game_paths = [line.rstrip("\n") for line in f]
+        self.plies = self._load("ply", PLY_COLUMNS)
+        self.games = self._load("game", GAME_COLUMNS)
+
+    def _load(self, table, columns):
+        arrays = {}
+        for name, dtype in columns:
+            path = _column_path(self.directory, table, name)
+            if os.path.exists(path):
+                arrays[name] = np.load(path, mmap_mode="r")
+            else:
+                arrays[name] = np.zeros(0, dtype=dtype)
+        return arrays
+
+    def _append(self, table, columns, arrays, rows):
+        """
+        Write every column of a table with new rows appended, and reopen it.
+        """
+        for name, dtype in columns:
+            values = np.concatenate([arrays[name], np.array(rows[name], dtype=dtype)])
+            path = _column_path(self.directory, table, name)
+            np.save(path + ".tmp.npy", values)
+            os.replace(path + ".tmp.npy", path)
+        return self._load(table, columns)
+
+    def ingest(self, paths, progress=None):
+        """
+        Add every game file not yet in the store. Files that cannot be read are skipped.
+
+        :param paths: Files, directories or glob patterns, see analysis.archive.iter_game_files().
+        :param progress: Optional callable receiving a status string when done.
+        :return: The number of games added.
+        """
+        known = set(self.game_paths)
+        game_setups = {}
+        for path in iter_game_files(paths):
+            if path in known:
+                continue
+            try:
+                game_setups[path] = parseTestCase(path)
+            except Exception:
+                continue
+        results = replay_batch(game_setups)
+
+        ply_rows = {name: [] for name, _ in PLY_COLUMNS}
+        game_rows = {name: [] for name, _ in GAME_COLUMNS}
+        new_paths = []
+        ply_start = len(self.plies["game"])
+        for path, game_setup in game_setups.items():
+            result = results[path]
+            if isinstance(result, Exception):
+                continue
+            game_id = len(self.game_paths) + len(new_paths)
+            new_paths.append(path)
+            game_rows["winner"].append(WINNERS.index(result.winner))
+            game_rows["reason"].append(REASONS.index(result.reason))
+            game_rows["plies"].append(result.plies)
+            game_rows["ply_start"].append(ply_start)
+
+            first_move = -1
+            previous = None
+            for ply, position, move in replay_setup(game_setup):
+                if previous is not None:
+                    ply_rows["check"].append(position.in_check())
+                if move is None or ply >= result.plies:
+                    break
+                split = move.split()
+                captured = position.squares[parse_square(split[2])] if split[0] == "move" else ""
+                ply_rows["game"].append(game_id)
+                ply_rows["ply"].append(ply)
+                ply_rows["move"].append(action_index(move))
+                ply_rows["captured"].append(PIECE_CODES[captured])
+                if ply == 0:
+                    first_move = action_index(move)
+                previous = move
+                ply_start += 1
+            game_rows["first_move"].append(first_move)
+
+        self.plies = self._append("ply", PLY_COLUMNS, self.plies, ply_rows)
+        self.games = self._append("game", GAME_COLUMNS, self.games, game_rows)
+        with open(os.path.join(self.directory, GAMES_FILE), "a") as f:
+            f.writelines(path + "\n" for path in new_paths)
+        self.game_paths.extend(new_paths)
+        if progress:
+            progress(f"ingested {len(new_paths)} games, {len(ply_rows['game'])} moves")
+        return len(new_paths)
+
+    def win_rates_by_first_move(self):
+        """
+        Tally the results of the games by their first move.
+
+        :return: A dict {move: (games, lower wins, UPPER wins, games without a winner)}.
+        """
+        first_move = np.asarray(self.games["first_move"])
+        winner = np.asarray(self.games["winner"])
+        played = first_move >= 0
+        moves, inverse = np.unique(first_move[played], return_inverse=True)
+        counts = np.zeros((len(moves), len(WINNERS)), dtype=np.int64)
+        np.add.at(counts, (inverse, winner[played]), 1)
+        return {action_move(int(move)): (int(row.sum()), int(row[1]), int(row[2]), int(row[0]))
+                for move, row in zip(moves, counts)}
+
+    def average_length(self):
+        """
+        Return the average number of plies of the games, 0.0 for an empty store.
+        """
+        plies = np.asarray(self.games["plies"])
+        return float(plies.mean()) if len(plies) else 0.0
+
+    def capture_frequency(self):
+        """
+        Count the captures of every piece type, promoted pieces counting as their
+        unpromoted type and both players together.
+
+        :return: A dict {piece letter: (captures, captures per move played)}.
+        """
+        codes = np.bincount(np.asarray(self.plies["captured"]), minlength=len(PIECE_CODES))
+        moves = max(len(self.plies["captured"]), 1)
+        counts = {}
+        for piece_repr in PIECE_REPRS:
+            letter = piece_repr[-1].lower()
+            counts[letter] = counts.get(letter, 0) + int(codes[PIECE_CODES[piece_repr]])
+        return {letter: (count, count / moves) for letter, count in counts.items()}
+
+    def reason_rates(self):
+        """
+        Return the share of games ending for every reason, 'Illegal move' included.
+
+        :return: A dict {reason: share of the games}, None standing for games that did not end.
+        """
+        reasons = np.bincount(np.asarray(self.games["reason"]), minlength=len(REASONS))
+        games = max(len(self.games["reason"]), 1)
+        return {reason: int(count) / games for reason, count in zip(REASONS, reasons)}
+
+    def check_rate(self):
+        """
+        Return the share of moves played that give check.
+        """
+        check = np.asarray(self.plies["check"])
+        return float(check.mean()) if len(check) else 0.0
+
+
+def run_store_mode(directory, paths):
+    """
+    Add game files to a column store and print how many were added.
+    """
+    store = ColumnStore(directory)
+    added = store.ingest(paths, progress=print)
+    print(f"Stored {added} new games, {len(store.game_paths)} games and {len(store.plies['game'])} moves in total.")
+
+
+def run_stats_mode(directory):
+    """
+    Print aggregate statistics of a column store.
+    """
+    store = ColumnStore(directory)
+    print(f"Games: {len(store.game_paths)}  moves: {len(store.plies['game'])}")
+    print(f"Average length: {store.average_length():.1f} plies")
+    print(f"Moves giving check: {store.check_rate():.1%}")
+    print("Game end:")
+    for reason, rate in store.reason_rates().items():
+        print(f"  {reason or 'Not finished'}: {rate:.1%}")
+    print("Captures:")
+    for letter, (count, rate) in store.capture_frequency().items():
+        print(f"  {letter}: {count} ({rate:.2%} of moves)")
+    print("First moves:")
+    stats = store.win_rates_by_first_move()
+    for move in sorted(stats, key=lambda m: -stats[m][0]):
+        games, lower, upper, undecided = stats[move]
+        print(f"  {move}: {games} games, lower {lower / games:.0%}, UPPER {upper / games:.0%}, no winner {undecided / games:.0%}")
@@ -0,0 +1,186 @@
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from game_items.gamevars import BOARD_SIZE
+from game_items.position import NUM_SQUARES, PIECE_REPRS, HAND_LETTERS, parse_square, square_name
+from analysis.archive import iter_game_files, replay_file
+
+# One board plane per piece type, owner and promotion, in PIECE_REPRS order
+PLANE_OF = {piece_repr: plane for plane, piece_repr in enumerate(PIECE_REPRS)}
+NUM_PLANES = len(PIECE_REPRS)
+
+# Action space: every from/to pair with and without promotion, then every drop
+MOVE_ACTIONS = NUM_SQUARES * NUM_SQUARES * 2
+NUM_ACTIONS = MOVE_ACTIONS + len(HAND_LETTERS) * NUM_SQUARES
+
+# Positions per shard, scaled so that the legal move masks of a shard take about 64 MB
+# at every board size: about 48k positions at 5x5 and 5k at 9x9
+DEFAULT_SHARD_SIZE = max(1024, (64 << 20) // NUM_ACTIONS)
+# Positions the buffers hold at first; they double as needed, up to the shard size
+INITIAL_BUFFER_SIZE = 1024
+
+
+def action_index(move):
+    """
+    Map a move string to its index in the action space.
+
+    Board moves map to (from * NUM_SQUARES + to) * 2 + promote and drops to
+    MOVE_ACTIONS + letter * NUM_SQUARES + square, letter indexing HAND_LETTERS.
+
+    :param move: A move string, e.g. 'move a2 a3 promote' or 'drop p c3'.
+    :return: An integer in range(NUM_ACTIONS).
+    """
+    split = move.split()
+    if split[0] == "drop":
+        return MOVE_ACTIONS + HAND_LETTERS.index(split[1].lower()) * NUM_SQUARES + parse_square(split[2])
+    promote = 1 if len(split) == 4 and split[3] == "promote" else 0
+    return (parse_square(split[1]) * NUM_SQUARES + parse_square(split[2])) * 2 + promote
+
+
+def action_move(index):
+    """
+    Map an index of the action space back to its move string.
+
+    :param index: An integer in range(NUM_ACTIONS).
+    :return: The move string.
+    """
+    if index >= MOVE_ACTIONS:
+        letter, square = divmod(index - MOVE_ACTIONS, NUM_SQUARES)
+        return f"drop {HAND_LETTERS[letter]} {square_name(square)}"
+    squares, promote = divmod(index, 2)
+    start, end = divmod(squares, NUM_SQUARES)
+    move = f"move {square_name(start)} {square_name(end)}"
+    return move + " promote" if promote else move
+
+
+class ShardWriter:
+    """
+    Buffers encoded positions in arrays that grow up to the shard size and writes
+    them out as numbered .npz shards, so memory use depends on the shard size only.
+
+    Every shard holds, for n positions:
+        planes       uint8 (n, NUM_PLANES, BOARD_SIZE, BOARD_SIZE), one plane per PIECE_REPRS entry, indexed [x][y]
+        hands        uint8 (n, 2, len(HAND_LETTERS)), piece counts in hand, lower first
+        side         uint8 (n,), 0 for lower to move, 1 for UPPER
+        legal        bool  (n, NUM_ACTIONS), the legal move mask
+        move         int32 (n,), the action index of the move played
+        game, ply    int32 (n,), the game number in export order and the ply of the position
+    """
+
+    def __init__(self, out_dir, shard_size=DEFAULT_SHARD_SIZE, compress=True):
+        """
+        :param out_dir: The directory the shards are written to.
+        :param shard_size: The number of positions per shard.
+        :param compress: Write compressed .npz files.
+        """
+        if np is None:
+            raise ImportError("Exporting training data requires numpy")
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.compress = compress
+        self.shards = 0
+        self.total = 0
+        rows = min(shard_size, INITIAL_BUFFER_SIZE)
+        self.planes = np.zeros((rows, NUM_PLANES, BOARD_SIZE, BOARD_SIZE), dtype=np.uint8)
+        self.hands = np.zeros((rows, 2, len(HAND_LETTERS)), dtype=np.uint8)
+        self.side = np.zeros(rows, dtype=np.uint8)
+        self.legal = np.zeros((rows, NUM_ACTIONS), dtype=np.bool_)
+        self.move = np.zeros(rows, dtype=np.int32)
+        self.game = np.zeros(rows, dtype=np.int32)
+        self.ply = np.zeros(rows, dtype=np.int32)
+        self.count = 0
+
+    def _grow(self):
+        """
+        Double the buffers, up to the shard size, keeping the positions they hold.
+        """
+        rows = min(self.shard_size, 2 * len(self.move))
+        for name in ("planes", "hands", "side", "legal", "move", "game", "ply"):
+            buffer = getattr(self, name)
+            grown = np.zeros((rows,) + buffer.shape[1:], dtype=buffer.dtype)
+            grown[:self.count] = buffer[:self.count]
+            setattr(self, name, grown)
+
+    def add(self, position, move, game, ply):
+        """
+        Encode a position and the move played from it.
+
+        :param position: A Position.
+        :param move: The legal move played.
+        :param game: The game number.
+        :param ply: The ply of the position in the game.
+        """
+        if self.count == len(self.move):
+            self._grow()
+        i = self.count
+        self.planes[i] = 0
+        for square, piece_repr in enumerate(position.squares):
+            if piece_repr:
+                self.planes[i, PLANE_OF[piece_repr], square // BOARD_SIZE, square % BOARD_SIZE] = 1
+        lower_hand = position.lower_hand
+        upper_hand = [p.lower() for p in position.upper_hand]
+        self.hands[i, 0] = [lower_hand.count(letter) for letter in HAND_LETTERS]
+        self.hands[i, 1] = [upper_hand.count(letter) for letter in HAND_LETTERS]
+        self.side[i] = 1 if position.side == "UPPER" else 0
+        self.legal[i] = False
+        self.legal[i, [action_index(m) for m in position.legal_moves()]] = True
+        self.move[i] = action_index(move)
+        self.game[i] = game
+        self.ply[i] = ply
+        self.count += 1
+        if self.count == self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered positions as the next shard, if there are any.
+        """
+        if self.count == 0:
+            return
+        n = self.count
+        path = os.path.join(self.out_dir, f"shard_{self.shards:05d}.npz")
+        save = np.savez_compressed if self.compress else np.savez
+        save(path, planes=self.planes[:n], hands=self.hands[:n], side=self.side[:n],
+             legal=self.legal[:n], move=self.move[:n], game=self.game[:n], ply=self.ply[:n])
+        self.shards += 1
+        self.total += n
+        self.count = 0
+
+
+def export_games(paths, out_dir, shard_size=DEFAULT_SHARD_SIZE, progress=None):
+    """
+    Replay game files one at a time and write every position with the move played
+    from it to .npz shards. A games.txt file lists the game files in export order.
+
+    :param paths: Files, directories or glob patterns, see analysis.archive.iter_game_files().
+    :param out_dir: The directory the shards are written to.
+    :param shard_size: The number of positions per shard.
+    :param progress: Optional callable receiving a status string after every shard.
+    :return: A tuple (games, positions) exported.
+    """
+    writer = ShardWriter(out_dir, shard_size)
+    games = 0
+    with open(os.path.join(out_dir, "games.txt"), "w") as index:
+        for path in iter_game_files(paths):
+            for ply, position, move in replay_file(path):
+                if move is not None:
+                    writer.add(position, move, games, ply)
+                    if progress and writer.count == 0:
+                        progress(f"wrote shard {writer.shards - 1}, {writer.total} positions")
+            index.write(path + "\n")
+            games += 1
+    writer.flush()
+    return games, writer.total
+
+
+def run_export_mode(paths, out_dir, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Export game files as training shards and print a summary.
+    """
+    games, positions = export_games(paths, out_dir, shard_size, progress=print)
+    print(f"Exported {positions} positions from {games} games to {out_dir}.")
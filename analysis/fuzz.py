@@ -0,0 +1,341 @@
+import random
+import time
+from multiprocessing import Pool
+
+from game_items.gamevars import BOARD_SIZE
+from game_items.position import Position, NUM_SQUARES, PROMOTABLE, in_last_row, square_name
+from game_modes.filegame import FileGame
+from game_modes.tournament import initial_position
+from analysis.archive import normalize_move
+
+# Plies played from every starting position
+FUZZ_PLIES = 100
+# Random board moves tried in every position besides the move played, and a random
+# drop when the player to move has a piece in hand
+PROBES_PER_POSITION = 2
+
+
+def random_position(rng, hand_chance=0.25, missing_chance=0.2, promote_chance=0.3):
+    """
+    Generate a random legal position with the pieces of the starting position.
+
+    Every piece besides the Drives is either left out, put in a random player's
+    hand, or put on a random empty square for a random owner, promoted or not. An
+    unpromoted Preview is never put on its last row nor in a column holding another
+    unpromoted Preview of its owner, and the player not to move is never in check.
+
+    :param rng: A random.Random instance.
+    :param hand_chance: Probability of a piece being in hand.
+    :param missing_chance: Probability of a piece being left out.
+    :param promote_chance: Probability of a piece on the board being promoted.
+    :return: A Position.
+    """
+    letters = [p.lower() for p in initial_position().squares if p and p not in "dD"]
+    while True:
+        position = Position(side=rng.choice(["lower", "UPPER"]))
+        lower_drive, upper_drive = rng.sample(range(NUM_SQUARES), 2)
+        position.put(lower_drive, "d")
+        position.put(upper_drive, "D")
+        for letter in letters:
+            roll = rng.random()
+            upper = rng.random() < 0.5
+            piece_repr = letter.upper() if upper else letter
+            if roll < missing_chance:
+                continue
+            if roll < missing_chance + hand_chance:
+                position.hand("UPPER" if upper else "lower").append(piece_repr)
+                continue
+            square = rng.choice([i for i in range(NUM_SQUARES) if not position.squares[i]])
+            if letter in PROMOTABLE and rng.random() < promote_chance:
+                piece_repr = "+" + piece_repr
+            elif letter == "p" and (in_last_row(square, upper) or _preview_in_column(position, square, piece_repr)):
+                position.hand("UPPER" if upper else "lower").append(piece_repr)
+                continue
+            position.put(square, piece_repr)
+        if not position.in_check(position.other_side()):
+            return position
+
+
+def _preview_in_column(position, square, piece_repr):
+    """
+    Check if the column of a square holds the given unpromoted Preview.
+    """
+    column = square - square % BOARD_SIZE
+    return piece_repr in position.squares[column:column + BOARD_SIZE]
+
+
+def random_game(rng, start=None, plies=FUZZ_PLIES):
+    """
+    Play random legal moves from a position.
+
+    :param rng: A random.Random instance.
+    :param start: The starting Position, a random one by default.
+    :param plies: The maximum number of plies.
+    :return: A tuple (start position, list of moves).
+    """
+    start = start or random_position(rng)
+    position = start
+    moves = []
+    for _ in range(plies):
+        legal_moves = position.legal_moves()
+        if not legal_moves:
+            break
+        move = rng.choice(legal_moves)
+        moves.append(move)
+        position = position.play(move)
+    return start, moves
+
+
+def random_board_move(rng, position):
+    """
+    Make up a board move for the player to move, legal or not: one of their pieces
+    moves to a random square, sometimes asking for promotion.
+
+    :param rng: A random.Random instance.
+    :param position: The Position to move in.
+    :return: A move string.
+    """
+    upper = position.side == "UPPER"
+    starts = [i for i, p in enumerate(position.squares) if p and p[-1].isupper() == upper]
+    start, end = rng.choice(starts), rng.randrange(NUM_SQUARES)
+    move = f"move {square_name(start)} {square_name(end)}"
+    return move + " promote" if rng.random() < 0.3 else move
+
+
+def random_drop_move(rng, position):
+    """
+    Make up a drop for the player to move, legal or not: a piece of their hand goes
+    to a random square.
+
+    :param rng: A random.Random instance.
+    :param position: The Position to move in, with a piece in hand.
+    :return: A move string.
+    """
+    letter = rng.choice(position.hand(position.side)).lower()
+    return f"drop {letter} {square_name(rng.randrange(NUM_SQUARES))}"
+
+
+def _reference_game(position):
+    """
+    Load a position into a FileGame, the reference engine.
+    """
+    game = FileGame()
+    position.apply_to(game)
+    return game
+
+
+def _fork(game):
+    """
+    Copy a reference game, with its cached piece moves, to try a move on the copy.
+    Pieces in hand are not changed once captured, so the hands are copied shallowly.
+    """
+    fork = FileGame()
+    fork.board.board = [column[:] for column in game.board.board]
+    fork.board.move_cache = dict(game.board.move_cache)
+    fork.lower.captured = list(game.lower.captured)
+    fork.upper.captured = list(game.upper.captured)
+    fork.cur_player = fork.upper if game.cur_player is game.upper else fork.lower
+    return fork
+
+
+def compare_position(position, legal_moves=None, game=None):
+    """
+    Compare check detection and the moves out of check of FileGame and Position, and
+    the early exit of Position.has_legal_move() with its full move list.
+
+    FileGame lists a move that may promote once, without the promote suffix, so the
+    moves of Position are compared without it.
+
+    :param position: A legal Position.
+    :param legal_moves: The legal moves of the position, if already generated.
+    :param game: The position in the reference engine, loaded from it by default.
+    :return: A description of the first difference found, or None.
+    """
+    if legal_moves is None:
+        legal_moves = position.legal_moves()
+    if position.has_legal_move() != bool(legal_moves):
+        return f"Position.has_legal_move: {position.has_legal_move()}, legal_moves: {legal_moves}"
+
+    game = game or _reference_game(position)
+    reference_check, optimized_check = game.is_in_check(), position.in_check()
+    if reference_check != optimized_check:
+        return f"in check: reference {reference_check}, optimized {optimized_check}"
+    if not reference_check:
+        return None
+
+    reference_moves = game.create_available_moves()
+    if game.has_legal_move() != bool(reference_moves):
+        return f"has_legal_move: {game.has_legal_move()}, create_available_moves: {reference_moves}"
+    reference = set(reference_moves)
+    optimized = set(m[:-len(" promote")] if m.endswith(" promote") else m for m in legal_moves)
+    if reference != optimized:
+        return (f"moves out of check: only reference {sorted(reference - optimized)}, "
+                f"only optimized {sorted(optimized - reference)}")
+    return None
+
+
+def compare_move(position, move, legal_moves=None, game=None):
+    """
+    Play a move with FileGame and with Position and compare the outcomes.
+
+    :param position: A legal Position.
+    :param move: A move string, legal or not.
+    :param legal_moves: The legal moves of the position, if already generated.
+    :param game: The position in the reference engine, loaded from it by default. The
+        move is played on it, with the other player to move afterwards if it is legal.
+    :return: A description of the first difference found, or None.
+    """
+    optimized_move = normalize_move(position, move, legal_moves)
+    split = move.split()
+
+    game = game or _reference_game(position)
+    if split[0] == "move":
+        game.make_move(split)
+    else:
+        game.drop_move(split)
+    if game.is_game_over != (optimized_move is None):
+        return f"{move}: reference {'rejects' if game.is_game_over else 'accepts'} it, optimized does not"
+    if optimized_move is None:
+        return None
+
+    game.switch_players()
+    reference = Position.from_game(game)
+    optimized = position.play(optimized_move)
+    if (reference.squares != optimized.squares or reference.upper_hand != optimized.upper_hand
+            or reference.lower_hand != optimized.lower_hand or reference.side != optimized.side):
+        return f"{move}: reference reaches {reference.to_sfen()}, optimized {optimized.to_sfen()}"
+    return None
+
+
+def compare(position, move=None):
+    """
+    Compare the engines on a position and, if given, a move played from it.
+
+    :return: A description of the first difference found, or None.
+    """
+    divergence = compare_position(position)
+    if divergence is None and move is not None:
+        divergence = compare_move(position, move)
+    return divergence
+
+
+def minimize(position, move=None):
+    """
+    Shrink a diverging position by removing pieces, one at a time, as long as the
+    position stays legal and the engines still disagree.
+
+    :param position: A Position on which compare(position, move) finds a difference.
+    :param move: The move involved in the difference, if any.
+    :return: The smallest diverging Position found.
+    """
+    shrunk = True
+    while shrunk:
+        shrunk = False
+        candidates = [(index, None) for index, p in enumerate(position.squares) if p and p not in "dD"]
+        candidates += [(None, (side, i)) for side in ("UPPER", "lower") for i in range(len(position.hand(side)))]
+        for index, hand_slot in candidates:
+            smaller = position.copy()
+            if index is not None:
+                smaller.put(index, "")
+            else:
+                del smaller.hand(hand_slot[0])[hand_slot[1]]
+            if not smaller.in_check(smaller.other_side()) and compare(smaller, move) is not None:
+                position = smaller
+                shrunk = True
+                break
+    return position
+
+
+def fuzz_game(seed, plies=FUZZ_PLIES):
+    """
+    Play one random game and compare the engines on every position reached, on the
+    moves played and on random board moves and drops.
+
+    The reference engine plays the game alongside Position, so that its piece move
+    cache stays warm as in a real game, and every position it reaches is compared
+    with Position's. Random moves are tried on copies.
+
+    Even seeds start from a random position, odd seeds from the starting position.
+
+    :param seed: The random seed of the game.
+    :param plies: The maximum number of plies.
+    :return: A tuple (positions checked, moves checked, divergence), where divergence
+        is None or a tuple (seed, minimized position, move, description).
+    """
+    rng = random.Random(seed)
+    position = random_position(rng) if seed % 2 == 0 else initial_position()
+    game = _reference_game(position)
+    checked_positions = checked_moves = 0
+    for _ in range(plies + 1):
+        legal_moves = position.legal_moves()
+        played = rng.choice(legal_moves) if legal_moves else None
+        probes = [random_board_move(rng, position) for _ in range(PROBES_PER_POSITION)]
+        if position.hand(position.side):
+            probes.append(random_drop_move(rng, position))
+        move = None
+        divergence = compare_position(position, legal_moves, game)
+        if divergence is None:
+            # The move played goes last, as it moves the reference game on
+            for move in probes + ([played] if played else []):
+                divergence = compare_move(position, move, legal_moves, game if move is played else _fork(game))
+                if divergence is not None:
+                    break
+                checked_moves += 1
+        if divergence is not None:
+            if compare(position, move) is None:
+                # FileGame only diverges when it reaches the position through the moves played
+                description = divergence + " (only when reached by the moves of the game)"
+                return checked_positions, checked_moves, (seed, position, move, description)
+            smaller = minimize(position, move)
+            return checked_positions, checked_moves, (seed, smaller, move, compare(smaller, move))
+        checked_positions += 1
+        if played is None:
+            break
+        position = position.play(played)
+    return checked_positions, checked_moves, None
+
+
+def run_fuzz(games, workers=None, seed=0, plies=FUZZ_PLIES):
+    """
+    Fuzz the engines over many random games in a pool of worker processes, stopping
+    at the first divergence in seed order.
+
+    :param games: The number of games.
+    :param workers: Number of worker processes, defaults to the number of CPUs.
+    :param seed: The seed of the first game; game i uses seed + i.
+    :param plies: The maximum number of plies per game.
+    :return: A tuple (positions checked, moves checked, divergence or None).
+    """
+    positions = moves = 0
+    with Pool(workers) as pool:
+        tasks = range(seed, seed + games)
+        for checked_positions, checked_moves, divergence in pool.imap(_fuzz_task, [(s, plies) for s in tasks], 8):
+            positions += checked_positions
+            moves += checked_moves
+            if divergence is not None:
+                pool.terminate()
+                return positions, moves, divergence
+    return positions, moves, None
+
+
+def _fuzz_task(task):
+    return fuzz_game(*task)
+
+
+def run_fuzz_mode(games, workers=None, seed=0):
+    """
+    Run the fuzzer and print the throughput and the first divergence, if any.
+    """
+    start = time.perf_counter()
+    positions, moves, divergence = run_fuzz(games, workers, seed)
+    seconds = time.perf_counter() - start
+    print(f"Checked {positions} positions and {moves} moves in {seconds:.1f}s "
+          f"({positions / seconds:.0f} positions/sec).")
+    if divergence is None:
+        print("No divergence found.")
+        return
+    game_seed, position, move, description = divergence
+    print(f"Divergence in game {game_seed}: {description}")
+    print(f"Position: {position.to_sfen()}")
+    if move is not None:
+        print(f"Move: {move}")
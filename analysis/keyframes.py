@@ -0,0 +1,180 @@
+import hashlib
+import os
+
+from utils import parseTestCase
+from game_items.position import Position
+from analysis.archive import replay_setup
+
+MAGIC = "BXKF"
+VERSION = 1
+SUFFIX = ".kf"
+DEFAULT_INTERVAL = 16
+
+
+def _digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def encode_keyframe(position):
+    """
+    Write a position as one line: the board and side of its position string, then
+    both hands in capture order, '-' when empty.
+
+    :param position: A Position.
+    :return: The encoded string.
+    """
+    board, side, _ = position.to_sfen().split()
+    return " ".join([board, side, "".join(position.upper_hand) or "-", "".join(position.lower_hand) or "-"])
+
+
+def decode_keyframe(text):
+    """
+    Read a position written by encode_keyframe().
+
+    :param text: The encoded string.
+    :return: A Position.
+    """
+    board, side, upper_hand, lower_hand = text.split()
+    position = Position.from_sfen(f"{board} {side} -")
+    position.upper_hand = [] if upper_hand == "-" else list(upper_hand)
+    position.lower_hand = [] if lower_hand == "-" else list(lower_hand)
+    return position
+
+
+class GameKeyframes:
+    """
+    Random access to the positions of a game: a checkpoint every interval plies
+    plus the legal moves of the game, so reaching any ply takes one checkpoint and
+    fewer than interval moves, none of which is validated again.
+
+    The keyframes of game.in are kept in game.in.kf, along with a digest of the game
+    file so a stale keyframe file is rebuilt.
+    """
+
+    def __init__(self, keyframes, moves, interval, digest=None):
+        """
+        :param keyframes: The Positions at plies 0, interval, 2 * interval and so on.
+        :param moves: The legal moves of the game, up to its first illegal move.
+        :param interval: The number of plies between keyframes.
+        :param digest: The SHA-1 of the game file the keyframes were built from.
+        """
+        self.keyframes = keyframes
+        self.moves = moves
+        self.interval = interval
+        self.digest = digest
+
+    @classmethod
+    def build(cls, path, interval=DEFAULT_INTERVAL):
+        """
+        Replay a game file once, keeping a keyframe every interval plies.
+
+        :param path: Path to the game file.
+        :param interval: The number of plies between keyframes.
+        :return: A new GameKeyframes.
+        """
+        keyframes, moves = [], []
+        for ply, position, move in replay_setup(parseTestCase(path)):
+            if ply % interval == 0:
+                keyframes.append(position)
+            if move is not None:
+                moves.append(move)
+        return cls(keyframes, moves, interval, _digest(path))
+
+    @classmethod
+    def load(cls, path, interval=DEFAULT_INTERVAL):
+        """
+        Read the keyframes of a game file, building and saving them first if they
+        are missing or older than the game file.
+
+        :param path: Path to the game file.
+        :param interval: The number of plies between keyframes when building them.
+        :return: A GameKeyframes.
+        """
+        digest = _digest(path)
+        if os.path.exists(path + SUFFIX):
+            keyframes = cls.read(path + SUFFIX)
+            if keyframes is not None and keyframes.digest == digest:
+                return keyframes
+        keyframes = cls.build(path, interval)
+        try:
+            keyframes.write(path + SUFFIX)
+        except OSError:
+            pass  # Read-only archives still get the keyframes, only not persisted
+        return keyframes
+
+    @classmethod
+    def read(cls, kf_path):
+        """
+        Read a keyframe file.
+
+        :param kf_path: Path to the keyframe file.
+        :return: A GameKeyframes, or None if the file is not a keyframe file of this version.
+        """
+        with open(kf_path) as f:
+            header = f.readline().split()
+            if len(header) != 4 or header[0] != MAGIC or header[1] != str(VERSION):
+                return None
+            keyframes, moves = [], []
+            for line in f:
+                kind, _, body = line.rstrip("\n").partition(" ")
+                if kind == "@":
+                    keyframes.append(decode_keyframe(body))
+                elif kind == "m":
+                    moves.append(body)
+        return cls(keyframes, moves, int(header[2]), header[3])
+
+    def write(self, kf_path):
+        """
+        Write the keyframes: a header line, then every keyframe ('@' lines) followed
+        by the moves played from it ('m' lines).
+
+        :param kf_path: Path to the keyframe file.
+        """
+        with open(kf_path, "w") as f:
+            f.write(f"{MAGIC} {VERSION} {self.interval} {self.digest}\n")
+            for i, keyframe in enumerate(self.keyframes):
+                f.write("@ " + encode_keyframe(keyframe) + "\n")
+                for move in self.moves[i * self.interval:(i + 1) * self.interval]:
+                    f.write("m " + move + "\n")
+
+    def __len__(self):
+        """
+        Return the number of positions in the game, the starting one included.
+        """
+        return len(self.moves) + 1
+
+    def position_at(self, ply):
+        """
+        Return the position after a number of plies.
+
+        :param ply: A ply in range(len(self)).
+        :return: A Position.
+        """
+        if not 0 <= ply < len(self):
+            raise IndexError(f"Ply {ply} out of range, the game has {len(self) - 1} plies")
+        keyframe = ply // self.interval
+        position = self.keyframes[keyframe]
+        for move in self.moves[keyframe * self.interval:ply]:
+            position = position.play(move)
+        return position
+
+
+def run_seek_mode(path, ply):
+    """
+    Print the board and captures of a game file after a number of plies.
+
+    :param path: Path to the game file.
+    :param ply: The ply to show.
+    """
+    try:
+        keyframes = GameKeyframes.load(path)
+        position = keyframes.position_at(ply)
+    except Exception as e:
+        print(f"Error with opening filepath: {e}")
+        return
+    print(position.to_board())
+    print(f"Captures UPPER: {' '.join(position.upper_hand)}")
+    print(f"Captures lower: {' '.join(position.lower_hand)}")
+    print()
+    print(f"{position.side}>")
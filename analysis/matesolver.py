@@ -0,0 +1,260 @@
+import time
+from collections import namedtuple
+
+from game_items.position import Position
+
+INF = 10 ** 9
+
+MATE, NO_MATE, UNKNOWN = "mate", "no mate", "unknown"
+
+# length: the number of attacker moves of the mate, 0 if none was found.
+# moves: the principal variation, the attacker's fastest mate against the longest defence.
+MateResult = namedtuple("MateResult", ["status", "length", "moves", "nodes", "seconds"])
+
+
+class MateSolver:
+    """
+    Depth-first proof-number (df-pn) search for forced checkmates.
+
+    The player to move at the root is the attacker. OR nodes are the attacker's
+    turns and AND nodes the defender's. A node is proven when the attacker can force
+    checkmate within the remaining plies, and disproven when the defender can avoid
+    it. Drops are generated like any other move.
+
+    Proof and disproof numbers live in a transposition table keyed by position and
+    remaining plies. The table is capped at max_entries: when it fills up, entries
+    that are not yet proven or disproven are discarded.
+    """
+
+    def __init__(self, max_entries=1000000, max_nodes=None, checks_only=False):
+        """
+        :param max_entries: Maximum number of transposition table entries.
+        :param max_nodes: Give up after expanding this many nodes, None for no limit.
+        :param checks_only: Only consider checking moves for the attacker, as in
+            tsume problems. Faster, but cannot find mates that start with a quiet move.
+        """
+        self.max_entries = max_entries
+        self.max_nodes = max_nodes
+        self.checks_only = checks_only
+        self.table = {}
+        self.nodes = 0
+
+    def solve(self, position, moves):
+        """
+        Search for a checkmate by the player to move within a number of their moves.
+
+        Shorter mates are tried first, so a proven result is the shortest one.
+
+        :param position: The Position to solve.
+        :param moves: The maximum number of attacker moves.
+        :return: A MateResult whose moves are the principal variation, as move strings.
+        """
+        start = time.time()
+        self.table = {}
+        self.nodes = 0
+        status = NO_MATE
+        for n in range(1, moves + 1):
+            plies = 2 * n - 1
+            try:
+                self._mid(position, plies, True, INF - 1, INF - 1)
+            except _NodeLimit:
+                status = UNKNOWN
+                break
+            proof, disproof = self._lookup(position, plies)
+            if proof == 0:
+                return MateResult(MATE, n, self._principal_variation(position, plies), self.nodes, time.time() - start)
+            if disproof != 0:
+                status = UNKNOWN
+                break
+        return MateResult(status, 0, [], self.nodes, time.time() - start)
+
+    def _lookup(self, position, plies):
+        return self.table.get((position.key(), plies), (1, 1))
+
+    def _store(self, position, plies, proof, disproof):
+        if len(self.table) >= self.max_entries:
+            self._collect_garbage()
+        self.table[(position.key(), plies)] = (proof, disproof)
+
+    def _collect_garbage(self):
+        """
+        Free the transposition table by dropping every unsolved entry.
+        """
+        self.table = {key: value for key, value in self.table.items() if 0 in value}
+        if len(self.table) >= self.max_entries:
+            self.table.clear()
+
+    def _children(self, position, plies, or_node):
+        """
+        Generate the child positions of a node, checking moves first for the attacker.
+
+        :return: A list of (move, child) pairs.
+        """
+        children = []
+        for move in position.legal_moves():
+            child = position.play(move)
+            children.append((move, child))
+        if or_node:
+            checks = [(move, child) for move, child in children if child.in_check()]
+            # Only a check can mate on the attacker's last move
+            if self.checks_only or plies == 1:
+                return checks
+            quiet = [(move, child) for move, child in children if not child.in_check()]
+            return checks + quiet
+        return children
+
+    def _terminal(self, position, plies, or_node, children):
+        """
+        Return the (proof, disproof) numbers of a node decided without search, or None.
+        """
+        if or_node:
+            if not children:
+                return INF, 0
+            return None
+        if not children:
+            return (0, INF) if position.in_check() else (INF, 0)
+        if plies == 0:
+            return INF, 0
+        return None
+
+    def _mid(self, position, plies, or_node, proof_threshold, disproof_threshold):
+        """
+        Expand a node until its proof or disproof number reaches its threshold.
+        """
+        proof, disproof = self._lookup(position, plies)
+        if proof >= proof_threshold or disproof >= disproof_threshold:
+            return
+
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise _NodeLimit()
+
+        children = self._children(position, plies, or_node)
+        terminal = self._terminal(position, plies, or_node, children)
+        if terminal is not None:
+            self._store(position, plies, *terminal)
+            return
+
+        child_plies = plies - 1
+        while True:
+            proof, disproof, best, second = self._combine(children, child_plies, or_node)
+            if proof >= proof_threshold or disproof >= disproof_threshold:
+                break
+            child = children[best][1]
+            child_proof, child_disproof = self._lookup(child, child_plies)
+            if or_node:
+                child_proof_threshold = min(proof_threshold, second + 1)
+                child_disproof_threshold = disproof_threshold - disproof + child_disproof
+            else:
+                child_proof_threshold = proof_threshold - proof + child_proof
+                child_disproof_threshold = min(disproof_threshold, second + 1)
+            self._mid(child, child_plies, not or_node,
+                      min(child_proof_threshold, INF - 1), min(child_disproof_threshold, INF - 1))
+        self._store(position, plies, proof, disproof)
+
+    def _combine(self, children, child_plies, or_node):
+        """
+        Compute a node's proof and disproof numbers from its children.
+
+        :return: (proof, disproof, index of the most promising child, the second best
+            proof number at an OR node or disproof number at an AND node).
+        """
+        best, best_value, second = 0, INF, INF
+        total = 0
+        for i, (_, child) in enumerate(children):
+            child_proof, child_disproof = self._lookup(child, child_plies)
+            value, other = (child_proof, child_disproof) if or_node else (child_disproof, child_proof)
+            total = min(total + other, INF)
+            if value < best_value:
+                best, second, best_value = i, best_value, value
+            elif value < second:
+                second = value
+        if or_node:
+            return best_value, total, best, second
+        return total, best_value, best, second
+
+    def _prove(self, position, plies, or_node):
+        """
+        Search a node until it is proven or disproven.
+
+        :return: True if the attacker mates within plies, False if not or if the node
+            budget ran out.
+        """
+        proof, disproof = self._lookup(position, plies)
+        if proof != 0 and disproof != 0:
+            try:
+                self._mid(position, plies, or_node, INF - 1, INF - 1)
+            except _NodeLimit:
+                return False
+        return self._lookup(position, plies)[0] == 0
+
+    def _mate_distance(self, position, plies, or_node):
+        """
+        Find the fewest plies, at most plies, within which the attacker mates from a node.
+
+        :return: The number of plies, or None if the node is not proven within plies.
+        """
+        for distance in range(plies % 2, plies + 1, 2):
+            if self._prove(position, distance, or_node):
+                return distance
+        return None
+
+    def _principal_variation(self, position, plies):
+        """
+        Follow a proven root down to checkmate: at OR nodes the child mating in the
+        fewest plies, at AND nodes the child holding out the longest. Shorter
+        distances are searched as needed, so the variation is as long as the mate.
+        """
+        moves = []
+        or_node = True
+        while plies > 0:
+            children = self._children(position, plies, or_node)
+            best = None
+            if or_node:
+                for distance in range(0, plies, 2):
+                    best = next(((distance, move, child) for move, child in children
+                                 if self._prove(child, distance, False)), None)
+                    if best is not None:
+                        break
+            else:
+                for move, child in children:
+                    distance = self._mate_distance(child, plies - 1, True)
+                    if distance is not None and (best is None or distance > best[0]):
+                        best = (distance, move, child)
+            if best is None:
+                break
+            plies, move, position = best
+            moves.append(move)
+            or_node = not or_node
+        return moves
+
+
+class _NodeLimit(Exception):
+    """Raised when the node budget of a search is exhausted."""
+
+
+def run_mate_mode(path, moves, checks_only=False):
+    """
+    Solve the position of a test case file and print the result.
+
+    :param path: Path to the test case file.
+    :param moves: The maximum number of attacker moves.
+    :param checks_only: Only consider checking moves for the attacker.
+    """
+    try:
+        position = Position.from_file(path)
+    except Exception as e:
+        print(f"Error with opening filepath: {e}")
+        return
+
+    result = MateSolver(checks_only=checks_only).solve(position, moves)
+    if result.status == MATE:
+        print(f"{position.side} player mates in {result.length}.")
+        for move in result.moves:
+            print(move)
+    elif result.status == NO_MATE:
+        print(f"No checkmate in {moves} for {position.side} player.")
+    else:
+        print("Unknown.  Search limit reached.")
+    rate = result.nodes / result.seconds if result.seconds > 0 else 0
+    print(f"Nodes: {result.nodes} ({rate:.0f} nodes/sec)")
@@ -0,0 +1,201 @@
+import math
+import os
+import random
+import time
+from collections import namedtuple
+from multiprocessing import Pool
+
+from utils import parseTestCase
+from game_items.gamevars import MOVE_LIMIT
+from game_items.position import Position
+from analysis.policies import get_policy
+
+# Exploration constant of the UCT formula
+EXPLORATION = math.sqrt(2)
+
+# move: the suggested move, None if there is no legal move. visits: playouts through
+# that move. win_rate: share of those playouts won by the player to move, ties
+# counting half. playouts: playouts in total. stats: {move: (visits, wins)} for every
+# root move. seconds: the wall clock time taken.
+MctsResult = namedtuple("MctsResult", ["move", "visits", "win_rate", "playouts", "stats", "seconds"])
+
+
+class MctsNode:
+    """
+    A node of the search tree: a position, the move that led to it and the playout
+    statistics of that move, seen from the player who made it.
+    """
+
+    __slots__ = ("position", "move", "parent", "plies", "children", "untried", "visits", "wins")
+
+    def __init__(self, position, move=None, parent=None, plies=0):
+        """
+        :param position: The Position of the node.
+        :param move: The move played from the parent, None for the root.
+        :param parent: The parent MctsNode, None for the root.
+        :param plies: The number of plies played in the game so far.
+        """
+        self.position = position
+        self.move = move
+        self.parent = parent
+        self.plies = plies
+        self.children = []
+        self.untried = position.legal_moves() if plies < MOVE_LIMIT else []
+        self.visits = 0
+        self.wins = 0.0
+
+    def is_won(self):
+        """
+        Check if the player who made this node's move has won: the player to move has no legal move.
+        """
+        return not self.untried and not self.children and self.plies < MOVE_LIMIT
+
+    def select_child(self):
+        """
+        Pick a child that wins on the spot, otherwise the child with the highest UCT score.
+        """
+        log_visits = math.log(self.visits)
+        return max(self.children, key=lambda child: math.inf if child.is_won() else
+                   child.wins / child.visits + EXPLORATION * math.sqrt(log_visits / child.visits))
+
+
+def playout(position, plies, policy, rng):
+    """
+    Play a game to its end with a policy, stopping at MOVE_LIMIT plies.
+
+    :param position: The starting Position.
+    :param plies: The number of plies already played in the game.
+    :param policy: A policy callable, see analysis.policies.
+    :param rng: A random.Random instance.
+    :return: The name of the winner, or None for a tie.
+    """
+    while plies < MOVE_LIMIT:
+        moves = position.legal_moves()
+        if not moves:
+            return position.other_side()
+        position = position.play(policy(position, moves, rng))
+        plies += 1
+    return None
+
+
+def search(position, plies=0, seconds=1.0, iterations=None, policy_name="random", seed=0):
+    """
+    Run a Monte Carlo tree search with UCT selection from a position.
+
+    Every iteration walks down the tree by UCT, adds one child, plays out the game
+    from it with the policy and updates the statistics on the way back up.
+
+    :param position: The root Position.
+    :param plies: The number of plies already played in the game.
+    :param seconds: The time budget.
+    :param iterations: Stop after this many playouts, None to use the whole time budget.
+    :param policy_name: The playout policy, see analysis.policies.get_policy.
+    :param seed: The random seed.
+    :return: A dict {move: (visits, wins)} of the root moves.
+    """
+    policy = get_policy(policy_name)
+    rng = random.Random(seed)
+    root = MctsNode(position, plies=plies)
+    deadline = time.perf_counter() + seconds
+    done = 0
+    while (iterations is None or done < iterations) and time.perf_counter() < deadline:
+        node = root
+        while not node.untried and node.children:
+            node = node.select_child()
+        if node.untried:
+            move = node.untried.pop(rng.randrange(len(node.untried)))
+            child = MctsNode(node.position.play(move), move, node, node.plies + 1)
+            node.children.append(child)
+            node = child
+
+        if node.is_won():
+            winner = node.position.other_side()
+        elif node.untried or node.children:
+            winner = playout(node.position, node.plies, policy, rng)
+        else:
+            winner = None
+
+        while node is not None:
+            node.visits += 1
+            if winner is None:
+                node.wins += 0.5
+            elif winner == node.position.other_side():
+                node.wins += 1
+            node = node.parent
+        done += 1
+        if not root.untried and not root.children:
+            break
+    return {child.move: (child.visits, child.wins) for child in root.children}
+
+
+def _search_task(task):
+    return search(*task)
+
+
+def suggest_move(position, plies=0, seconds=1.0, workers=1, iterations=None, policy_name="random", seed=0):
+    """
+    Suggest a move with root-parallel Monte Carlo tree search.
+
+    Every worker process searches its own tree from the position with its own seed;
+    the statistics of the root moves are summed at the end and the most visited move
+    is suggested. More time or more workers give more playouts and a better move.
+
+    :param position: The Position to move in.
+    :param plies: The number of plies already played in the game.
+    :param seconds: The time budget.
+    :param workers: Number of worker processes.
+    :param iterations: Total number of playouts, None to use the whole time budget.
+    :param policy_name: The playout policy, e.g. 'random' or 'greedy'.
+    :param seed: The base random seed; worker i uses seed + i.
+    :return: An MctsResult.
+    """
+    start = time.perf_counter()
+    per_worker = None if iterations is None else -(-iterations // workers)
+    tasks = [(position, plies, seconds, per_worker, policy_name, seed + i) for i in range(workers)]
+    if workers == 1:
+        trees = [_search_task(tasks[0])]
+    else:
+        with Pool(workers) as pool:
+            trees = pool.map(_search_task, tasks)
+
+    stats = {}
+    for tree in trees:
+        for move, (visits, wins) in tree.items():
+            total_visits, total_wins = stats.get(move, (0, 0.0))
+            stats[move] = (total_visits + visits, total_wins + wins)
+    seconds = time.perf_counter() - start
+    playouts = sum(visits for visits, _ in stats.values())
+    if not stats:
+        return MctsResult(None, 0, 0.0, playouts, stats, seconds)
+    move = max(stats, key=lambda m: (stats[m][0], stats[m][1]))
+    visits, wins = stats[move]
+    return MctsResult(move, visits, wins / visits, playouts, stats, seconds)
+
+
+def run_mcts_mode(path, seconds=1.0, workers=None, policy_name="random"):
+    """
+    Suggest a move for the position at the end of a test case file and print it,
+    with the statistics of the most visited moves.
+
+    :param path: Path to the test case file.
+    :param seconds: The time budget.
+    :param workers: Number of worker processes, defaults to the number of CPUs.
+    :param policy_name: The playout policy.
+    """
+    try:
+        plies = len(parseTestCase(path)['moves'])
+        position = Position.from_file(path)
+    except Exception as e:
+        print(f"Error with opening filepath: {e}")
+        return
+
+    result = suggest_move(position, plies, seconds, workers or os.cpu_count() or 1, policy_name=policy_name)
+    if result.move is None:
+        print(f"No legal move for {position.side} player.")
+        return
+    print(f"Suggested move: {result.move}")
+    for move in sorted(result.stats, key=lambda m: -result.stats[m][0])[:5]:
+        visits, wins = result.stats[move]
+        print(f"{move}  visits {visits}  win rate {wins / visits:.2f}")
+    rate = result.playouts / result.seconds if result.seconds > 0 else 0
+    print(f"Playouts: {result.playouts} ({rate:.0f} playouts/sec)")
@@ -0,0 +1,74 @@
+import importlib
+
+from game_items.position import parse_square
+
+# Rough material values used to rank captures
+PIECE_VALUES = {"p": 1, "r": 5, "s": 6, "g": 8, "n": 10, "d": 100}
+
+
+def random_policy(position, moves, rng):
+    """
+    Pick a legal move uniformly at random.
+
+    :param position: The current Position.
+    :param moves: The legal moves of the player to move.
+    :param rng: A random.Random instance.
+    :return: The chosen move string.
+    """
+    return rng.choice(moves)
+
+
+def greedy_capture_policy(position, moves, rng):
+    """
+    Checkmate if possible, otherwise capture the most valuable piece available,
+    otherwise play a random move.
+
+    Captures are scored from the piece on the target square. Only a move giving check
+    can checkmate, so checks are found with Position.gives_check() and only those
+    moves are played out and tested for mate.
+
+    :param position: The current Position.
+    :param moves: The legal moves of the player to move.
+    :param rng: A random.Random instance.
+    :return: The chosen move string.
+    """
+    best_value, best_moves = 0, []
+    for move in moves:
+        split = move.split()
+        if split[0] != "move":
+            continue
+        target = position.squares[parse_square(split[2])]
+        if not target:
+            continue
+        value = PIECE_VALUES[target[-1].lower()]
+        if value > best_value:
+            best_value, best_moves = value, [move]
+        elif value == best_value:
+            best_moves.append(move)
+
+    for move in moves:
+        if position.gives_check(move) and not position.play(move).has_legal_move():
+            return move
+    return rng.choice(best_moves or moves)
+
+
+POLICIES = {
+    "random": random_policy,
+    "greedy": greedy_capture_policy,
+}
+
+
+def get_policy(name):
+    """
+    Look up a move selection policy.
+
+    :param name: A name from POLICIES, or 'module:function' for any importable
+        callable taking (position, moves, rng) and returning one of the moves.
+    :return: The policy callable.
+    """
+    if name in POLICIES:
+        return POLICIES[name]
+    if ":" in name:
+        module_name, function_name = name.split(":", 1)
+        return getattr(importlib.import_module(module_name), function_name)
+    raise ValueError("Unknown policy: " + name)
@@ -0,0 +1,339 @@
+import hashlib
+import mmap
+import os
+import struct
+
+from game_items.gamevars import BOARD_SIZE, PROMOTION_ZONE
+from analysis.archive import iter_game_files, replay_file
+
+MAGIC = b"BXPI"
+VERSION = 2
+# magic, version, board size, promotion zone rows, number of slots, number of used slots,
+# number of postings the slots cover
+HEADER = struct.Struct("<4sHBBQQQ")
+# position hash, index of the newest posting for the position (-1 if none), number of
+# postings of the position as stored and of its flipped twin
+SLOT = struct.Struct("<QqII")
+# position hash, index of the previous posting for the same position (-1 if none), game id,
+# ply, 1 if the game reached the flipped twin of the stored position
+POSTING = struct.Struct("<QqIHB")
+# The largest ply a posting can hold
+MAX_PLY = 0xFFFF
+
+INITIAL_SLOTS = 1 << 12
+MAX_LOAD = 0.6
+EMPTY = 0
+
+GAMES_FILE = "games.txt"
+TABLE_FILE = "table.bin"
+POSTINGS_FILE = "postings.bin"
+
+
+def position_hash(position):
+    """
+    Hash a position to the 64 bit key stored in the index.
+
+    Two different positions share a key with a probability of about n^2 / 2^65
+    for n distinct positions, which is treated as never.
+
+    :param position: A Position.
+    :return: A non-zero integer.
+    """
+    digest = hashlib.blake2b(position.compact_key(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+class PositionIndex:
+    """
+    An on-disk index from every position reached in an archive of game files to
+    the games and plies where it occurs.
+
+    The index is a directory holding three files: the list of indexed game files,
+    whose line numbers are the game ids, an append-only file of postings and an
+    open addressing hash table from position key to the newest posting of that
+    position. Postings of a position are chained from newest to oldest, so adding
+    games only appends postings and rewrites a few slots. The table and postings are
+    memory-mapped, so a query hashes the position and reads a handful of bytes.
+
+    Positions are keyed in canonical form, see Position.canonical(), so a position
+    and its color-flipped twin share one slot and one chain of postings. Every
+    posting records which of the two was reached, and queries only report the
+    position asked for.
+
+    A game is committed by listing it in the games file, after its postings are
+    written. Opening the index drops postings of games that were never listed, left
+    by an interrupted run, and rebuilds the table if it does not cover exactly the
+    remaining postings.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: The index directory, created if it does not exist.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        games_path = os.path.join(directory, GAMES_FILE)
+        self.game_paths = []
+        if os.path.exists(games_path):
+            with open(games_path, "r+b") as f:
+                data = f.read()
+                # A line cut short by an interrupted run does not list a game
+                end = data.rfind(b"\n") + 1
+                if end != len(data):
+                    f.truncate(end)
+            self.game_paths = data[:end].decode().split("\n")[:-1]
+        self._indexed = set(self.game_paths)
+
+        self._postings_file = open(os.path.join(directory, POSTINGS_FILE), "a+b")
+        self.num_postings = self._drop_unlisted_postings()
+        self._postings_map = None
+
+        table_path = os.path.join(directory, TABLE_FILE)
+        if not os.path.exists(table_path):
+            self._write_table(table_path, INITIAL_SLOTS, [])
+        self._open_table()
+        if self.table_postings != self.num_postings:
+            self._rebuild_table()
+
+    def close(self):
+        self._table_map.flush()
+        self._table_map.close()
+        self._table_file.close()
+        self._postings_file.close()
+        if self._postings_map is not None:
+            self._postings_map.close()
+
+    def _drop_unlisted_postings(self):
+        """
+        Truncate the postings file after the last posting of a game in the games file.
+        Games are listed in id order once their postings are written, so the postings
+        of an interrupted game can only be at the end.
+
+        :return: The number of postings kept.
+        """
+        f = self._postings_file
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        count = size // POSTING.size
+        while count:
+            f.seek((count - 1) * POSTING.size)
+            if POSTING.unpack(f.read(POSTING.size))[2] < len(self.game_paths):
+                break
+            count -= 1
+        if count * POSTING.size != size:
+            f.truncate(count * POSTING.size)
+        return count
+
+    def _write_table(self, path, num_slots, slots, num_postings=0):
+        """
+        Write a table file holding the given slots.
+
+        :param path: The file to write.
+        :param num_slots: The number of slots, a power of two.
+        :param slots: A list of (hash, head, count, flipped count) tuples.
+        :param num_postings: The number of postings the slots cover.
+        """
+        table = bytearray(HEADER.size + num_slots * SLOT.size)
+        HEADER.pack_into(table, 0, MAGIC, VERSION, BOARD_SIZE, PROMOTION_ZONE, num_slots, len(slots), num_postings)
+        for key, head, count, flipped_count in slots:
+            slot = key & (num_slots - 1)
+            while struct.unpack_from("<Q", table, HEADER.size + slot * SLOT.size)[0] != EMPTY:
+                slot = (slot + 1) & (num_slots - 1)
+            SLOT.pack_into(table, HEADER.size + slot * SLOT.size, key, head, count, flipped_count)
+        with open(path, "wb") as f:
+            f.write(table)
+
+    def _open_table(self):
+        table_path = os.path.join(self.directory, TABLE_FILE)
+        self._table_file = open(table_path, "r+b")
+        self._table_map = mmap.mmap(self._table_file.fileno(), 0)
+        (magic, version, board_size, zone,
+         self.num_slots, self.used_slots, self.table_postings) = HEADER.unpack_from(self._table_map, 0)
+        if magic != MAGIC or version != VERSION or board_size != BOARD_SIZE or zone != PROMOTION_ZONE:
+            raise ValueError("Not a position index for this board: " + self.directory)
+
+    def _grow_table(self):
+        """
+        Double the number of slots, reinserting the used ones. Postings are not touched.
+        """
+        slots = []
+        for slot in range(self.num_slots):
+            entry = SLOT.unpack_from(self._table_map, HEADER.size + slot * SLOT.size)
+            if entry[0] != EMPTY:
+                slots.append(entry)
+        self._table_map.close()
+        self._table_file.close()
+        table_path = os.path.join(self.directory, TABLE_FILE)
+        self._write_table(table_path + ".tmp", self.num_slots * 2, slots, self.num_postings)
+        os.replace(table_path + ".tmp", table_path)
+        self._open_table()
+
+    def _rebuild_table(self):
+        """
+        Rebuild the table from the postings, after an interrupted run left it out of step with them.
+        """
+        self._postings_file.seek(0)
+        data = self._postings_file.read(self.num_postings * POSTING.size)
+        entries = {}
+        for index, (key, _, _, _, flipped) in enumerate(POSTING.iter_unpack(data)):
+            entry = entries.setdefault(key, [key, -1, 0, 0])
+            entry[1] = index
+            entry[2 + flipped] += 1
+        num_slots = INITIAL_SLOTS
+        while len(entries) > num_slots * MAX_LOAD:
+            num_slots *= 2
+        self._table_map.close()
+        self._table_file.close()
+        table_path = os.path.join(self.directory, TABLE_FILE)
+        self._write_table(table_path + ".tmp", num_slots, list(entries.values()), self.num_postings)
+        os.replace(table_path + ".tmp", table_path)
+        self._open_table()
+
+    def _find_slot(self, key):
+        """
+        Find the slot of a key, or the empty slot where it would be inserted.
+
+        :param key: A position hash.
+        :return: A tuple of the slot offset in the table and its (hash, head, count, flipped count).
+        """
+        mask = self.num_slots - 1
+        slot = key & mask
+        while True:
+            offset = HEADER.size + slot * SLOT.size
+            entry = SLOT.unpack_from(self._table_map, offset)
+            if entry[0] == key or entry[0] == EMPTY:
+                return offset, entry
+            slot = (slot + 1) & mask
+
+    def _add_posting(self, position, game_id, ply):
+        if self.used_slots + 1 > self.num_slots * MAX_LOAD:
+            self._grow_table()
+        canonical, flipped = position.canonical()
+        key = position_hash(canonical)
+        offset, (found, head, *counts) = self._find_slot(key)
+        if found == EMPTY:
+            head, counts = -1, [0, 0]
+            self.used_slots += 1
+        counts[flipped] += 1
+        self._postings_file.write(POSTING.pack(key, head, game_id, ply, flipped))
+        SLOT.pack_into(self._table_map, offset, key, self.num_postings, *counts)
+        self.num_postings += 1
+        HEADER.pack_into(self._table_map, 0, MAGIC, VERSION, BOARD_SIZE, PROMOTION_ZONE,
+                         self.num_slots, self.used_slots, self.num_postings)
+
+    def add_game(self, path):
+        """
+        Replay a game file and index every position it reaches. Replay stops at
+        the first illegal move or the move limit, as file mode does.
+
+        :param path: Path to the game file.
+        :return: The id of the game, or None if the file is already indexed.
+        :raises ValueError: If the game is longer than MAX_PLY plies.
+        """
+        if path in self._indexed:
+            return None
+        game_id = len(self.game_paths)
+        positions = list(replay_file(path))
+        if positions[-1][0] > MAX_PLY:
+            raise ValueError(f"{path} has {positions[-1][0]} plies, more than the index can hold")
+        for ply, position, _ in positions:
+            self._add_posting(position, game_id, ply)
+        self._postings_file.flush()
+        if self._postings_map is not None:
+            self._postings_map.close()
+            self._postings_map = None
+        # Listing the game commits its postings
+        with open(os.path.join(self.directory, GAMES_FILE), "a") as f:
+            f.write(path + "\n")
+        self.game_paths.append(path)
+        self._indexed.add(path)
+        return game_id
+
+    def add_games(self, paths, progress=None):
+        """
+        Index every game file not yet in the index.
+
+        :param paths: Files, directories or glob patterns, see analysis.archive.iter_game_files().
+        :param progress: Optional callable receiving a status string now and then.
+        :return: The number of games added.
+        """
+        added = 0
+        for path in iter_game_files(paths):
+            if self.add_game(path) is not None:
+                added += 1
+                if progress and added % 1000 == 0:
+                    progress(f"indexed {added} games")
+        self._table_map.flush()
+        return added
+
+    def count(self, position):
+        """
+        Count how often a position occurs in the indexed games.
+
+        :param position: A Position.
+        :return: The number of (game, ply) occurrences.
+        """
+        canonical, flipped = position.canonical()
+        key = position_hash(canonical)
+        _, (found, _, *counts) = self._find_slot(key)
+        return counts[flipped] if found == key else 0
+
+    def occurrences(self, position):
+        """
+        List where a position occurs in the indexed games.
+
+        :param position: A Position.
+        :return: A list of (game id, ply) tuples in the order the games were indexed.
+        """
+        canonical, flipped = position.canonical()
+        key = position_hash(canonical)
+        _, (found, head, _, _) = self._find_slot(key)
+        if found != key:
+            return []
+        if self._postings_map is None:
+            self._postings_map = mmap.mmap(self._postings_file.fileno(), 0, access=mmap.ACCESS_READ)
+        result = []
+        while head != -1:
+            _, head, game_id, ply, posting_flipped = POSTING.unpack_from(self._postings_map, head * POSTING.size)
+            if posting_flipped == flipped:
+                result.append((game_id, ply))
+        result.reverse()
+        return result
+
+    def games(self, position):
+        """
+        List the games that reached a position.
+
+        :param position: A Position.
+        :return: A sorted list of game ids.
+        """
+        return sorted(set(game_id for game_id, _ in self.occurrences(position)))
+
+
+def run_index_mode(directory, paths):
+    """
+    Add game files to a position index and print how many were added.
+
+    :param directory: The index directory.
+    :param paths: Files, directories or glob patterns of game files.
+    """
+    index = PositionIndex(directory)
+    added = index.add_games(paths, progress=print)
+    print(f"Indexed {added} new games, {len(index.game_paths)} games and {index.num_postings} positions in total.")
+    index.close()
+
+
+def run_lookup_mode(directory, position):
+    """
+    Print every game and ply of an index where a position occurs.
+
+    :param directory: The index directory.
+    :param position: The Position to look up.
+    """
+    index = PositionIndex(directory)
+    occurrences = index.occurrences(position)
+    games = set(game_id for game_id, _ in occurrences)
+    print(f"Position occurs {len(occurrences)} times in {len(games)} games.")
+    for game_id, ply in occurrences:
+        print(f"{index.game_paths[game_id]} ply {ply}")
+    index.close()
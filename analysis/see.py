@@ -0,0 +1,153 @@
+from game_items.position import (Position, DIRECTION_MASKS, LINES, PROMOTABLE, parse_square,
+                                 in_promote_row, in_last_row)
+from analysis.policies import PIECE_VALUES
+
+# Value added to PIECE_VALUES for a promoted piece on the board
+PROMOTION_BONUS = {"n": 2, "g": 2, "r": 1, "p": 5}
+
+
+def piece_value(piece_repr):
+    """
+    Return the value of a piece on the board, promotion included.
+
+    :param piece_repr: The string representation of the piece, e.g. '+r'.
+    :return: The value.
+    """
+    letter = piece_repr[-1].lower()
+    if piece_repr[0] == "+":
+        return PIECE_VALUES[letter] + PROMOTION_BONUS[letter]
+    return PIECE_VALUES[letter]
+
+
+def capture_value(piece_repr):
+    """
+    Return the material swing of capturing a piece: its owner loses it as it stands
+    on the board, and the capturer gets it in hand, unpromoted.
+
+    :param piece_repr: The string representation of the captured piece.
+    :return: The value.
+    """
+    if piece_repr in ("d", "D"):
+        return PIECE_VALUES["d"]
+    return piece_value(piece_repr) + PIECE_VALUES[piece_repr[-1].lower()]
+
+
+def _least_valuable_attacker(squares, occupied, target, upper):
+    """
+    Find the least valuable piece of a player that can move to a square, treating only
+    the squares set in the occupied bitboard as occupied.
+
+    :return: The index of the attacker's square, or None.
+    """
+    best, best_value = None, None
+    for mask, increasing in DIRECTION_MASKS[target]:
+        blockers = occupied & mask
+        if not blockers:
+            continue
+        if increasing:
+            index = (blockers & -blockers).bit_length() - 1
+        else:
+            index = blockers.bit_length() - 1
+        piece_repr = squares[index]
+        if piece_repr[-1].isupper() == upper and target in LINES[piece_repr][index]:
+            value = piece_value(piece_repr)
+            if best is None or value < best_value:
+                best, best_value = index, value
+    return best
+
+
+def _recapturing_piece(piece_repr, start, end, upper):
+    """
+    Return the piece a recapture leaves on the square, promoted whenever the rules allow.
+    """
+    if piece_repr in PROMOTABLE and (in_promote_row(start, upper) or in_promote_row(end, upper)):
+        return "+" + piece_repr
+    return piece_repr
+
+
+def see(position, move):
+    """
+    Statically evaluate the exchange a move starts on its destination square.
+
+    Both players then keep capturing on that square with their least valuable
+    attacker, and either may stop when going on would lose material. Pieces uncovered
+    behind a capturing piece join in. Captured pieces count twice, as lost on the
+    board and gained in hand unpromoted, and recapturing pieces promote whenever they
+    may. A Drive only recaptures if the square is no longer attacked. Pins and checks
+    elsewhere on the board are ignored.
+
+    The position is not changed: captures are followed with a copy of its occupied
+    bitboard only.
+
+    :param position: A Position.
+    :param move: A legal move of the player to move, e.g. 'move a2 a3' or 'drop p c3'.
+    :return: The material won by the player to move, negative if the move loses material.
+    """
+    squares = position.squares
+    occupied = position.occupied
+    upper = position.side == "UPPER"
+    split = move.split()
+    if split[0] == "drop":
+        target = parse_square(split[2])
+        piece_repr = split[1].upper() if upper else split[1].lower()
+        gains = [0]
+    else:
+        start, target = parse_square(split[1]), parse_square(split[2])
+        piece_repr = squares[start]
+        captured = squares[target]
+        gains = [capture_value(captured) if captured else 0]
+        occupied &= ~(1 << start)
+        promote = len(split) > 3 and split[3] == "promote"
+        if piece_repr in ("p", "P") and in_last_row(target, upper):
+            promote = True
+        if promote and piece_repr in PROMOTABLE:
+            gains[0] += piece_value("+" + piece_repr) - piece_value(piece_repr)
+            piece_repr = "+" + piece_repr
+
+    while True:
+        upper = not upper
+        attacker = _least_valuable_attacker(squares, occupied, target, upper)
+        if attacker is None:
+            break
+        attacker_repr = squares[attacker]
+        remaining = occupied & ~(1 << attacker)
+        if attacker_repr in ("d", "D") and _least_valuable_attacker(squares, remaining, target, not upper) is not None:
+            break
+        recapturing = _recapturing_piece(attacker_repr, attacker, target, upper)
+        gains.append(capture_value(piece_repr) + piece_value(recapturing) - piece_value(attacker_repr) - gains[-1])
+        occupied = remaining
+        piece_repr = recapturing
+
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
+def order_moves(position, moves):
+    """
+    Sort moves by static exchange evaluation, best first. Moves of equal value keep
+    their order.
+
+    :param position: A Position.
+    :param moves: Legal moves of the player to move.
+    :return: A new list of the moves.
+    """
+    return sorted(moves, key=lambda move: -see(position, move))
+
+
+def run_see_mode(path):
+    """
+    Print the legal moves at the end of a test case file that win or lose material,
+    best first, with their static exchange evaluation.
+
+    :param path: Path to the test case file.
+    """
+    try:
+        position = Position.from_file(path)
+    except Exception as e:
+        print(f"Error with opening filepath: {e}")
+        return
+    values = {move: see(position, move) for move in position.legal_moves()}
+    for move in order_moves(position, values):
+        if values[move]:
+            print(f"{values[move]:+d}  {move}")
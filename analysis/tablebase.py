@@ -0,0 +1,311 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import deque, namedtuple
+
+from game_items.gamevars import BOARD_SIZE, PROMOTION_ZONE
+from game_items.position import Position, NUM_SQUARES, in_last_row
+
+MAGIC = b"BXTB"
+VERSION = 2
+# magic, version, board size, promotion zone rows, material (8 bytes, padded), number of entries
+HEADER = struct.Struct("<4sHBB8sQ")
+
+# Stored values: 0 is a draw, +(n + 1) a win and -(n + 1) a loss for the
+# player to move, n being the number of plies until checkmate.
+DRAW = 0
+INVALID = -32768
+
+WIN, LOSS = "win", "loss"
+
+TablebaseEntry = namedtuple("TablebaseEntry", ["outcome", "plies"])
+
+
+def material_of(position):
+    """
+    Return the material signature of a position: the sorted letters of every
+    piece except the two Drives, on the board or in hand.
+
+    :param position: A Position.
+    :return: A string such as 'gr', or None if a Drive is missing.
+    """
+    if position.find_drive("lower") is None or position.find_drive("UPPER") is None:
+        return None
+    letters = [p[-1].lower() for p in position.squares if p and p[-1] not in "dD"]
+    letters += [p.lower() for p in position.upper_hand + position.lower_hand]
+    return "".join(sorted(letters))
+
+
+class TablebaseIndex:
+    """
+    Maps every position with a given material to a unique integer and back.
+
+    The index is a mixed-radix number made of the squares of both Drives and one
+    state per remaining piece. A piece state is either a square, owner and promotion
+    flag, or the hand it sits in. Pieces of the same type are stored in ascending
+    state order so every position has exactly one index. Only canonical positions,
+    with lower to move, are indexed: a position with UPPER to move shares the index
+    of its flipped twin, see Position.canonical(), which has the same outcome.
+    """
+
+    def __init__(self, material):
+        """
+        :param material: The letters of the pieces besides the Drives, e.g. 'r' or 'gp'.
+        """
+        self.material = "".join(sorted(material.lower()))
+        self.promotable = [letter != "s" for letter in self.material]
+        self.radices = [self._board_states(i) + 2 for i in range(len(self.material))]
+        self.size = NUM_SQUARES * NUM_SQUARES
+        for radix in self.radices:
+            self.size *= radix
+
+    def _board_states(self, slot):
+        return NUM_SQUARES * (4 if self.promotable[slot] else 2)
+
+    def _encode_piece(self, slot, square, upper, promoted):
+        if self.promotable[slot]:
+            return square * 4 + (2 if upper else 0) + (1 if promoted else 0)
+        return square * 2 + (1 if upper else 0)
+
+    def index_of(self, position):
+        """
+        Compute the index of a position, flipping it first if UPPER is to move.
+
+        :param position: A Position with this index's material.
+        :return: The index of the position.
+        """
+        position, _ = position.canonical()
+        states = {}
+        for square, piece_repr in enumerate(position.squares):
+            if piece_repr and piece_repr[-1] not in "dD":
+                states.setdefault(piece_repr[-1].lower(), []).append(
+                    (square, piece_repr[-1].isupper(), piece_repr[0] == "+"))
+        for side, hand in (("lower", position.lower_hand), ("UPPER", position.upper_hand)):
+            for piece_repr in hand:
+                states.setdefault(piece_repr.lower(), []).append((None, side == "UPPER", False))
+
+        index = 0
+        slot = 0
+        for letter in sorted(states):
+            codes = []
+            for square, upper, promoted in states[letter]:
+                if square is None:
+                    codes.append(self._board_states(slot) + (1 if upper else 0))
+                else:
+                    codes.append(self._encode_piece(slot, square, upper, promoted))
+            for code in sorted(codes):
+                index = index * self.radices[slot] + code
+                slot += 1
+
+        index = index * NUM_SQUARES + position.find_drive("UPPER")
+        return index * NUM_SQUARES + position.find_drive("lower")
+
+    def position_at(self, index):
+        """
+        Decode an index back into a position.
+
+        :param index: An index in range(self.size).
+        :return: A Position with lower to move, or None if the index does not
+            describe a legal, canonically ordered position.
+        """
+        lower_drive = index % NUM_SQUARES
+        index //= NUM_SQUARES
+        upper_drive = index % NUM_SQUARES
+        index //= NUM_SQUARES
+        if lower_drive == upper_drive:
+            return None
+
+        position = Position(side="lower")
+        position.put(lower_drive, "d")
+        position.put(upper_drive, "D")
+        previous = (None, -1)
+        for slot in range(len(self.material) - 1, -1, -1):
+            code = index % self.radices[slot]
+            index //= self.radices[slot]
+            letter = self.material[slot]
+            # Identical pieces must appear in ascending order
+            if previous[0] == letter and code > previous[1]:
+                return None
+            previous = (letter, code)
+
+            board_states = self._board_states(slot)
+            if code >= board_states:
+                upper = code - board_states == 1
+                position.hand("UPPER" if upper else "lower").append(letter.upper() if upper else letter)
+                continue
+            if self.promotable[slot]:
+                square, upper, promoted = code // 4, bool(code & 2), bool(code & 1)
+            else:
+                square, upper, promoted = code // 2, bool(code & 1), False
+            if position.squares[square]:
+                return None
+            if letter == "p" and not promoted and in_last_row(square, upper):
+                return None
+            piece_repr = letter.upper() if upper else letter
+            position.put(square, "+" + piece_repr if promoted else piece_repr)
+
+        if position.in_check(position.other_side()):
+            return None
+        return position
+
+
+def generate(material, path, progress=None):
+    """
+    Solve every position with the given material by retrograde analysis and
+    write the results to a tablebase file.
+
+    Positions are enumerated through TablebaseIndex and expanded once with the
+    move rules of Position. Starting from the positions where the player to move
+    has no legal move, results are then propagated backwards in order of
+    distance to mate. Positions never reached are draws.
+
+    :param material: The letters of the pieces besides the Drives, e.g. 'r'.
+    :param path: The file to write.
+    :param progress: Optional callable receiving a status string now and then.
+    :return: The number of positions solved.
+    """
+    table = TablebaseIndex(material)
+    size = table.size
+    values = array("h", [INVALID]) * size
+    remaining = array("l", [0]) * size
+    successors = array("l")
+    offsets = array("l", [0]) * (size + 1)
+
+    # Forward pass: expand every position once
+    queue = deque()
+    for index in range(size):
+        offsets[index] = len(successors)
+        position = table.position_at(index)
+        if position is None:
+            continue
+        values[index] = DRAW
+        children = set(table.index_of(position.play(move)) for move in position.legal_moves())
+        successors.extend(children)
+        remaining[index] = len(children)
+        if not children:
+            values[index] = -1
+            queue.append(index)
+        if progress and index % 100000 == 0:
+            progress(f"expanded {index}/{size}")
+    offsets[size] = len(successors)
+
+    # Invert the successor lists
+    pred_offsets = array("l", [0]) * (size + 1)
+    for child in successors:
+        pred_offsets[child + 1] += 1
+    for index in range(size):
+        pred_offsets[index + 1] += pred_offsets[index]
+    predecessors = array("l", [0]) * len(successors)
+    fill = array("l", pred_offsets)
+    for index in range(size):
+        for position in range(offsets[index], offsets[index + 1]):
+            child = successors[position]
+            predecessors[fill[child]] = index
+            fill[child] += 1
+    del successors, fill
+
+    # Backward pass, in increasing distance to mate
+    solved = len(queue)
+    while queue:
+        child = queue.popleft()
+        value = values[child]
+        plies = abs(value)
+        for position in range(pred_offsets[child], pred_offsets[child + 1]):
+            parent = predecessors[position]
+            if values[parent] != DRAW:
+                continue
+            if value < 0:
+                values[parent] = plies + 1
+                queue.append(parent)
+                solved += 1
+            else:
+                remaining[parent] -= 1
+                if remaining[parent] == 0:
+                    values[parent] = -(plies + 1)
+                    queue.append(parent)
+                    solved += 1
+
+    if sys.byteorder != "little":
+        values.byteswap()
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, BOARD_SIZE, PROMOTION_ZONE, table.material.encode("ascii"), size))
+        values.tofile(f)
+    if progress:
+        progress(f"solved {solved} positions")
+    return solved
+
+
+class Tablebase:
+    """
+    Read-only access to a tablebase file written by generate(). The file is
+    memory-mapped, so probing reads two bytes and never loads the whole table.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The tablebase file to open.
+        """
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, board_size, zone, material, size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION or board_size != BOARD_SIZE or zone != PROMOTION_ZONE:
+            raise ValueError("Not a tablebase for this board: " + path)
+        self.material = material.rstrip(b"\0").decode("ascii")
+        self.index = TablebaseIndex(self.material)
+        if size != self.index.size:
+            raise ValueError("Corrupt tablebase: " + path)
+
+    def close(self):
+        self._mmap.close()
+
+    def probe(self, position):
+        """
+        Look up a position.
+
+        :param position: A Position with the material of this tablebase.
+        :return: A TablebaseEntry for the player to move, whose outcome is WIN, LOSS or
+            None for a draw, or None if the position is not covered by this table.
+        """
+        if material_of(position) != self.material:
+            return None
+        offset = HEADER.size + 2 * self.index.index_of(position)
+        value = struct.unpack_from("<h", self._mmap, offset)[0]
+        if value == INVALID:
+            return None
+        if value == DRAW:
+            return TablebaseEntry(None, None)
+        return TablebaseEntry(WIN if value > 0 else LOSS, abs(value) - 1)
+
+
+class TablebaseSet:
+    """
+    A collection of tablebases, e.g. every *.tb file of a directory, probed by material.
+    """
+
+    def __init__(self, paths):
+        """
+        :param paths: A directory holding .tb files, or a list of tablebase files.
+        """
+        if isinstance(paths, str):
+            if os.path.isdir(paths):
+                paths = [os.path.join(paths, name) for name in sorted(os.listdir(paths)) if name.endswith(".tb")]
+            else:
+                paths = [paths]
+        self.tables = {}
+        for path in paths:
+            table = Tablebase(path)
+            self.tables[table.material] = table
+
+    def probe(self, position):
+        """
+        Look up a position in the table matching its material.
+
+        :param position: A Position.
+        :return: A TablebaseEntry, or None if no table covers the position.
+        """
+        table = self.tables.get(material_of(position))
+        if table is None:
+            return None
+        return table.probe(position)
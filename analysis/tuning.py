@@ -0,0 +1,362 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from utils import parseTestCase
+from game_items.gamevars import BOARD_SIZE
+from game_items.position import NUM_SQUARES, PIECE_REPRS, PIECE_CODES, HAND_LETTERS, flip_square
+from game_modes.batchgame import replay_batch
+from analysis.archive import iter_game_files, replay_setup
+from analysis.policies import PIECE_VALUES
+from analysis.see import PROMOTION_BONUS
+
+# Piece types with a piece-square table, lower's strings in PIECE_REPRS order
+PIECE_TYPES = PIECE_REPRS[:len(PIECE_REPRS) // 2]
+BONUS_LETTERS = "ngrp"
+
+# Feature layout. Every feature counts lower's pieces minus UPPER's, so a positive
+# evaluation favours lower. Squares of the piece-square tables are seen from the
+# owner of the piece, UPPER's squares being flipped.
+MATERIAL = 0                                       # pieces on the board, by HAND_LETTERS, promoted ones included
+BONUS = MATERIAL + len(HAND_LETTERS)               # promoted pieces on the board, by BONUS_LETTERS
+HAND = BONUS + len(BONUS_LETTERS)                  # pieces in hand, by HAND_LETTERS
+TEMPO = HAND + len(HAND_LETTERS)                   # 1 if lower is to move, -1 otherwise
+PST = TEMPO + 1                                    # PIECE_TYPES index * NUM_SQUARES + square
+NUM_FEATURES = PST + len(PIECE_TYPES) * NUM_SQUARES
+
+# Width of a position row: the bytes of Position.compact_key()
+KEY_SIZE = NUM_SQUARES + 2 * len(HAND_LETTERS) + 1
+
+DEFAULT_ITERATIONS = 200
+DEFAULT_L2 = 1e-4
+CHUNK_ROWS = 65536
+
+
+def _code_tables():
+    """
+    Map every square code of a compact key to its sign, material feature, bonus
+    feature (-1 for none) and piece-square table.
+    """
+    sign = np.zeros(len(PIECE_CODES), dtype=np.int8)
+    material = np.full(len(PIECE_CODES), -1, dtype=np.int32)
+    bonus = np.full(len(PIECE_CODES), -1, dtype=np.int32)
+    table = np.zeros(len(PIECE_CODES), dtype=np.int32)
+    for piece_repr, code in PIECE_CODES.items():
+        if not piece_repr:
+            continue
+        letter = piece_repr[-1].lower()
+        sign[code] = -1 if piece_repr[-1].isupper() else 1
+        if letter in HAND_LETTERS:
+            material[code] = MATERIAL + HAND_LETTERS.index(letter)
+        if piece_repr[0] == "+":
+            bonus[code] = BONUS + BONUS_LETTERS.index(letter)
+        table[code] = PIECE_TYPES.index(piece_repr.lower())
+    return sign, material, bonus, table
+
+
+def initial_weights():
+    """
+    Return the starting weights: the material values of analysis.policies and
+    analysis.see, the same values in hand, flat piece-square tables and no tempo.
+    """
+    weights = np.zeros(NUM_FEATURES, dtype=np.float64)
+    for i, letter in enumerate(HAND_LETTERS):
+        weights[MATERIAL + i] = PIECE_VALUES[letter]
+        weights[HAND + i] = PIECE_VALUES[letter]
+    for i, letter in enumerate(BONUS_LETTERS):
+        weights[BONUS + i] = PROMOTION_BONUS[letter]
+    return weights
+
+
+def extract_positions(paths, skip_plies=0, progress=None):
+    """
+    Collect the positions of game files labelled with the result of their game.
+
+    Results come from FileGame, through game_modes.batchgame; positions come from
+    replaying the moves FileGame played with Position.
+
+    :param paths: Files, directories or glob patterns, see analysis.archive.iter_game_files().
+    :param skip_plies: Leave out the positions of the first plies of every game.
+    :param progress: Optional callable receiving a status string when done.
+    :return: A tuple (keys, labels): a uint8 array (n, KEY_SIZE) of compact keys and a
+        float32 array (n,) holding 1 for a lower win, 0 for an UPPER win and 0.5 otherwise.
+    """
+    if np is None:
+        raise ImportError("Tuning requires numpy")
+    game_setups = {}
+    for path in iter_game_files(paths):
+        try:
+            game_setups[path] = parseTestCase(path)
+        except Exception:
+            continue
+    results = replay_batch(game_setups)
+
+    keys = bytearray()
+    labels = []
+    games = 0
+    for path, game_setup in game_setups.items():
+        result = results[path]
+        if isinstance(result, Exception):
+            continue
+        games += 1
+        label = {"lower": 1.0, "UPPER": 0.0}.get(result.winner, 0.5)
+        for ply, position, _ in replay_setup(game_setup):
+            if ply > result.plies:
+                break
+            if ply >= skip_plies:
+                keys += position.compact_key()
+                labels.append(label)
+    if progress:
+        progress(f"extracted {len(labels)} positions from {games} games")
+    return np.frombuffer(bytes(keys), dtype=np.uint8).reshape(-1, KEY_SIZE), np.array(labels, dtype=np.float32)
+
+
+def features(keys):
+    """
+    Build the feature matrix of positions.
+
+    :param keys: A uint8 array (n, KEY_SIZE) of compact keys.
+    :return: An int8 array (n, NUM_FEATURES), NUM_FEATURES bytes per position.
+    """
+    sign, material, bonus, table = _code_tables()
+    n = len(keys)
+    matrix = np.zeros((n, NUM_FEATURES), dtype=np.int8)
+    rows = np.arange(n)
+    for square in range(NUM_SQUARES):
+        codes = keys[:, square]
+        occupied = sign[codes] != 0
+        r, codes = rows[occupied], codes[occupied]
+        signs = sign[codes]
+        counted = material[codes] >= 0
+        matrix[r[counted], material[codes[counted]]] += signs[counted]
+        promoted = bonus[codes] >= 0
+        matrix[r[promoted], bonus[codes[promoted]]] += signs[promoted]
+        relative = np.where(signs > 0, square, flip_square(square))
+        matrix[r, PST + table[codes] * NUM_SQUARES + relative] += signs
+    upper_hand = keys[:, NUM_SQUARES:NUM_SQUARES + len(HAND_LETTERS)].astype(np.int8)
+    lower_hand = keys[:, NUM_SQUARES + len(HAND_LETTERS):KEY_SIZE - 1].astype(np.int8)
+    matrix[:, HAND:HAND + len(HAND_LETTERS)] = lower_hand - upper_hand
+    matrix[:, TEMPO] = np.where(keys[:, KEY_SIZE - 1] == 0, 1, -1)
+    return matrix
+
+
+def _evaluate_all(matrix, weights):
+    """
+    Evaluate every row of a feature matrix, converting it to floats a chunk at a time.
+    """
+    weights = weights.astype(np.float32)
+    return np.concatenate([matrix[i:i + CHUNK_ROWS].astype(np.float32) @ weights
+                           for i in range(0, len(matrix), CHUNK_ROWS)] or [np.zeros(0, dtype=np.float32)]).astype(np.float64)
+
+
+def _error(evaluations, labels, scale):
+    predictions = 1.0 / (1.0 + np.exp(-scale * evaluations))
+    return float(np.mean((predictions - labels) ** 2))
+
+
+def fit_scale(matrix, labels, weights, low=0.01, high=3.0, steps=40):
+    """
+    Find the scale turning evaluations into win probabilities, 1 / (1 + exp(-scale * eval)),
+    that best predicts the labels with the given weights, by golden section search.
+
+    :return: The scale.
+    """
+    evaluations = _evaluate_all(matrix, weights)
+    ratio = (math.sqrt(5) - 1) / 2
+    a, b = low, high
+    for _ in range(steps):
+        c, d = b - ratio * (b - a), a + ratio * (b - a)
+        if _error(evaluations, labels, c) < _error(evaluations, labels, d):
+            b = d
+        else:
+            a = c
+    return (a + b) / 2
+
+
+def fit(matrix, labels, weights=None, scale=None, iterations=DEFAULT_ITERATIONS, l2=DEFAULT_L2, progress=None):
+    """
+    Tune the weights to minimise the mean squared error between the predicted win
+    probability of every position and the result of its game.
+
+    Every iteration computes the gradient over all positions with matrix products,
+    scales it by the mean square of each feature, and takes the longest step,
+    halving from twice the previous one, that lowers the error. Piece-square
+    weights carry an L2 penalty, which keeps squares seen in few games near zero
+    and leaves the level of every table to the material values.
+
+    :param matrix: The int8 feature matrix, see features().
+    :param labels: The float32 labels, see extract_positions().
+    :param weights: The starting weights, initial_weights() by default.
+    :param scale: The evaluation scale, fitted with fit_scale() by default.
+    :param iterations: The number of gradient steps.
+    :param l2: The penalty on piece-square weights.
+    :param progress: Optional callable receiving a status string every 10 iterations.
+    :return: A tuple (weights, scale, error).
+    """
+    weights = initial_weights() if weights is None else weights.copy()
+    if scale is None:
+        scale = fit_scale(matrix, labels, weights)
+    n = max(len(labels), 1)
+    penalised = np.zeros(NUM_FEATURES)
+    penalised[PST:] = l2
+    second_moment = np.zeros(NUM_FEATURES)
+    for i in range(0, len(matrix), CHUNK_ROWS):
+        chunk = matrix[i:i + CHUNK_ROWS].astype(np.float32)
+        second_moment += (chunk * chunk).sum(axis=0)
+    preconditioner = 1.0 / (second_moment / n + 1e-3)
+
+    def loss(w, evaluations):
+        return _error(evaluations, labels, scale) + float(np.sum(penalised * w * w))
+
+    evaluations = _evaluate_all(matrix, weights)
+    error = loss(weights, evaluations)
+    step = 1.0
+    for iteration in range(iterations):
+        predictions = 1.0 / (1.0 + np.exp(-scale * evaluations))
+        residual = 2.0 * (predictions - labels) * predictions * (1.0 - predictions) * scale / n
+        gradient = np.zeros(NUM_FEATURES)
+        for i in range(0, len(matrix), CHUNK_ROWS):
+            gradient += residual[i:i + CHUNK_ROWS].astype(np.float32) @ matrix[i:i + CHUNK_ROWS].astype(np.float32)
+        gradient += 2.0 * penalised * weights
+        direction = -gradient * preconditioner
+        slope = float(gradient @ direction)
+        if slope >= 0:
+            break
+
+        change = _evaluate_all(matrix, direction)
+        step *= 2.0
+        while step > 1e-12:
+            candidate = weights + step * direction
+            candidate_evaluations = evaluations + step * change
+            candidate_error = loss(candidate, candidate_evaluations)
+            if candidate_error <= error + 1e-4 * step * slope:
+                break
+            step /= 2.0
+        else:
+            break
+        weights, evaluations, error = candidate, candidate_evaluations, candidate_error
+        if progress and (iteration + 1) % 10 == 0:
+            progress(f"iteration {iteration + 1}: error {error:.6f}")
+    return weights, scale, error
+
+
+def evaluate_keys(keys, weights):
+    """
+    Evaluate positions given as compact keys, positive when lower is ahead.
+
+    :param keys: A uint8 array (n, KEY_SIZE) of compact keys.
+    :param weights: The weights, see fit().
+    :return: A float array (n,).
+    """
+    return _evaluate_all(features(keys), weights)
+
+
+MODULE_TEMPLATE = '''"""
+Evaluation function tuned by analysis/tuning.py on {positions} positions, with
+a mean squared prediction error of {error:.6f}. Written by boxshogi.py -tune: tune
+again rather than editing the values.
+"""
+from game_items.gamevars import BOARD_SIZE
+
+TUNED_BOARD_SIZE = {board_size}
+if BOARD_SIZE != TUNED_BOARD_SIZE:
+    raise ImportError(f"Evaluation tuned for a {{TUNED_BOARD_SIZE}}x{{TUNED_BOARD_SIZE}} board")
+
+# Win probability of the player to move: 1 / (1 + exp(-SCALE * evaluate(...)))
+SCALE = {scale!r}
+
+# Value of every piece string on every square, indexed x * BOARD_SIZE + y: material,
+# promotion bonus and piece-square value, negative for UPPER's pieces
+SQUARE_VALUES = {square_values}
+
+# Value of a piece in hand, by letter
+HAND_VALUES = {hand_values}
+
+# Value of having the move
+TEMPO = {tempo!r}
+
+
+def evaluate_squares(squares, upper_hand, lower_hand, side):
+    """
+    Evaluate a position given as in game_items.position.Position.
+
+    :param squares: The piece strings of the squares, indexed x * BOARD_SIZE + y.
+    :param upper_hand: The pieces captured by UPPER.
+    :param lower_hand: The pieces captured by lower.
+    :param side: The player to move, "lower" or "UPPER".
+    :return: The evaluation for the player to move, in material units.
+    """
+    score = TEMPO if side == "lower" else -TEMPO
+    for index, piece_repr in enumerate(squares):
+        if piece_repr:
+            score += SQUARE_VALUES[piece_repr][index]
+    for piece in lower_hand:
+        score += HAND_VALUES[str(piece)[-1].lower()]
+    for piece in upper_hand:
+        score -= HAND_VALUES[str(piece)[-1].lower()]
+    return score if side == "lower" else -score
+
+
+def evaluate(board, upper, lower, cur_player):
+    """
+    Evaluate the state of a FileGame or InteractiveGame.
+
+    :param board: The Board.
+    :param upper: The UPPER Player.
+    :param lower: The lower Player.
+    :param cur_player: The Player to move.
+    :return: The evaluation for the player to move, in material units.
+    """
+    squares = [board.board[x][y] for x in range(BOARD_SIZE) for y in range(BOARD_SIZE)]
+    return evaluate_squares(squares, upper.get_captured(), lower.get_captured(), cur_player.get_name())
+'''
+
+
+def write_module(path, weights, scale, positions=0, error=0.0):
+    """
+    Write tuned weights as a Python module with no dependencies, see MODULE_TEMPLATE.
+
+    :param path: The .py file to write.
+    :param weights: The weights, see fit().
+    :param scale: The evaluation scale.
+    :param positions: The number of positions tuned on, for the docstring.
+    :param error: The final error, for the docstring.
+    """
+    sign, material, bonus, table = _code_tables()
+    square_values = {}
+    for piece_repr in PIECE_REPRS:
+        code = PIECE_CODES[piece_repr]
+        base = 0.0
+        if material[code] >= 0:
+            base += weights[material[code]]
+        if bonus[code] >= 0:
+            base += weights[bonus[code]]
+        values = []
+        for square in range(NUM_SQUARES):
+            relative = square if sign[code] > 0 else flip_square(square)
+            value = base + weights[PST + table[code] * NUM_SQUARES + relative]
+            values.append(round(float(sign[code] * value), 4))
+        square_values[piece_repr] = values
+    hand_values = {letter: round(float(weights[HAND + i]), 4) for i, letter in enumerate(HAND_LETTERS)}
+    lines = ["{"] + [f"    {piece_repr!r}: {values!r}," for piece_repr, values in square_values.items()] + ["}"]
+    with open(path, "w") as f:
+        f.write(MODULE_TEMPLATE.format(positions=positions, error=error, board_size=BOARD_SIZE,
+                                       scale=round(float(scale), 6), square_values="\n".join(lines),
+                                       hand_values=repr(hand_values), tempo=round(float(weights[TEMPO]), 4)))
+
+
+def run_tune_mode(paths, module_path, iterations=DEFAULT_ITERATIONS):
+    """
+    Tune an evaluation function on game files and write it as a Python module.
+    """
+    keys, labels = extract_positions(paths, progress=print)
+    matrix = features(keys)
+    weights, scale, error = fit(matrix, labels, iterations=iterations, progress=print)
+    write_module(module_path, weights, scale, len(labels), error)
+    print("Material:", " ".join(f"{letter}={weights[MATERIAL + i]:.2f}" for i, letter in enumerate(HAND_LETTERS)))
+    print("Promotion:", " ".join(f"{letter}={weights[BONUS + i]:.2f}" for i, letter in enumerate(BONUS_LETTERS)))
+    print("Hand:", " ".join(f"{letter}={weights[HAND + i]:.2f}" for i, letter in enumerate(HAND_LETTERS)))
+    print(f"Wrote {module_path}, error {error:.6f} on {len(labels)} positions.")
@@ -1,17 +1,222 @@
+import os
 import sys
-from game_modes.filegame import FileGame
-from game_modes.interactivegame import InteractiveGame
+if '-size' in sys.argv:
+    # The board size must be known before the game modules are imported, e.g. -size 7 -i
+    size_arg = sys.argv.index('-size')
+    os.environ['BOXSHOGI_BOARD_SIZE'] = sys.argv[size_arg + 1]
+    del sys.argv[size_arg:size_arg + 2]
+# Every mode imports its modules in its own branch, so that file and interactive mode
+# start without loading numpy, multiprocessing or the analysis tools.
 def main():
     """
     Main function to read terminal input
     """
     if sys.argv[1] == '-f':
-        file_mode = FileGame()
+        from game_modes.filegame import FileGame
+        tablebase = None
+        if '-tb' in sys.argv[3:]:
+            from analysis.tablebase import TablebaseSet
+            tablebase = TablebaseSet(sys.argv[sys.argv.index('-tb') + 1])
+        file_mode = FileGame(tablebase, repetition_rule='-rep' in sys.argv[3:])
         file_mode.run_game_file_mode(sys.argv[2])
 
+    if sys.argv[1] == '-batch':
+        # e.g. -batch games/ more/*.in [-out outputs/] [-tb dir] [-rep], sharing common move prefixes
+        from game_modes.batchgame import run_batch_mode
+        args = sys.argv[2:]
+        out_dir = tablebase = None
+        if '-out' in args:
+            out_dir = args[args.index('-out') + 1]
+        if '-tb' in args:
+            from analysis.tablebase import TablebaseSet
+            tablebase = TablebaseSet(args[args.index('-tb') + 1])
+        paths = [arg for i, arg in enumerate(args)
+                 if not arg.startswith('-') and (i == 0 or args[i - 1] not in ('-out', '-tb'))]
+        run_batch_mode(paths, out_dir, tablebase, repetition_rule='-rep' in args)
+
+    if sys.argv[1] in ('-validate', '-coordinator'):
+        # e.g. -validate games/ [-workers 8] [-batch 16] [-out outputs/] on this machine, or
+        # -coordinator 0.0.0.0:9100 games/ [-batch 16] [-out outputs/] with -worker host:9100 on every host
+        from game_modes.workqueue import run_validate_mode, run_coordinator_mode, DEFAULT_BATCH_SIZE
+        args = sys.argv[2:] if sys.argv[1] == '-validate' else sys.argv[3:]
+        options = {}
+        for flag in ('-workers', '-batch', '-out'):
+            if flag in args:
+                options[flag] = args[args.index(flag) + 1]
+                del args[args.index(flag):args.index(flag) + 2]
+        batch_size = int(options.get('-batch', DEFAULT_BATCH_SIZE))
+        if sys.argv[1] == '-validate':
+            workers = int(options['-workers']) if '-workers' in options else None
+            run_validate_mode(args, workers, batch_size, options.get('-out'))
+        else:
+            run_coordinator_mode(sys.argv[2], args, batch_size, options.get('-out'))
+
+    if sys.argv[1] == '-worker':
+        from game_modes.workqueue import run_worker
+        run_worker(sys.argv[2])
+
     if sys.argv[1] == '-i':
-        interactive_mode = InteractiveGame()
-        interactive_mode.start_interactive_game()
+        from game_modes.interactivegame import InteractiveGame
+        broadcaster = None
+        if '-broadcast' in sys.argv[2:]:
+            # e.g. -i -broadcast /tmp/game.sock, watched with -watch /tmp/game.sock
+            from game_modes.spectate import Broadcaster
+            broadcaster = Broadcaster(sys.argv[sys.argv.index('-broadcast') + 1])
+        book = None
+        if '-book' in sys.argv[2:]:
+            # e.g. -i -book openings.bk [-bookside lower], the book replying for UPPER by default
+            from analysis.book import OpeningBook
+            book = OpeningBook(sys.argv[sys.argv.index('-book') + 1])
+        book_side = sys.argv[sys.argv.index('-bookside') + 1] if '-bookside' in sys.argv[2:] else 'UPPER'
+        interactive_mode = InteractiveGame(repetition_rule='-rep' in sys.argv[2:], ponder='-ponder' in sys.argv[2:],
+                                           broadcaster=broadcaster, book=book, book_side=book_side)
+        try:
+            interactive_mode.start_interactive_game()
+        finally:
+            if broadcaster is not None:
+                broadcaster.close()
+            if book is not None:
+                book.close()
+
+    if sys.argv[1] == '-watch':
+        # e.g. -watch /tmp/game.sock or -watch localhost:9000
+        from game_modes.spectate import run_watch_mode
+        run_watch_mode(sys.argv[2])
+
+    if sys.argv[1] == '-tbgen':
+        # e.g. -tbgen r,s,g tables/ writes tables/r.tb, tables/s.tb and tables/g.tb
+        from analysis.tablebase import generate
+        os.makedirs(sys.argv[3], exist_ok=True)
+        for material in sys.argv[2].split(','):
+            generate(material, os.path.join(sys.argv[3], material + '.tb'), progress=print)
+
+    if sys.argv[1] == '-bookgen':
+        # e.g. -bookgen openings.bk games/ more/*.in [-plies 12]
+        from analysis.book import run_book_mode, DEFAULT_PLIES
+        args = sys.argv[3:]
+        plies = DEFAULT_PLIES
+        if '-plies' in args:
+            plies = int(args[args.index('-plies') + 1])
+            del args[args.index('-plies'):args.index('-plies') + 2]
+        run_book_mode(sys.argv[2], args, plies)
+
+    if sys.argv[1] == '-probe':
+        # e.g. -probe openings.bk 'NGRSD/4P/5/p4/dsrgn l -' or -probe openings.bk game.in
+        from game_items.position import Position
+        from analysis.book import run_probe_mode
+        if os.path.exists(sys.argv[3]):
+            position = Position.from_file(sys.argv[3])
+        else:
+            position = Position.from_sfen(sys.argv[3])
+        run_probe_mode(sys.argv[2], position)
+
+    if sys.argv[1] == '-mate':
+        # e.g. -mate 3 puzzle.in [-checks]
+        from analysis.matesolver import run_mate_mode
+        run_mate_mode(sys.argv[3], int(sys.argv[2]), checks_only='-checks' in sys.argv[4:])
+
+    if sys.argv[1] == '-mcts':
+        # e.g. -mcts game.in [-seconds 5] [-workers 8] [-playout greedy]
+        from analysis.mcts import run_mcts_mode
+        args = sys.argv[3:]
+        seconds = float(args[args.index('-seconds') + 1]) if '-seconds' in args else 1.0
+        workers = int(args[args.index('-workers') + 1]) if '-workers' in args else None
+        playout = args[args.index('-playout') + 1] if '-playout' in args else 'random'
+        run_mcts_mode(sys.argv[2], seconds, workers, playout)
+
+    if sys.argv[1] == '-tournament':
+        # e.g. -tournament 1000 games/ random greedy [-workers 8]
+        from game_modes.tournament import run_tournament_mode
+        args = sys.argv[4:]
+        workers = None
+        if '-workers' in args:
+            workers = int(args[args.index('-workers') + 1])
+            args = args[:args.index('-workers')]
+        run_tournament_mode(int(sys.argv[2]), sys.argv[3], args or ['random', 'greedy'], workers)
+
+    if sys.argv[1] == '-daemon':
+        # e.g. -daemon /tmp/boxshogi.sock [-workers 8], then boxshogi_client.py -f game.in
+        from game_modes.daemon import run_daemon, DEFAULT_SOCKET
+        args = sys.argv[2:]
+        workers = None
+        if '-workers' in args:
+            workers = int(args[args.index('-workers') + 1])
+            args = args[:args.index('-workers')]
+        run_daemon(args[0] if args else DEFAULT_SOCKET, workers)
+
+    if sys.argv[1] == '-bench':
+        # e.g. -bench 5,7,9
+        from analysis.benchmark import run_benchmarks
+        sizes = [int(size) for size in sys.argv[2].split(',')] if len(sys.argv) > 2 else [5, 7, 9]
+        run_benchmarks(sizes)
+
+    if sys.argv[1] == '-sfen':
+        # Prints the position reached at the end of a game file as a one-line string
+        from game_items.position import Position
+        print(Position.from_file(sys.argv[2]).to_sfen())
+
+    if sys.argv[1] == '-see':
+        # e.g. -see game.in lists the moves that win or lose material on an exchange
+        from analysis.see import run_see_mode
+        run_see_mode(sys.argv[2])
+
+    if sys.argv[1] == '-seek':
+        # e.g. -seek game.in 350 shows the board after 350 plies, keeping keyframes in game.in.kf
+        from analysis.keyframes import run_seek_mode
+        run_seek_mode(sys.argv[2], int(sys.argv[3]))
+
+    if sys.argv[1] == '-index':
+        # e.g. -index games.idx games/ more/*.in, adding only files not indexed yet
+        from analysis.positionindex import run_index_mode
+        run_index_mode(sys.argv[2], sys.argv[3:])
+
+    if sys.argv[1] == '-lookup':
+        # e.g. -lookup games.idx 'NGRSD/4P/5/p4/dsrgn l -' or -lookup games.idx game.in
+        from game_items.position import Position
+        from analysis.positionindex import run_lookup_mode
+        if os.path.exists(sys.argv[3]):
+            position = Position.from_file(sys.argv[3])
+        else:
+            position = Position.from_sfen(sys.argv[3])
+        run_lookup_mode(sys.argv[2], position)
+
+    if sys.argv[1] == '-store':
+        # e.g. -store archive.cols games/ more/*.in, adding only files not stored yet
+        from analysis.columnstore import run_store_mode
+        run_store_mode(sys.argv[2], sys.argv[3:])
+
+    if sys.argv[1] == '-stats':
+        # e.g. -stats archive.cols prints win rates by first move, game lengths and capture counts
+        from analysis.columnstore import run_stats_mode
+        run_stats_mode(sys.argv[2])
+
+    if sys.argv[1] == '-export':
+        # e.g. -export shards/ games/ [-shard 16384], writing numpy training shards
+        from analysis.export import run_export_mode, DEFAULT_SHARD_SIZE
+        args = sys.argv[3:]
+        shard_size = DEFAULT_SHARD_SIZE
+        if '-shard' in args:
+            shard_size = int(args[args.index('-shard') + 1])
+            del args[args.index('-shard'):args.index('-shard') + 2]
+        run_export_mode(args, sys.argv[2], shard_size)
+
+    if sys.argv[1] == '-tune':
+        # e.g. -tune tuned_eval.py games/ more/*.in [-iterations 200], writing an evaluation module
+        from analysis.tuning import run_tune_mode, DEFAULT_ITERATIONS
+        args = sys.argv[3:]
+        iterations = DEFAULT_ITERATIONS
+        if '-iterations' in args:
+            iterations = int(args[args.index('-iterations') + 1])
+            del args[args.index('-iterations'):args.index('-iterations') + 2]
+        run_tune_mode(args, sys.argv[2], iterations)
+
+    if sys.argv[1] == '-fuzz':
+        # e.g. -fuzz 100000 [-workers 8] [-seed 0], comparing FileGame with Position
+        from analysis.fuzz import run_fuzz_mode
+        args = sys.argv[3:]
+        workers = int(args[args.index('-workers') + 1]) if '-workers' in args else None
+        seed = int(args[args.index('-seed') + 1]) if '-seed' in args else 0
+        run_fuzz_mode(int(sys.argv[2]), workers, seed)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
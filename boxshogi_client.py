@@ -0,0 +1,42 @@
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET = os.environ.get("BOXSHOGI_SOCKET", "/tmp/boxshogi.sock")
+
+
+def main():
+    """
+    Minimal client for the boxshogi.py -daemon server. Prints exactly what
+    `python boxshogi.py -f <file>` would print.
+
+    Usage: boxshogi_client.py -f <file> [-s socket]
+           boxshogi_client.py -t [-s socket] < game.in   (send the game text itself)
+    """
+    args = sys.argv[1:]
+    socket_path = DEFAULT_SOCKET
+    if '-s' in args:
+        socket_path = args[args.index('-s') + 1]
+
+    if args[0] == '-f':
+        request = "path\n" + os.getcwd() + "\n" + args[1]
+    elif args[0] == '-t':
+        request = "text\n" + sys.stdin.read()
+    else:
+        sys.exit("Usage: boxshogi_client.py -f <file> | -t [-s socket]")
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    client.sendall(request.encode())
+    client.shutdown(socket.SHUT_WR)
+    out = sys.stdout.buffer
+    while True:
+        chunk = client.recv(65536)
+        if not chunk:
+            break
+        out.write(chunk)
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
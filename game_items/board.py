@@ -8,29 +8,39 @@ from pieces.relay import Relay
 from pieces.preview import Preview
 from game_items.gamevars import BOARD_SIZE
 
+# The eight directions every piece moves along, as (dx, dy)
+DIRECTIONS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
 class Board:
     """
     Class that represents the BoxShogi board
     """
     
     def __init__(self):
-        # Initialize an empty 5x5 board
+        # Initialize an empty BOARD_SIZE x BOARD_SIZE board
         self.board = [["" for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+        # (x, y) -> (piece string, moves) of the pieces whose moves were generated
+        self.move_cache = {}
     
     def init_pieces(self):
         """
         Initialize the board with pieces in their starting positions.
+
+        Every board size uses the 5x5 setup: lower's six pieces on a1-e1 and a2, and
+        UPPER's mirrored into the opposite corner. On larger boards the pieces stay in
+        the corners, with empty squares between the two setups.
         """
-        # Mapping of starting positions and corresponding pieces
+        # Mapping of lower's starting positions. UPPER's pieces mirror them through the centre of the board.
         starting_positions = {
             'a1': Drive("d"), 'e1': Notes("n"), 'd1': Governance("g"),
-            'b1': Shield("s"), 'c1': Relay("r"), 'a2': Preview("p"),
-            'e5': Drive("D"), 'a5': Notes("N"), 'b5': Governance("G"),
-            'd5': Shield("S"), 'c5': Relay("R"), 'e4': Preview("P")
+            'b1': Shield("s"), 'c1': Relay("r"), 'a2': Preview("p")
         }
 
         for loc, piece in starting_positions.items():
-            self.set_piece(Loc(loc[0], int(loc[1])), piece)
+            lower_loc = Loc(loc[0], int(loc[1]))
+            self.set_piece(lower_loc, piece)
+            upper_piece = self._create_piece_from_repr(str(piece).upper())
+            self.set_piece(Loc(BOARD_SIZE - 1 - lower_loc.get_x(), BOARD_SIZE - 1 - lower_loc.get_y()), upper_piece)
 
         
     def _create_piece_from_repr(self, piece_repr):
@@ -85,6 +95,7 @@ class Board:
         """
         if self.is_valid_loc(loc):
             self.board[loc.get_x()][loc.get_y()] = str(piece)
+            self._invalidate_moves(loc.get_x(), loc.get_y())
         else:
             raise ValueError("Invalid location for placing a piece " + piece + " at location " + loc)
     
@@ -96,9 +107,87 @@ class Board:
         """
         if self.is_valid_loc(loc):
             self.board[loc.get_x()][loc.get_y()] = ""
+            self._invalidate_moves(loc.get_x(), loc.get_y())
         else:
             raise ValueError("Invalid location for removing a piece at location " + loc)
     
+    def piece_moves(self, x, y):
+        """
+        Return the moves of the piece on a square, as its make_moves() generates them.
+
+        Moves are cached per square and kept until a square the piece can reach or
+        is blocked by changes through set_piece() or remove_piece(). Code writing to
+        self.board directly must call clear_move_cache(). The returned list is shared
+        with the cache and must not be modified.
+
+        :param x: The x-coordinate (column).
+        :param y: The y-coordinate (row).
+        :return: A list of Loc objects, empty for an empty square.
+        """
+        piece_repr = self.board[x][y]
+        cached = self.move_cache.get((x, y))
+        if cached is not None and cached[0] == piece_repr:
+            return cached[1]
+        piece = self._create_piece_from_repr(piece_repr)
+        if piece is None:
+            return []
+        piece.make_moves(self, Loc(x, y))
+        moves = piece.get_moves()
+        self.move_cache[(x, y)] = (piece_repr, moves)
+        return moves
+
+    def clear_move_cache(self):
+        """
+        Forget every cached move list, after the board was changed without set_piece() or remove_piece().
+        """
+        self.move_cache = {}
+
+    def _invalidate_moves(self, x, y):
+        """
+        Forget the cached moves that may change when a square changes: those of the
+        piece on the square and of the nearest piece in each of the eight directions.
+        Every piece moves along these directions, one step or sliding, so the moves
+        of a piece further away cannot depend on the square.
+
+        :param x: The x-coordinate (column) of the square that changed.
+        :param y: The y-coordinate (row) of the square that changed.
+        """
+        cache = self.move_cache
+        if not cache:
+            return
+        cache.pop((x, y), None)
+        for dx, dy in DIRECTIONS:
+            tx, ty = x + dx, y + dy
+            while 0 <= tx < BOARD_SIZE and 0 <= ty < BOARD_SIZE:
+                if self.board[tx][ty]:
+                    cache.pop((tx, ty), None)
+                    break
+                tx, ty = tx + dx, ty + dy
+
+    def is_attacked(self, loc, by_upper):
+        """
+        Check if any piece of a player can move to a square.
+
+        As in _invalidate_moves(), only the nearest piece in each of the eight
+        directions from the square can reach it, so only those pieces are asked for
+        their moves, through the move cache.
+
+        :param loc: A Loc object for the square.
+        :param by_upper: True to look at UPPER's pieces, False for lower's.
+        :return: True if the square is attacked.
+        """
+        x, y = loc.get_x(), loc.get_y()
+        for dx, dy in DIRECTIONS:
+            tx, ty = x + dx, y + dy
+            while 0 <= tx < BOARD_SIZE and 0 <= ty < BOARD_SIZE:
+                piece_repr = self.board[tx][ty]
+                if piece_repr:
+                    if piece_repr[-1].isupper() == by_upper and loc in self.piece_moves(tx, ty):
+                        return True
+                    break
+                tx, ty = tx + dx, ty + dy
+        return False
+
     def is_capturable(self, x, y, piece):
         """
         Determines if a piece at a given location can be captured by another piece.
@@ -184,7 +273,7 @@ class Board:
 
             s += os.linesep
 
-        s += '    a  b  c  d  e' + os.linesep
+        s += '    ' + '  '.join(chr(ord('a') + col) for col in range(len(self.board))) + os.linesep
         return s
 
     def _stringifySquare(self, sq):
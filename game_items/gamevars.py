@@ -1,2 +1,13 @@
-BOARD_SIZE = 5
-MOVE_LIMIT = 400 #200 each
\ No newline at end of file
+import os
+
+# Board geometry is read once, when the game modules are first imported.
+# Set BOXSHOGI_BOARD_SIZE (5 to 9) and BOXSHOGI_PROMOTION_ZONE (rows) to play larger variants.
+# Larger variants start from the 5x5 setup in the corners (see Board.init_pieces).
+BOARD_SIZE = int(os.environ.get("BOXSHOGI_BOARD_SIZE", 5))
+PROMOTION_ZONE = int(os.environ.get("BOXSHOGI_PROMOTION_ZONE", 1))
+MOVE_LIMIT = 400 #200 each
+
+if not 5 <= BOARD_SIZE <= 9:
+    raise ValueError("Board size must be between 5 and 9")
+if not 1 <= PROMOTION_ZONE <= BOARD_SIZE // 2:
+    raise ValueError("Promotion zone must be between 1 and half the board size")
@@ -1,5 +1,4 @@
-from game_items.loc import Loc
-from game_items.gamevars import BOARD_SIZE
+from game_items.gamevars import BOARD_SIZE, PROMOTION_ZONE
 
 class Player:
     """
@@ -73,13 +72,23 @@ class Player:
 
     def piece_in_promote_row(self, loc):
         """
-        Checks if a piece is in its promotion row on the board.
+        Checks if a piece is in its promotion zone on the board, the PROMOTION_ZONE rows furthest from the player.
 
         :param loc: The location of the piece.
-        :return: True if the piece is in its promotion row, False otherwise.
+        :return: True if the piece is in its promotion zone, False otherwise.
         """
         
-        return (self.name == "UPPER" and loc.get_y() == 0) or (self.name == "lower" and loc.get_y() == 4)
+        return ((self.name == "UPPER" and loc.get_y() < PROMOTION_ZONE) or
+                (self.name == "lower" and loc.get_y() >= BOARD_SIZE - PROMOTION_ZONE))
+
+    def piece_in_last_row(self, loc):
+        """
+        Checks if a piece is in the row furthest from the player, where a Preview must promote.
+
+        :param loc: The location of the piece.
+        :return: True if the piece is in the last row, False otherwise.
+        """
+        return (self.name == "UPPER" and loc.get_y() == 0) or (self.name == "lower" and loc.get_y() == BOARD_SIZE - 1)
 
 
     def captured_piece(self, name):
@@ -98,16 +107,17 @@ class Player:
         """
         Computes all possible moves for the player's pieces on the board.
 
+        Moves come from the board's per-square cache, so only pieces near the squares
+        changed since the last call are asked for their moves again.
+
         :param board: The game board.
         :return: A list of all possible moves.
         """
+        upper = self.name == "UPPER"
         all_moves_list = []
         for r in range(BOARD_SIZE):
             for c in range(BOARD_SIZE):
-                piece = board.get_piece(r, c)
-                if piece is None:
-                    continue
-                if piece.belongs_to(self):
-                    piece.make_moves(board, Loc(r, c))
-                    all_moves_list.extend(piece.get_moves())  
+                piece_repr = board.board[r][c]
+                if piece_repr and piece_repr[-1].isupper() == upper:
+                    all_moves_list.extend(board.piece_moves(r, c))
         return all_moves_list
@@ -0,0 +1,797 @@
+from utils import parseTestCase
+from game_items.gamevars import BOARD_SIZE, MOVE_LIMIT, PROMOTION_ZONE
+from game_items.loc import Loc
+from game_items.board import Board
+
+NUM_SQUARES = BOARD_SIZE * BOARD_SIZE
+
+# Every string a square of the board can hold
+PIECE_REPRS = ["d", "n", "+n", "g", "+g", "s", "r", "+r", "p", "+p",
+               "D", "N", "+N", "G", "+G", "S", "R", "+R", "P", "+P"]
+
+# One byte per square in compact keys: 0 for empty, then PIECE_REPRS in order
+PIECE_CODES = {piece_repr: code for code, piece_repr in enumerate([""] + PIECE_REPRS)}
+
+# Piece letters that can be held in hand
+HAND_LETTERS = "ngsrp"
+
+# Order of pieces in the hands of a position string
+SFEN_HAND_ORDER = "NGSRPngsrp"
+
+# Unpromoted pieces that are allowed to promote
+PROMOTABLE = {"n", "g", "r", "p", "N", "G", "R", "P"}
+
+
+def square_index(x, y):
+    """
+    Convert board coordinates to an index into a flat list of squares.
+
+    :param x: The x-coordinate (column).
+    :param y: The y-coordinate (row).
+    :return: The index of the square, matching Board.board[x][y].
+    """
+    return x * BOARD_SIZE + y
+
+
+def square_name(index):
+    """
+    Convert a square index into its name, e.g. 'a1'.
+
+    :param index: The index of the square.
+    :return: The name of the square.
+    """
+    return chr(ord('a') + index // BOARD_SIZE) + str(index % BOARD_SIZE + 1)
+
+
+def parse_square(name):
+    """
+    Convert a square name such as 'c3' into a square index.
+
+    :param name: The name of the square.
+    :return: The index of the square.
+    """
+    return square_index(ord(name[0]) - ord('a'), int(name[1:]) - 1)
+
+
+def is_upper_piece(piece_repr):
+    """
+    Check if a piece string belongs to the UPPER player.
+
+    :param piece_repr: The string representation of the piece, e.g. '+R'.
+    :return: True if the piece is UPPER's, False otherwise.
+    """
+    return piece_repr[-1].isupper()
+
+
+def in_promote_row(index, upper):
+    """
+    Check if a square is in the promotion zone of a player.
+
+    :param index: The index of the square.
+    :param upper: True for the UPPER player, False for lower.
+    :return: True if the square is in that player's promotion zone.
+    """
+    row = index % BOARD_SIZE
+    return row < PROMOTION_ZONE if upper else row >= BOARD_SIZE - PROMOTION_ZONE
+
+
+def in_last_row(index, upper):
+    """
+    Check if a square is in the row furthest from a player, where a Preview must promote.
+
+    :param index: The index of the square.
+    :param upper: True for the UPPER player, False for lower.
+    :return: True if the square is in that player's last row.
+    """
+    row = index % BOARD_SIZE
+    return row == 0 if upper else row == BOARD_SIZE - 1
+
+
+def flip_square(index):
+    """
+    Rotate a square by 180 degrees around the centre of the board, e.g. a1 to e5 on a 5x5 board.
+
+    :param index: The index of the square.
+    :return: The index of the rotated square.
+    """
+    return NUM_SQUARES - 1 - index
+
+
+def flip_move(move):
+    """
+    Rotate the squares of a move by 180 degrees. Moves do not name the player making
+    them, so this is the move of the other player that matches it on the flipped
+    position, see Position.flipped(). Flipping a move twice gives it back.
+
+    :param move: A move string such as 'move a1 a2 promote' or 'drop p c3'.
+    :return: The flipped move string.
+    """
+    split = move.split()
+    if split[0] == "drop":
+        return f"drop {split[1]} {square_name(flip_square(parse_square(split[2])))}"
+    split[1] = square_name(flip_square(parse_square(split[1])))
+    split[2] = square_name(flip_square(parse_square(split[2])))
+    return " ".join(split)
+
+
+def _build_move_tables():
+    """
+    Derive the movement of every piece on every square from the classes in pieces/.
+
+    Each piece is placed on an otherwise empty board and asked for its moves.
+    Destinations are grouped by direction into rays, ordered from nearest to
+    furthest, so that blocking can be applied when the board is not empty.
+
+    :return: A tuple (rays, lines). rays[piece][square] is a list of rays, and
+        lines[piece][square] maps each reachable square to the squares in between.
+    """
+    board = Board()
+    rays = {}
+    lines = {}
+    for piece_repr in PIECE_REPRS:
+        piece = board._create_piece_from_repr(piece_repr)
+        rays[piece_repr] = []
+        lines[piece_repr] = []
+        for x in range(BOARD_SIZE):
+            for y in range(BOARD_SIZE):
+                piece.make_moves(board, Loc(x, y))
+                by_direction = {}
+                for move in piece.get_moves():
+                    dx, dy = move.get_x() - x, move.get_y() - y
+                    if dx != 0 and dy != 0 and abs(dx) != abs(dy):
+                        raise ValueError(piece_repr + " moves off the eight board directions")
+                    step = max(abs(dx), abs(dy))
+                    direction = (dx // step, dy // step)
+                    by_direction.setdefault(direction, []).append((step, square_index(move.get_x(), move.get_y())))
+
+                square_rays = []
+                square_lines = {}
+                for direction in sorted(by_direction):
+                    ray = [index for _, index in sorted(by_direction[direction])]
+                    square_rays.append(ray)
+                    for distance, index in enumerate(ray):
+                        square_lines[index] = tuple(ray[:distance])
+                rays[piece_repr].append(square_rays)
+                lines[piece_repr].append(square_lines)
+    return rays, lines
+
+
+
+def _build_direction_masks():
+    """
+    For every square, build one bitboard per direction holding the squares along it.
+
+    Bit i of a bitboard stands for square index i. The flag tells whether square
+    indices grow along the direction, so that the nearest occupied square is the
+    lowest set bit of (occupied & mask) rather than the highest.
+
+    :return: A list, per square, of (mask, increasing) pairs.
+    """
+    masks = []
+    for index in range(NUM_SQUARES):
+        x, y = index // BOARD_SIZE, index % BOARD_SIZE
+        square_masks = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx == 0 and dy == 0:
+                    continue
+                mask = 0
+                tx, ty = x + dx, y + dy
+                while 0 <= tx < BOARD_SIZE and 0 <= ty < BOARD_SIZE:
+                    mask |= 1 << square_index(tx, ty)
+                    tx, ty = tx + dx, ty + dy
+                if mask:
+                    square_masks.append((mask, dx * BOARD_SIZE + dy > 0))
+        masks.append(square_masks)
+    return masks
+
+
+_TABLES = None
+
+
+def move_tables():
+    """
+    Return the move tables, building them on first use: file mode only needs
+    positions for printing, and should not pay for the tables at startup.
+
+    :return: A tuple (RAYS, LINES, DIRECTION_MASKS), see _build_move_tables() and
+        _build_direction_masks().
+    """
+    global _TABLES
+    if _TABLES is None:
+        rays, lines = _build_move_tables()
+        _TABLES = (rays, lines, _build_direction_masks())
+    return _TABLES
+
+
+def __getattr__(name):
+    """
+    Let RAYS, LINES and DIRECTION_MASKS be imported from this module as if they were
+    built at import time.
+    """
+    if name in ("RAYS", "LINES", "DIRECTION_MASKS"):
+        return move_tables()[("RAYS", "LINES", "DIRECTION_MASKS").index(name)]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class Position:
+    """
+    A lightweight snapshot of a BoxShogi game: board, hands and side to move.
+
+    Squares are kept in a flat list indexed by x * BOARD_SIZE + y, holding the same
+    strings as Board.board, along with an integer bitboard of the occupied squares.
+    Change squares through put() so that both stay in step. Hands hold piece letters
+    in capture order, with the case of the owning player. Moves use the same text
+    format as file mode.
+    """
+
+    def __init__(self, squares=None, upper_hand=(), lower_hand=(), side="lower"):
+        """
+        Initialize a position.
+
+        :param squares: A list of NUM_SQUARES piece strings ("" for an empty square).
+        :param upper_hand: Pieces captured by UPPER, e.g. ['R', 'P'].
+        :param lower_hand: Pieces captured by lower, e.g. ['g'].
+        :param side: The player to move, "lower" or "UPPER".
+        """
+        self.squares = list(squares) if squares is not None else [""] * NUM_SQUARES
+        self.upper_hand = list(upper_hand)
+        self.lower_hand = list(lower_hand)
+        self.side = side
+        self.occupied = 0
+        for index, piece_repr in enumerate(self.squares):
+            if piece_repr:
+                self.occupied |= 1 << index
+
+    @classmethod
+    def from_game(cls, game):
+        """
+        Build a position from a FileGame or InteractiveGame.
+
+        :param game: The game to read the board, captures and current player from.
+        :return: A new Position.
+        """
+        squares = [game.board.board[x][y] for x in range(BOARD_SIZE) for y in range(BOARD_SIZE)]
+        upper_hand = [str(p).lstrip("+").upper() for p in game.upper.get_captured()]
+        lower_hand = [str(p).lstrip("+").lower() for p in game.lower.get_captured()]
+        return cls(squares, upper_hand, lower_hand, game.cur_player.get_name())
+
+    @classmethod
+    def from_setup(cls, game_setup, side="lower"):
+        """
+        Build a position from the dictionary returned by utils.parseTestCase.
+
+        :param game_setup: The parsed test case.
+        :param side: The player to move.
+        :return: A new Position.
+        """
+        position = cls(side=side)
+        for piece in game_setup['initialPieces']:
+            position.put(parse_square(piece['position']), piece['piece'])
+        position.upper_hand = [p.lstrip("+").upper() for p in game_setup['upperCaptures']]
+        position.lower_hand = [p.lstrip("+").lower() for p in game_setup['lowerCaptures']]
+        return position
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load a test case with utils.parseTestCase and play its moves, reading them as
+        file mode does. Play stops at the first illegal move, where file mode would end
+        the game.
+
+        :param path: Path to the test case file.
+        :return: The Position reached before the first illegal move, or after all of them.
+        """
+        for _, position, _ in replay_setup(parseTestCase(path)):
+            pass
+        return position
+
+    @classmethod
+    def from_sfen(cls, text):
+        """
+        Parse a one-line position string written by to_sfen().
+
+        :param text: The position string, e.g. 'NGRSD/4P/5/p4/dsrgn l -'.
+        :return: A new Position.
+        """
+        board_part, side, hands = text.split()
+        position = cls.__new__(cls)
+        squares = [""] * NUM_SQUARES
+        occupied = 0
+        x, y = 0, BOARD_SIZE - 1
+        promoted = ""
+        for char in board_part:
+            if char == "/":
+                if x != BOARD_SIZE:
+                    raise ValueError("Bad rank in position string: " + text)
+                x, y = 0, y - 1
+            elif char.isdigit():
+                x += int(char)
+            elif char == "+":
+                promoted = "+"
+            else:
+                index = x * BOARD_SIZE + y
+                squares[index] = promoted + char
+                occupied |= 1 << index
+                promoted = ""
+                x += 1
+        if x != BOARD_SIZE or y != 0:
+            raise ValueError("Bad board size in position string: " + text)
+
+        upper_hand, lower_hand = [], []
+        count = 0
+        for char in hands if hands != "-" else "":
+            if char.isdigit():
+                count = count * 10 + int(char)
+                continue
+            (upper_hand if char.isupper() else lower_hand).extend([char] * (count or 1))
+            count = 0
+
+        position.squares = squares
+        position.occupied = occupied
+        position.upper_hand = upper_hand
+        position.lower_hand = lower_hand
+        position.side = "UPPER" if side == "u" else "lower"
+        return position
+
+    def to_sfen(self):
+        """
+        Write the position as a one-line string in the style of SFEN: the ranks from
+        the top of the board down, separated by '/', with digits counting empty squares;
+        'l' or 'u' for the player to move; and both hands with counts, '-' if empty.
+        Hands are written in a fixed order, so capture order is not kept.
+
+        :return: The position string, e.g. 'NGRSD/4P/5/p4/dsrgn l -'.
+        """
+        squares = self.squares
+        ranks = []
+        for y in range(BOARD_SIZE - 1, -1, -1):
+            rank = ""
+            empty = 0
+            for index in range(y, NUM_SQUARES, BOARD_SIZE):
+                piece_repr = squares[index]
+                if piece_repr:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += piece_repr
+                else:
+                    empty += 1
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        hand = self.upper_hand + self.lower_hand
+        hands = ""
+        for letter in SFEN_HAND_ORDER:
+            count = hand.count(letter)
+            if count:
+                hands += (str(count) if count > 1 else "") + letter
+        return "/".join(ranks) + (" u " if self.side == "UPPER" else " l ") + (hands or "-")
+
+    def apply_to(self, game):
+        """
+        Load this position into a FileGame or InteractiveGame, replacing its state.
+
+        :param game: The game to overwrite.
+        """
+        board = game.board
+        for index, piece_repr in enumerate(self.squares):
+            board.board[index // BOARD_SIZE][index % BOARD_SIZE] = piece_repr
+        game.upper.captured = [board._create_piece_from_repr(p) for p in self.upper_hand]
+        game.lower.captured = [board._create_piece_from_repr(p) for p in self.lower_hand]
+        board.clear_move_cache()
+        game.cur_player = game.upper if self.side == "UPPER" else game.lower
+
+    def to_board(self):
+        """
+        Create a Board holding this position's pieces, e.g. for printing.
+
+        :return: A new Board.
+        """
+        board = Board()
+        for index, piece_repr in enumerate(self.squares):
+            board.board[index // BOARD_SIZE][index % BOARD_SIZE] = piece_repr
+        return board
+
+    def copy(self):
+        """
+        Return an independent copy of this position.
+        """
+        position = Position.__new__(Position)
+        position.squares = self.squares[:]
+        position.upper_hand = self.upper_hand[:]
+        position.lower_hand = self.lower_hand[:]
+        position.side = self.side
+        position.occupied = self.occupied
+        return position
+
+    def put(self, index, piece_repr):
+        """
+        Set the contents of a square.
+
+        :param index: The index of the square.
+        :param piece_repr: The piece string, or "" to empty the square.
+        """
+        self.squares[index] = piece_repr
+        if piece_repr:
+            self.occupied |= 1 << index
+        else:
+            self.occupied &= ~(1 << index)
+
+    def key(self):
+        """
+        Return a hashable key identifying the position, ignoring capture order.
+        """
+        return (tuple(self.squares), tuple(sorted(self.upper_hand)),
+                tuple(sorted(self.lower_hand)), self.side)
+
+    def compact_key(self):
+        """
+        Return a short bytes key identifying the position: one byte per square,
+        the count of each piece type in both hands and the player to move.
+        """
+        codes = [PIECE_CODES[p] for p in self.squares]
+        upper_hand = [p.lower() for p in self.upper_hand]
+        lower_hand = list(self.lower_hand)
+        codes += [upper_hand.count(letter) for letter in HAND_LETTERS]
+        codes += [lower_hand.count(letter) for letter in HAND_LETTERS]
+        codes.append(1 if self.side == "UPPER" else 0)
+        return bytes(codes)
+
+    def __eq__(self, other):
+        return isinstance(other, Position) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return str(self.to_board())
+
+    def other_side(self):
+        """
+        Return the name of the player not to move.
+        """
+        return "lower" if self.side == "UPPER" else "UPPER"
+
+    def flipped(self):
+        """
+        Return the same position seen from the other player: the board rotated by 180
+        degrees with the owner of every piece swapped, the hands exchanged and the other
+        player to move. The rules are symmetric, so a move m is legal here exactly when
+        flip_move(m) is legal there, and leads to the flipped result.
+
+        :return: A new Position.
+        """
+        return Position([piece_repr.swapcase() for piece_repr in reversed(self.squares)],
+                        [piece_repr.upper() for piece_repr in self.lower_hand],
+                        [piece_repr.lower() for piece_repr in self.upper_hand],
+                        self.other_side())
+
+    def canonical(self):
+        """
+        Map the position to the canonical one of its color-symmetric pair, the one with
+        lower to move. Tables keyed on canonical positions store half the entries;
+        moves are mapped between the two with flip_move().
+
+        :return: A tuple (position, flipped): the canonical Position, which is this one
+            if lower is to move, and whether it was flipped.
+        """
+        if self.side == "lower":
+            return self, False
+        return self.flipped(), True
+
+    def hand(self, side):
+        """
+        Return the hand of a player.
+
+        :param side: "lower" or "UPPER".
+        :return: The list of pieces captured by that player.
+        """
+        return self.upper_hand if side == "UPPER" else self.lower_hand
+
+    def find_drive(self, side):
+        """
+        Find the square of a player's Drive.
+
+        :param side: "lower" or "UPPER".
+        :return: The square index, or None if the Drive is not on the board.
+        """
+        drive = "D" if side == "UPPER" else "d"
+        if drive in self.squares:
+            return self.squares.index(drive)
+        return None
+
+    def is_attacked(self, target, by_upper):
+        """
+        Check if any piece of a player can move to a square.
+
+        Every piece moves along the eight board directions, so only the nearest piece
+        in each direction from the square can reach it. Those are found with the
+        occupied bitboard, which keeps the test linear in the board width.
+
+        :param target: The index of the square.
+        :param by_upper: True to look at UPPER's pieces, False for lower's.
+        :return: True if the square is attacked.
+        """
+        _, lines, direction_masks = _TABLES or move_tables()
+        squares = self.squares
+        occupied = self.occupied
+        for mask, increasing in direction_masks[target]:
+            blockers = occupied & mask
+            if not blockers:
+                continue
+            if increasing:
+                index = (blockers & -blockers).bit_length() - 1
+            else:
+                index = blockers.bit_length() - 1
+            piece_repr = squares[index]
+            if piece_repr[-1].isupper() == by_upper and target in lines[piece_repr][index]:
+                return True
+        return False
+
+    def in_check(self, side=None):
+        """
+        Check if a player's Drive is attacked.
+
+        :param side: The player to test, defaults to the player to move.
+        :return: True if that player is in check.
+        """
+        side = side or self.side
+        drive_square = self.find_drive(side)
+        if drive_square is None:
+            return False
+        return self.is_attacked(drive_square, side != "UPPER")
+
+    def _leaves_drive_safe(self, start, end, piece_repr):
+        """
+        Check that moving a piece of the player to move does not leave their Drive in check.
+
+        :param start: The square the piece leaves, or None for a drop.
+        :param end: The square the piece lands on.
+        :param piece_repr: The piece being moved or dropped.
+        :return: True if the move is safe.
+        """
+        upper = self.side == "UPPER"
+        captured = self.squares[end]
+        occupied = self.occupied
+        self.put(end, piece_repr)
+        if start is not None:
+            self.put(start, "")
+        drive_square = self.find_drive(self.side)
+        safe = drive_square is None or not self.is_attacked(drive_square, not upper)
+        self.squares[end] = captured
+        if start is not None:
+            self.squares[start] = piece_repr
+        self.occupied = occupied
+        return safe
+
+    def _board_moves(self):
+        """
+        Generate the board moves of the player to move that do not leave their Drive in check.
+
+        :return: A generator of move strings, so that callers can stop at the first one.
+        """
+        rays = (_TABLES or move_tables())[0]
+        squares = self.squares
+        upper = self.side == "UPPER"
+        for start, piece_repr in enumerate(squares):
+            if not piece_repr or piece_repr[-1].isupper() != upper:
+                continue
+            for ray in rays[piece_repr][start]:
+                for end in ray:
+                    target = squares[end]
+                    if target and target[-1].isupper() == upper:
+                        break
+                    if self._leaves_drive_safe(start, end, piece_repr):
+                        text = "move " + square_name(start) + " " + square_name(end)
+                        yield text
+                        if piece_repr in PROMOTABLE and (in_promote_row(start, upper) or in_promote_row(end, upper)):
+                            # A Preview reaching the last row promotes anyway
+                            if not (piece_repr in ("p", "P") and in_last_row(end, upper)):
+                                yield text + " promote"
+                    if target:
+                        break
+
+    def _drop_moves(self, drop_mate_rule=True):
+        """
+        Generate the drops of the player to move that do not leave their Drive in check.
+
+        :param drop_mate_rule: Whether to reject Preview drops that give immediate checkmate.
+        :return: A generator of move strings, so that callers can stop at the first one.
+        """
+        squares = self.squares
+        upper = self.side == "UPPER"
+        in_check = self.in_check()
+        for letter in sorted(set(p.lower() for p in self.hand(self.side))):
+            piece_repr = letter.upper() if upper else letter
+            preview_columns = set()
+            if letter == "p":
+                preview_columns = {i // BOARD_SIZE for i, sq in enumerate(squares) if sq == piece_repr}
+            for end in range(NUM_SQUARES):
+                if squares[end]:
+                    continue
+                if letter == "p" and (in_promote_row(end, upper) or end // BOARD_SIZE in preview_columns):
+                    continue
+                if in_check and not self._leaves_drive_safe(None, end, piece_repr):
+                    continue
+                text = "drop " + letter + " " + square_name(end)
+                if letter == "p" and drop_mate_rule and self._drop_gives_mate(end, piece_repr):
+                    continue
+                yield text
+
+    def _drop_gives_mate(self, end, piece_repr):
+        """
+        Check if dropping a Preview on a square checkmates the opponent.
+        """
+        child = self.copy()
+        child.put(end, piece_repr)
+        child.side = self.other_side()
+        return child.in_check() and not child.has_legal_move(drop_mate_rule=False)
+
+    def legal_moves(self, drop_mate_rule=True):
+        """
+        Generate every legal move of the player to move.
+
+        Promotion is offered as a separate move whenever the rules allow it, except
+        for the forced promotion of a Preview reaching the last row.
+
+        :param drop_mate_rule: Whether to reject Preview drops that give immediate checkmate.
+        :return: A list of move strings in file mode format.
+        """
+        return list(self._board_moves()) + list(self._drop_moves(drop_mate_rule))
+
+    def has_legal_move(self, drop_mate_rule=True):
+        """
+        Check if the player to move has at least one legal move, stopping at the first
+        one found.
+
+        :param drop_mate_rule: Whether to reject Preview drops that give immediate checkmate.
+        :return: True if a legal move exists.
+        """
+        for _ in self._board_moves():
+            return True
+        for _ in self._drop_moves(drop_mate_rule):
+            return True
+        return False
+
+    def is_checkmate(self):
+        """
+        Check if the player to move is checkmated.
+        """
+        return self.in_check() and not self.has_legal_move()
+
+    def play(self, move):
+        """
+        Apply a legal move and return the resulting position. The move is not validated.
+
+        :param move: A move string such as 'move a1 a2', 'move a4 a5 promote' or 'drop p c3'.
+        :return: A new Position with the other player to move.
+        """
+        child = self.copy()
+        split = move.split()
+        upper = self.side == "UPPER"
+        if split[0] == "drop":
+            end = parse_square(split[2])
+            piece_repr = split[1].upper() if upper else split[1].lower()
+            hand = child.hand(self.side)
+            hand.remove(piece_repr)
+            child.put(end, piece_repr)
+        else:
+            start, end = parse_square(split[1]), parse_square(split[2])
+            captured = child.squares[end]
+            if captured:
+                letter = captured[-1]
+                child.hand(self.side).append(letter.upper() if upper else letter.lower())
+            child.put(end, self._landing_piece(split, start, end))
+            child.put(start, "")
+        child.side = self.other_side()
+        return child
+
+    def _landing_piece(self, split, start, end):
+        """
+        Return the piece a board move leaves on its end square, promoted if the move
+        asks for it or a Preview reaches the last row.
+        """
+        piece_repr = self.squares[start]
+        promote = len(split) > 3 and split[3] == "promote"
+        if piece_repr in ("p", "P") and in_last_row(end, self.side == "UPPER"):
+            promote = True
+        if promote and piece_repr in PROMOTABLE:
+            piece_repr = "+" + piece_repr
+        return piece_repr
+
+    def gives_check(self, move):
+        """
+        Check if a legal move puts the opponent in check, much more cheaply than play()
+        followed by in_check().
+
+        A move can only give check with the piece it lands, if that piece would reach
+        the Drive on an empty board, or by uncovering a line through the Drive. Other
+        moves are answered from the move tables; the rest are made and unmade in place
+        and only the opponent's Drive is tested.
+
+        :param move: A legal move string of the player to move.
+        :return: True if the opponent's Drive is attacked after the move.
+        """
+        drive_square = self.find_drive(self.other_side())
+        if drive_square is None:
+            return False
+        _, lines, direction_masks = _TABLES or move_tables()
+        split = move.split()
+        upper = self.side == "UPPER"
+        end = parse_square(split[2])
+        if split[0] == "drop":
+            start, piece_repr = None, split[1].upper() if upper else split[1].lower()
+        else:
+            start = parse_square(split[1])
+            piece_repr = self._landing_piece(split, start, end)
+        if drive_square not in lines[piece_repr][end]:
+            if start is None:
+                return False
+            if not any((mask >> start) & 1 for mask, _ in direction_masks[drive_square]):
+                return False
+
+        moved = self.squares[start] if start is not None else ""
+        captured = self.squares[end]
+        occupied = self.occupied
+        self.put(end, piece_repr)
+        if start is not None:
+            self.put(start, "")
+        check = self.is_attacked(drive_square, upper)
+        self.squares[end] = captured
+        if start is not None:
+            self.squares[start] = moved
+        self.occupied = occupied
+        return check
+
+
+def normalize_move(position, move, legal_moves=None):
+    """
+    Match a move from a game file to one of the legal moves of a position.
+
+    File mode accepts 'promote' on a move of an unpromoted, promotable piece that
+    cannot promote there and simply does not promote, so such moves are mapped to
+    the plain move.
+
+    :param position: The Position the move is played in.
+    :param move: The move as written in the file.
+    :param legal_moves: The legal moves of the position, if already generated.
+    :return: The legal move string, or None if the move is illegal.
+    """
+    move = " ".join(move.split())
+    if legal_moves is None:
+        legal_moves = position.legal_moves()
+    if move in legal_moves:
+        return move
+    plain_move = move[:-len(" promote")]
+    if (move.endswith(" promote") and plain_move in legal_moves and
+            position.squares[parse_square(move.split()[1])] in PROMOTABLE):
+        return plain_move
+    return None
+
+
+def replay_setup(game_setup):
+    """
+    Replay a parsed game, yielding every position reached.
+
+    Replay stops at the first illegal move, where file mode would end the game, and
+    after MOVE_LIMIT plies, where file mode declares a tie, so positions past the end
+    of the game file mode reports are never yielded.
+
+    :param game_setup: The dictionary returned by utils.parseTestCase.
+    :return: A generator of (ply, position, move) tuples, where move is the legal
+        move played from the position, or None for the last position.
+    """
+    position = Position.from_setup(game_setup)
+    ply = 0
+    for move in game_setup['moves']:
+        if ply == MOVE_LIMIT:
+            break
+        legal_move = normalize_move(position, move)
+        if legal_move is None:
+            break
+        yield ply, position, legal_move
+        position = position.play(legal_move)
+        ply += 1
+    yield ply, position, None
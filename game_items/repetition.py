@@ -0,0 +1,40 @@
+REPETITION_LIMIT = 4
+
+
+class PositionHistory:
+    """
+    Index of every position reached in a game, used to detect fourfold repetition.
+
+    Positions are recorded by compact key (board, hands and player to move), along
+    with whether the player to move was in check. When a position occurs for the
+    fourth time the game is adjudicated as in sennichite: a tie, unless one player
+    gave check in every position of the repeating cycle, in which case that player
+    loses.
+    """
+
+    def __init__(self):
+        self.history = []
+        self.occurrences = {}
+
+    def record(self, key, side, in_check):
+        """
+        Record the position reached after a move.
+
+        :param key: The compact key of the position, e.g. Position.compact_key().
+        :param side: The player to move, "lower" or "UPPER".
+        :param in_check: Whether the player to move is in check.
+        :return: None if play continues. Otherwise "tie", or the name of the player
+            that wins because their opponent checked perpetually.
+        """
+        plies = self.occurrences.setdefault(key, [])
+        plies.append(len(self.history))
+        self.history.append((side, in_check))
+        if len(plies) < REPETITION_LIMIT:
+            return None
+
+        cycle = self.history[plies[0]:]
+        for checked_side in ("lower", "UPPER"):
+            turns = [check for s, check in cycle if s == checked_side]
+            if turns and all(turns):
+                return checked_side
+        return "tie"
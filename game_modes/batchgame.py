@@ -0,0 +1,156 @@
+import contextlib
+import io
+import os
+
+from utils import parseTestCase
+from game_modes.filegame import FileGame, print_game_result
+from analysis.archive import iter_game_files, output_paths
+
+
+class ReplayTrie:
+    """
+    A trie of the move sequences of games that share an initial setup and hands.
+
+    Every node lists the games whose moves end there and maps each next move, as
+    written in the file, to a child node.
+    """
+
+    def __init__(self):
+        self.games = []
+        self.children = {}
+
+    def add(self, game_id, moves):
+        """
+        Add a game to the trie.
+
+        :param game_id: Any identifier of the game.
+        :param moves: The list of moves of the game.
+        """
+        node = self
+        for move in moves:
+            node = node.children.setdefault(move, ReplayTrie())
+        node.games.append(game_id)
+
+    def game_ids(self):
+        """
+        Return the ids of every game in this subtree.
+        """
+        ids = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            ids.extend(node.games)
+            stack.extend(node.children.values())
+        return ids
+
+
+def _setup_key(game_setup):
+    """
+    Return a hashable key of the initial setup and hands of a parsed game.
+    """
+    pieces = tuple((piece['piece'], piece['position']) for piece in game_setup['initialPieces'])
+    return pieces, tuple(game_setup['upperCaptures']), tuple(game_setup['lowerCaptures'])
+
+
+def replay_batch(game_setups, tablebase=None, repetition_rule=False):
+    """
+    Replay many games, playing the moves shared by several games only once.
+
+    Games with the same initial setup and hands are put in a ReplayTrie. The trie is
+    walked depth first with a FileGame, which is copied with FileGame.snapshot()
+    wherever games branch. Every result is the one FileGame.replay() gives for the
+    game alone.
+
+    :param game_setups: A dict mapping game ids to dictionaries returned by parseTestCase.
+    :param tablebase: Optional Tablebase or TablebaseSet consulted for checkmate.
+    :param repetition_rule: End games on fourfold repetition of a position.
+    :return: A dict mapping every game id to its GameResult, or to the exception
+        raised while replaying it.
+    """
+    groups = {}
+    for game_id, game_setup in game_setups.items():
+        group = groups.setdefault(_setup_key(game_setup), (game_setup, ReplayTrie()))
+        group[1].add(game_id, game_setup['moves'])
+
+    results = {}
+    for game_setup, trie in groups.values():
+        game = FileGame(tablebase, repetition_rule)
+        game.initialize_game_state(game_setup)
+        if game.record_position():
+            _finish_subtree(trie, game, game_setups, results)
+            continue
+
+        stack = [(trie, game)]
+        while stack:
+            node, game = stack.pop()
+            children = list(node.children.items())
+            for game_id in node.games:
+                ended = game.snapshot() if children else game
+                try:
+                    results[game_id] = ended.finish_game()
+                except Exception as e:
+                    results[game_id] = e
+            for i, (move, child) in enumerate(children):
+                branch = game if i == len(children) - 1 else game.snapshot()
+                try:
+                    ended = branch.play_file_move(move)
+                except Exception as e:
+                    for game_id in child.game_ids():
+                        results[game_id] = e
+                    continue
+                if ended:
+                    _finish_subtree(child, branch, game_setups, results)
+                else:
+                    stack.append((child, branch))
+    return results
+
+
+def _finish_subtree(node, game, game_setups, results):
+    """
+    Record the result of a game that ended for every game of a subtree of the trie.
+    """
+    result = game.game_result()
+    for game_id in node.game_ids():
+        unplayed_moves = len(game_setups[game_id]['moves']) - game.moves_read
+        results[game_id] = result._replace(unplayed_moves=unplayed_moves)
+
+
+def run_batch_mode(paths, out_dir=None, tablebase=None, repetition_rule=False):
+    """
+    Replay many game files at once and print what file mode prints for each of them,
+    or write it to <out_dir>/<name>.out, mirroring the directories of the game files
+    (see analysis.archive.output_paths()).
+
+    :param paths: Files, directories or glob patterns of game files.
+    :param out_dir: Optional directory for the outputs, printed with a header per game otherwise.
+    :param tablebase: Optional Tablebase or TablebaseSet consulted for checkmate.
+    :param repetition_rule: End games on fourfold repetition of a position.
+    """
+    game_setups = {}
+    errors = {}
+    files = iter_game_files(paths)
+    outputs = output_paths(files, out_dir) if out_dir else {}
+    for path in files:
+        try:
+            game_setups[path] = parseTestCase(path)
+        except Exception as e:
+            errors[path] = e
+    results = replay_batch(game_setups, tablebase, repetition_rule)
+    results.update(errors)
+
+    for path in files:
+        result = results[path]
+        if isinstance(result, Exception):
+            output = f"Error with opening filepath: {result}\n"
+        else:
+            buffer = io.StringIO()
+            with contextlib.redirect_stdout(buffer):
+                print_game_result(result)
+            output = buffer.getvalue()
+        if out_dir:
+            os.makedirs(os.path.dirname(outputs[path]), exist_ok=True)
+            with open(outputs[path], "w") as f:
+                f.write(output)
+        else:
+            print(f"==> {path} <==")
+            print(output, end="")
@@ -0,0 +1,144 @@
+import contextlib
+import io
+import os
+import signal
+import socket
+import sys
+
+from game_modes.filegame import FileGame
+
+DEFAULT_SOCKET = os.environ.get("BOXSHOGI_SOCKET", "/tmp/boxshogi.sock")
+
+# A short game replayed by every worker before serving, to warm up the code paths
+WARMUP_GAME = """d a1
+s b1
+r c1
+g d1
+n e1
+p a2
+D e5
+S d5
+R c5
+G b5
+N a5
+P e4
+
+[]
+[]
+
+move a2 a3
+move e4 e3
+move a3 a4
+move e3 e2
+"""
+
+
+def run_request(request):
+    """
+    Replay the game described by a request, capturing everything file mode prints.
+
+    A request is either "path", the client's working directory and a file path,
+    one per line, or "text" followed by the contents of a game file.
+
+    :param request: The request as a string.
+    :return: The output of file mode for that game.
+    """
+    kind, _, body = request.partition("\n")
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        if kind == "path":
+            cwd, _, path = body.partition("\n")
+            os.chdir(cwd)
+            FileGame().run_game_file_mode(path.rstrip("\n"))
+        elif kind == "text":
+            FileGame().run_game_file_mode(io.StringIO(body))
+        else:
+            print(f"Unknown request: {kind}")
+    return output.getvalue()
+
+
+def _serve(server, max_requests):
+    """
+    Worker loop: accept connections on the shared socket and answer them one at a time.
+
+    :param server: The listening socket, inherited from the parent.
+    :param max_requests: Exit after this many requests so the parent starts a fresh worker.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    run_request("text\n" + WARMUP_GAME)
+    for _ in range(max_requests):
+        conn, _ = server.accept()
+        with conn:
+            chunks = []
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            try:
+                response = run_request(b"".join(chunks).decode())
+            except Exception as e:
+                response = f"Error with opening filepath: {e}\n"
+            conn.sendall(response.encode())
+
+
+def _fork_worker(server, max_requests):
+    """
+    Fork a worker process serving the socket.
+
+    :return: The pid of the worker.
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _serve(server, max_requests)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def run_daemon(socket_path=DEFAULT_SOCKET, workers=None, max_requests=10000):
+    """
+    Serve file mode games over a Unix domain socket with a pool of pre-forked workers.
+
+    Everything is imported once in the parent before forking, so workers answer
+    requests without paying for interpreter startup. The parent restarts workers
+    that exit and removes the socket on SIGTERM or SIGINT.
+
+    :param socket_path: The path of the Unix domain socket to listen on.
+    :param workers: Number of worker processes, defaults to the number of CPUs.
+    :param max_requests: Number of requests a worker serves before being replaced.
+    """
+    workers = workers or os.cpu_count() or 1
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(128)
+
+    children = set(_fork_worker(server, max_requests) for _ in range(workers))
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in children:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Listening on {socket_path} with {workers} workers", file=sys.stderr)
+    try:
+        while children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            children.discard(pid)
+            if not stopping:
+                children.add(_fork_worker(server, max_requests))
+    finally:
+        server.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(socket_path)
@@ -1,21 +1,99 @@
+import copy
+from collections import namedtuple
+
 from utils import parseTestCase
 from game_items.gamevars import BOARD_SIZE, MOVE_LIMIT
 from game_items.loc import Loc
 from game_items.board import Board
 from pieces.preview import Preview
 from game_items.player import Player
+from game_items.position import Position
+from game_items.repetition import PositionHistory
+
+ILLEGAL_MOVE = "Illegal move"
+CHECKMATE = "Checkmate"
+TOO_MANY_MOVES = "Too many moves"
+REPETITION = "Fourfold repetition"
+PERPETUAL_CHECK = "Perpetual check"
+
+# winner: "lower", "UPPER" or None. reason: one of the constants above, or None if the game
+# is not over. position: the final Position, whose side is the player to move, or the player
+# who made the illegal move. plies: the number of moves played. in_check: whether that player
+# is in check. available_moves: their moves out of check, unless checkmated. last_move: the
+# last move read from the file. unplayed_moves: the number of moves of the file never played.
+GameResult = namedtuple("GameResult", ["winner", "reason", "position", "plies", "in_check",
+                                       "available_moves", "last_move", "unplayed_moves"])
+
+
+def replay_game(game, tablebase=None, repetition_rule=False):
+    """
+    Replays a game in file mode without printing anything.
+
+    :param game: A file path or file object, or a dictionary as returned by parseTestCase.
+    :param tablebase: Optional Tablebase or TablebaseSet consulted for checkmate.
+    :param repetition_rule: End the game on fourfold repetition of a position.
+    :return: A GameResult.
+    """
+    game_setup = game if isinstance(game, dict) else parseTestCase(game)
+    return FileGame(tablebase, repetition_rule).replay(game_setup)
+
+
+def print_game_result(result):
+    """
+    Prints a GameResult the way file mode reports the end of a game.
+
+    :param result: The GameResult to print.
+    """
+    position = result.position
+    if result.reason == TOO_MANY_MOVES and result.unplayed_moves:
+        print("Tie game.  Too many moves.")
+        return
+
+    mover = position.side if result.reason == ILLEGAL_MOVE else position.other_side()
+    print(f"{mover} player action: {result.last_move}")
+    print(position.to_board())
+    print(f"Captures UPPER: {' '.join(position.upper_hand)}")
+    print(f"Captures lower: {' '.join(position.lower_hand)}")
+    print()
+    if result.reason == REPETITION:
+        print("Tie game.  Fourfold repetition.")
+        return
+    if result.reason in (ILLEGAL_MOVE, CHECKMATE, PERPETUAL_CHECK):
+        print(f"{result.winner} player wins.  {result.reason}.")
+        if result.reason == ILLEGAL_MOVE:
+            print()
+        return
+
+    if result.in_check:
+        print(f"{position.side} player is in check!")
+        print("Available moves: ")
+        for move in result.available_moves:
+            print(move)
+    if result.reason == TOO_MANY_MOVES:
+        print("Tie game.  Too many moves.")
+    else:
+        print(f"{position.side}>")
+
 
 class FileGame:
     """
     Manages the File Mode of BoxShogi game, handling game initialization, player turns, and the game state.
     """
-    def __init__(self):
+    def __init__(self, tablebase=None, repetition_rule=False):
+        """
+        :param tablebase: Optional Tablebase or TablebaseSet consulted for checkmate.
+        :param repetition_rule: End the game on fourfold repetition of a position.
+        """
         self.lower, self.upper= Player("lower"), Player("UPPER")
         self.cur_player = self.lower
         self.last_move = ""
         self.board = Board()
         self.is_game_over = False
         self.moves = 0
+        self.moves_read = 0
+        self.tablebase = tablebase
+        self.history = PositionHistory() if repetition_rule else None
+        self.outcome = None
 
     def run_game_file_mode(self, arg):
         """
@@ -24,36 +102,85 @@ class FileGame:
         :param arg: Filepath containing the game setup and moves.
         """
         try:
-            game_setup = parseTestCase(arg)
-            self.initialize_game_state(game_setup)
+            result = self.replay(parseTestCase(arg))
+        except Exception as e:
+            print(f"Error with opening filepath: {e}")
+            return
+        print_game_result(result)
 
+    def replay(self, game_setup):
+        """
+        Replays a game without printing anything.
+
+        :param game_setup: A dictionary containing the game setup and moves, as returned by parseTestCase.
+        :return: A GameResult describing how the game ended.
+        """
+        self.initialize_game_state(game_setup)
+        moves = game_setup['moves']
+        if not self.record_position():
             # Executing moves
-            for move in game_setup['moves']:
-                if self.moves == MOVE_LIMIT:
-                    print("Tie game.  Too many moves.")
-                    self.is_game_over = True
-                    return
-                
-                self.last_move = move
-                split = move.split()
-                if split[0] == "move" and len(split) > 2:
-                    self.make_move(split)
-                elif split[0] == "drop" and len(split) > 2:
-                    self.drop_move(split)
-
-                if self.is_game_over:
-                    return
+            for move in moves:
+                if self.play_file_move(move):
+                    break
+            else:
+                #Game is finished
+                return self.finish_game()
+        return self.game_result(len(moves) - self.moves_read)
 
+    def play_file_move(self, move):
+        """
+        Plays the next move read from a game file.
 
-                self.switch_players()
-                self.moves += 1            
+        :param move: The move as written in the file.
+        :return: True if the game ended.
+        """
+        if self.moves == MOVE_LIMIT:
+            self.outcome = (None, TOO_MANY_MOVES)
+            self.is_game_over = True
+            return True
 
-            #Game is finished
-            self.print_final_game_state()
+        self.moves_read += 1
+        self.last_move = move
+        split = move.split()
+        if split[0] == "move" and len(split) > 2:
+            self.make_move(split)
+        elif split[0] == "drop" and len(split) > 2:
+            self.drop_move(split)
+
+        if self.is_game_over:
+            return True
+
+        self.switch_players()
+        self.moves += 1
+        return self.record_position()
+
+    def snapshot(self):
+        """
+        Returns an independent copy of the game, e.g. to replay several continuations
+        of the same moves. Only the tablebase is shared.
+
+        :return: A new FileGame.
+        """
+        game = copy.copy(self)
+        game.board = Board()
+        game.board.board = [column[:] for column in self.board.board]
+        game.lower, game.upper = copy.deepcopy(self.lower), copy.deepcopy(self.upper)
+        game.cur_player = game.upper if self.cur_player is self.upper else game.lower
+        game.history = copy.deepcopy(self.history)
+        return game
+
+    def game_result(self, unplayed_moves=0, available_moves=()):
+        """
+        Describes the current state of the game as a GameResult.
+
+        :param unplayed_moves: The number of moves of the file left unplayed.
+        :param available_moves: The moves out of check of the current player, if in check.
+        :return: A GameResult.
+        """
+        winner, reason = self.outcome or (None, None)
+        return GameResult(winner, reason, Position.from_game(self), self.moves, self.is_in_check(),
+                          list(available_moves), self.last_move, unplayed_moves)
 
-        except Exception as e:
-            print(f"Error with opening filepath: {e}")
-    
     def initialize_game_state(self, game_setup):
         """
         Initializes the game state based on the setup specified in the file.
@@ -80,35 +207,45 @@ class FileGame:
             piece = self.board._create_piece_from_repr(lower_captured_piece)
             self.lower.capture_piece(piece)
         
-    def print_final_game_state(self):
+    def finish_game(self):
         """
-        Prints the final state of the game, including the board, captured pieces, and any check/checkmate status.
+        Determines the state of the game once every move has been played: checkmate,
+        the moves out of check, or a tie when the move limit is reached.
+
+        :return: A GameResult.
         """
-        print(f"{self.get_other_player().get_name()} player action: {self.last_move}")
-        print(self.board)
-        self.upper.print_captured_list()
-        self.lower.print_captured_list()
-        print()
-        #If game ends in check, show available moves to player.
+        available_moves = []
+        #If game ends in check, find available moves for player.
         if self.is_in_check():
+            result = self.handle_checkmate_condition()
+            if result is not None:
+                return result
             available_moves = self.create_available_moves()
-            if not available_moves:
-                other_player = self.get_other_player()
-                other_player.print_win_message("  Checkmate.")
-                self.is_game_over = True
-                return
-            else:
-                print(f"{self.cur_player.get_name()} player is in check!")
-                print("Available moves: ")
-                for move in available_moves:
-                    print(move)
 
-        if self.moves == MOVE_LIMIT and not self.is_game_over:
-            print("Tie game.  Too many moves.")
+        if self.moves == MOVE_LIMIT:
+            self.outcome = (None, TOO_MANY_MOVES)
             self.is_game_over = True
+        return self.game_result(available_moves=available_moves)
+
+    def record_position(self):
+        """
+        Records the current position if the repetition rule is on, ending the game on fourfold repetition.
 
+        :return: True if the game ended by repetition.
+        """
+        if self.history is None:
+            return False
+        position = Position.from_game(self)
+        outcome = self.history.record(position.compact_key(), position.side, position.in_check())
+        if outcome is None:
+            return False
+
+        if outcome == "tie":
+            self.outcome = (None, REPETITION)
         else:
-            print(f"{self.cur_player.get_name()}>")
+            self.outcome = (outcome, PERPETUAL_CHECK)
+        self.is_game_over = True
+        return True
 
     def get_other_player(self):
         """Return the opponent player."""
@@ -125,29 +262,50 @@ class FileGame:
         
     def handle_checkmate_condition(self):
         """
-        Checks for checkmate condition. Returns True if the game ends due to checkmate.
+        Checks if the current player, assumed to be in check, is checkmated, ending the game if so.
+        Nothing is printed; see print_game_result.
+
+        :return: A GameResult with the Checkmate outcome, or None if the player has a move out of check.
         """
-        available_moves = self.create_available_moves()
-        for move in available_moves:
-            print(move)
-        if not available_moves:
-            other_player = self.get_other_player()
-            other_player.print_win_message("  Checkmate.")
-            self.is_game_over = True
-            return True
-        return False
+        if not self.is_checkmated():
+            return None
+        self.outcome = (self.get_other_player().get_name(), CHECKMATE)
+        self.is_game_over = True
+        return self.game_result()
+
+    def tablebase_checkmate(self):
+        """
+        Looks up whether the current player is checkmated in the tablebase, if one was given.
+
+        :return: True or False when the tablebase covers the position, None otherwise.
+        """
+        if self.tablebase is None:
+            return None
+        # Preview drops out of check are judged by create_available_moves' own rules
+        if any(isinstance(p, Preview) for p in self.cur_player.get_captured()):
+            return None
+        # Imported here so that file mode without a tablebase does not load it
+        from analysis.tablebase import LOSS
+        entry = self.tablebase.probe(Position.from_game(self))
+        if entry is None:
+            return None
+        return entry.outcome == LOSS and entry.plies == 0
+
+    def is_checkmated(self):
+        """
+        Checks if the current player, assumed to be in check, has no move out of check.
+
+        :return: True if the current player is checkmated.
+        """
+        mate = self.tablebase_checkmate()
+        if mate is not None:
+            return mate
+        return not self.has_legal_move()
 
     def end_game_for_current_player(self):
         """Ends the game due to an illegal move by the current player."""
-        print(f"{self.cur_player.get_name()} player action: {self.last_move}")
-        print(self.board)
-        self.upper.print_captured_list()
-        self.lower.print_captured_list()
-        print()
-        other_player = self.get_other_player()
-        other_player.print_win_message("  Illegal move.")
+        self.outcome = (self.get_other_player().get_name(), ILLEGAL_MOVE)
         self.is_game_over = True
-        print()
 
     def check_illegal_move(self, promote, initial_position, final_position):
         """
@@ -209,7 +367,7 @@ class FileGame:
                             current_piece.can_be_promoted() and not current_piece.is_promoted()):
                 current_piece.promote()
 
-            elif (self.cur_player.piece_in_promote_row(final_position) and
+            elif (self.cur_player.piece_in_last_row(final_position) and
                     isinstance(current_piece, Preview) and not current_piece.is_promoted()):
                 current_piece.promote()  # Force promotion without mentioning promote for Preview
             
@@ -273,46 +431,65 @@ class FileGame:
             return
 
         # Special rules for dropping a Preview piece
-        if isinstance(to_drop, Preview):
-            if self.cur_player.piece_in_promote_row(loc):
-                self.end_game_for_current_player()
-                return
-            
-            # Check if dropping would create an illegal position (e.g., two un-promoted Preview pieces in the same column)
-            for temp_y in [y for y in range(loc.get_y() - 1, -1, -1)] + [y for y in range(loc.get_y() + 1, BOARD_SIZE)]:
-                temp = self.board.get_piece(loc.get_x(), temp_y)
-                if temp and temp.belongs_to(self.cur_player) and isinstance(temp, Preview) and not temp.is_promoted():
-                    self.end_game_for_current_player()
-                    return
-
-            # Simulate drop and check for checkmate scenario
-            self.board.set_piece(loc, to_drop)
-            self.switch_players()
-            if self.is_in_check() and len(self.create_available_moves()) == 0:
-                self.board.remove_piece(loc)
-                self.switch_players()
-                self.end_game_for_current_player()
-                return
-            self.switch_players()
+        if isinstance(to_drop, Preview) and not self.preview_drop_allowed(to_drop, loc):
+            self.end_game_for_current_player()
+            return
 
         # If all checks pass, officially drop the piece
         self.board.set_piece(loc, to_drop)
+        # Check if the drop leaves the player's own drive in check - Illegal
+        if self.is_in_check():
+            self.board.remove_piece(loc)
+            self.end_game_for_current_player()
+            return
         self.cur_player.remove_captured(to_drop)
 
-    def get_all_drive_moves(self, available_moves, all_targets):
+    def preview_drop_allowed(self, piece, loc, drop_mate_rule=True):
+        """
+        Checks the rules for dropping a Preview on an empty square: not on the player's
+        promotion row, not in a column holding another of their unpromoted Previews and,
+        with the drop mate rule, not giving immediate checkmate.
+
+        :param piece: The Preview to drop.
+        :param loc: Loc object of the empty square.
+        :param drop_mate_rule: Whether to reject a drop that gives immediate checkmate.
+        :return: True if the drop is allowed.
+        """
+        if self.cur_player.piece_in_promote_row(loc):
+            return False
+
+        # Check if dropping would create an illegal position (two un-promoted Preview pieces in the same column)
+        for temp_y in range(BOARD_SIZE):
+            temp = self.board.get_piece(loc.get_x(), temp_y)
+            if temp and temp.belongs_to(self.cur_player) and isinstance(temp, Preview) and not temp.is_promoted():
+                return False
+
+        if not drop_mate_rule:
+            return True
+
+        # Simulate drop and check for checkmate scenario. The opponent's own Preview drops
+        # are not checked for mate, as in Position.
+        self.board.set_piece(loc, piece)
+        self.switch_players()
+        mate = self.is_in_check() and not self.has_legal_move(drop_mate_rule=False)
+        self.switch_players()
+        self.board.remove_piece(loc)
+        return not mate
+
+    def get_all_drive_moves(self, available_moves):
         """
         Generates all valid moves for the 'drive' piece that do not result in check, adding them to the available moves.
 
         :param available_moves: A set to which valid moves will be added.
-        :param all_targets: A set of locations that represent all possible moves by the opponent.
         """
                 
+        opponent_upper = self.get_other_player().get_name() == "UPPER"
         current_drive_loc = self.board.find_drive(self.cur_player)
         drive = self.board.get_piece(current_drive_loc.get_x(), current_drive_loc.get_y())
         drive.make_moves(self.board, current_drive_loc)
 
         for move in drive.get_moves():
-            if move not in all_targets:
+            if not self.board.is_attacked(move, opponent_upper):
                 if self.board.is_occupied(move.get_x(), move.get_y()):
                     cur_piece = self.board.get_piece(move.get_x(), move.get_y())
                     if not cur_piece.belongs_to(self.cur_player):
@@ -348,12 +525,85 @@ class FileGame:
                     loc = Loc(i, j)
                     if not self.board.is_occupied(loc.get_x(), loc.get_y()):
                         self.board.set_piece(loc, piece)
-                        if not self.is_in_check():
+                        safe = not self.is_in_check()
+                        self.board.remove_piece(loc)
+                        if safe and (not isinstance(piece, Preview) or self.preview_drop_allowed(piece, loc)):
                             c = str(piece).lower()[0]
                             str_move = "drop " + c + " " + str(loc)
                             available_moves.add(str_move)
-                        
+
+    def has_legal_move(self, drop_mate_rule=True):
+        """
+        Checks if the current player has a move out of check, stopping at the first one found.
+        The candidates are those of create_available_moves, tried cheapest first: Drive
+        escapes, captures, interpositions on squares the opponent reaches, then drops.
+
+        :param drop_mate_rule: Whether to reject Preview drops that give immediate checkmate.
+        :return: True if create_available_moves would return at least one move.
+        """
+        opponent_upper = self.get_other_player().get_name() == "UPPER"
+        drive_loc = self.board.find_drive(self.cur_player)
+        drive = self.board.get_piece(drive_loc.get_x(), drive_loc.get_y())
+        drive.make_moves(self.board, drive_loc)
+        for move in drive.get_moves():
+            if not self.board.is_attacked(move, opponent_upper) and self.move_leaves_drive_safe(drive_loc, move, drive):
+                return True
+
+        pieces = []
+        for i in range(BOARD_SIZE):
+            for j in range(BOARD_SIZE):
+                loc = Loc(i, j)
+                cur_piece = self.board.get_piece(i, j)
+                if cur_piece is not None and cur_piece.belongs_to(self.cur_player) and loc != drive_loc:
+                    cur_piece.make_moves(self.board, loc)
+                    pieces.append((loc, cur_piece))
+
+        interpositions = []
+        for loc, cur_piece in pieces:
+            for move in cur_piece.get_moves():
+                if self.board.is_occupied(move.get_x(), move.get_y()):
+                    if self.move_leaves_drive_safe(loc, move, cur_piece):
+                        return True
+                elif self.board.is_attacked(move, opponent_upper):
+                    interpositions.append((loc, move, cur_piece))
+
+        for loc, move, cur_piece in interpositions:
+            if self.move_leaves_drive_safe(loc, move, cur_piece):
+                return True
+
+        for piece in self.cur_player.get_captured():
+            for i in range(BOARD_SIZE):
+                for j in range(BOARD_SIZE):
+                    if not self.board.is_occupied(i, j):
+                        loc = Loc(i, j)
+                        self.board.set_piece(loc, piece)
+                        safe = not self.is_in_check()
                         self.board.remove_piece(loc)
+                        if safe and (not isinstance(piece, Preview) or
+                                     self.preview_drop_allowed(piece, loc, drop_mate_rule)):
+                            return True
+        return False
+
+    def move_leaves_drive_safe(self, start, end, piece):
+        """
+        Simulates moving a piece and checks that the current player is not left in check.
+        The board is restored afterwards.
+
+        :param start: Loc object the piece moves from.
+        :param end: Loc object the piece moves to.
+        :param piece: The piece being moved.
+        :return: True if the move does not leave the current player in check.
+        """
+        captured = self.board.get_piece(end.get_x(), end.get_y())
+        self.board.set_piece(end, piece)
+        self.board.remove_piece(start)
+        safe = not self.is_in_check()
+        self.board.set_piece(start, piece)
+        if captured is None:
+            self.board.remove_piece(end)
+        else:
+            self.board.set_piece(end, captured)
+        return safe
 
     def create_available_moves(self):
         """
@@ -363,10 +613,9 @@ class FileGame:
         :return: A sorted list of all possible moves that do not result in the player being in check.
         """
         available_moves = set()
-        other_player = self.get_other_player()
-        all_targets = other_player.all_possible_moves(self.board)
-        
-        self.get_all_drive_moves(available_moves, all_targets)
+        opponent_upper = self.get_other_player().get_name() == "UPPER"
+
+        self.get_all_drive_moves(available_moves)
         self.get_potential_drops(available_moves)
 
         for i in range(BOARD_SIZE):  
@@ -389,7 +638,7 @@ class FileGame:
                             self.board.set_piece(loc, cur_piece)
                             self.board.set_piece(move, piece_at_move)
 
-                        if move in all_targets:
+                        if self.board.is_attacked(move, opponent_upper):
                             # Simulate moving the piece and check for check again
                             self.board.set_piece(move, cur_piece)
                             self.board.remove_piece(loc)
@@ -410,6 +659,6 @@ class FileGame:
         :return: True if the king is in check; False otherwise.
         """
         drive_loc = self.board.find_drive(self.cur_player)
-        opponent = self.get_other_player()
-        all_targets = opponent.all_possible_moves(self.board)
-        return drive_loc in all_targets
\ No newline at end of file
+        if not drive_loc:
+            return False
+        return self.board.is_attacked(drive_loc, self.get_other_player().get_name() == "UPPER")
\ No newline at end of file
@@ -1,11 +1,40 @@
+import random
+
 from game_items.gamevars import BOARD_SIZE, MOVE_LIMIT
 from game_items.loc import Loc
 from game_items.board import Board
 from pieces.preview import Preview
 from game_items.player import Player
+from game_items.position import Position, normalize_move
+from game_items.repetition import PositionHistory
+from game_modes.ponder import Ponderer
+
+
+def move_text(split):
+    """
+    Write a move command as the file mode reads it: squares by their first two
+    characters, a drop by the first letter of the piece, and 'promote' only as the
+    fourth word.
+
+    :param split: A list of strings representing the move command and its parameters.
+    :return: The move string.
+    """
+    if split[0] == "drop":
+        return f"drop {split[1][0]} {split[2][:2]}"
+    promote = " promote" if len(split) == 4 and split[3] == "promote" else ""
+    return f"move {split[1][:2]} {split[2][:2]}{promote}"
+
 
 class InteractiveGame:
-    def __init__(self):
+    def __init__(self, repetition_rule=False, ponder=False, broadcaster=None, book=None, book_side="UPPER", rng=None):
+        """
+        :param repetition_rule: End the game on fourfold repetition of a position.
+        :param ponder: Analyse upcoming positions in the background while waiting for input.
+        :param broadcaster: Optional spectate.Broadcaster the positions of the game are published to.
+        :param book: Optional analysis.book.OpeningBook replying instantly for one player while in book.
+        :param book_side: The player whose moves the book plays, "lower" or "UPPER".
+        :param rng: A random.Random instance picking book moves, a new one by default.
+        """
         self.lower = Player("lower")
         self.upper = Player("UPPER")
         self.cur_player = self.lower
@@ -13,17 +42,25 @@ class InteractiveGame:
         self.board = Board()
         self.is_game_over = False
         self.moves = 0
+        self.history = PositionHistory() if repetition_rule else None
+        self.legal_moves = None
+        self.ponderer = Ponderer() if ponder else None
+        self.broadcaster = broadcaster
+        self.book = book
+        self.book_side = book_side
+        self.rng = rng or random.Random()
 
     def start_interactive_game(self):
         """
         Starts an interactive game session, allowing players to input moves via the command line.
         """
         self.board.init_pieces()
+        self.publish_position()
+        self.record_position()
 
         while not self.is_game_over:
             if self.moves >= MOVE_LIMIT:
-                print("Tie game. Too many moves.")
-                self.is_game_over = True
+                self.end_game("Tie game. Too many moves.")
                 return
 
             print(self.board)
@@ -32,20 +69,87 @@ class InteractiveGame:
             print()
 
             self.handle_player_turn()
+            self.legal_moves = None
+            # The game only ends during a turn when no move was played
+            if self.is_game_over:
+                return
 
             self.moves += 1
             self.switch_players()
+            self.publish_position()
+
+            if self.record_position():
+                return
+
+    def publish_position(self):
+        """
+        Sends the current position to the spectators, if the game is broadcast.
+        """
+        if self.broadcaster is not None:
+            self.broadcaster.publish(Position.from_game(self))
+
+    def end_game(self, result):
+        """
+        Ends the game, printing its result line and sending it to the spectators.
+
+        :param result: The result line, e.g. "lower player wins.  Checkmate."
+        """
+        print(result)
+        self.is_game_over = True
+        if self.broadcaster is not None:
+            self.broadcaster.publish_status(result)
     
+    def record_position(self):
+        """
+        Records the current position if the repetition rule is on, ending the game on fourfold repetition.
+
+        :return: True if the game ended by repetition.
+        """
+        if self.history is None:
+            return False
+        position = Position.from_game(self)
+        outcome = self.history.record(position.compact_key(), position.side, position.in_check())
+        if outcome is None:
+            return False
+
+        print(self.board)
+        self.upper.print_captured_list()
+        self.lower.print_captured_list()
+        print()
+        if outcome == "tie":
+            self.end_game("Tie game.  Fourfold repetition.")
+        else:
+            self.end_game(f"{outcome} player wins.  Perpetual check.")
+        return True
+
     def handle_player_turn(self):
         """
         Handles actions during a player's turn, including move input, check status, and win conditions.
         """
-        if self.is_in_check():
+        position = None
+        checkmate = None
+        if self.ponderer is not None:
+            position = Position.from_game(self)
+            entry = self.ponderer.get(position)
+            in_check, checkmate = entry.in_check, entry.checkmate
+            self.legal_moves = set(entry.legal_moves)
+        else:
+            in_check = self.is_in_check()
+
+        if in_check:
             print(f"{self.cur_player.get_name()} player is in check!")
-            if self.handle_checkmate_condition():
+            if self.handle_checkmate_condition(checkmate):
                 return
 
-        input_move = input(f"{self.cur_player.get_name()}> ").strip()
+        input_move = self.book_move()
+        if input_move is None:
+            if position is not None:
+                self.ponderer.start(position)
+            try:
+                input_move = input(f"{self.cur_player.get_name()}> ").strip()
+            finally:
+                if position is not None:
+                    self.ponderer.stop()
         if not input_move:
             self.end_game_for_current_player()
             return
@@ -54,21 +158,32 @@ class InteractiveGame:
         print(f"{self.cur_player.get_name()} player action: {self.last_move}")
         self.process_move(input_move)
     
+    def book_move(self):
+        """
+        Picks the reply of the opening book if it plays for the current player.
+
+        :return: A legal move string, or None if the book has no move to play.
+        """
+        if self.book is None or self.cur_player.get_name() != self.book_side:
+            return None
+        return self.book.choose(Position.from_game(self), self.rng, self.get_legal_moves())
+
     def process_move(self, input_move):
         """
         Processes a player's move input, performing either a move or a drop action.
         """
         split = input_move.split()
-        if len(split) < 3:
+        if len(split) < 3 or split[0] not in ("move", "drop"):
             self.end_game_for_current_player()
             return
 
-        if split[0] == "move":
-            self.make_move(split)
-        elif split[0] == "drop":
-            self.drop_move(split)
-        else:
+        # The legal moves of the turn, from the ponderer or generated on first use, list
+        # every legal move, so a move they do not list is illegal.
+        legal_move = normalize_move(Position.from_game(self), move_text(split), self.get_legal_moves())
+        if legal_move is None:
             self.end_game_for_current_player()
+            return
+        self.apply_legal_move(legal_move.split())
         
     def end_game_for_current_player(self):
         """Ends the game due to an illegal move by the current player."""
@@ -76,187 +191,113 @@ class InteractiveGame:
         self.upper.print_captured_list()
         self.lower.print_captured_list()
         print()
-        other_player = self.get_other_player()
-        other_player.print_win_message("  Illegal move.")
-        self.is_game_over = True
+        self.end_game(f"{self.get_other_player().get_name()} player wins.  Illegal move.")
     
-    def handle_checkmate_condition(self):
+    def handle_checkmate_condition(self, checkmate=None):
         """
         Checks for checkmate condition. Returns True if the game ends due to checkmate.
+
+        :param checkmate: Whether the current player is checkmated, if already known,
+            e.g. from the ponderer. Looked up with has_legal_move otherwise.
         """
-        available_moves = self.create_available_moves()
-        for move in available_moves:
-            print(move)
-        if not available_moves:
-            other_player = self.get_other_player()
-            other_player.print_win_message("  Checkmate.")
-            self.is_game_over = True
+        if checkmate is None:
+            checkmate = not self.has_legal_move()
+        if checkmate:
+            self.end_game(f"{self.get_other_player().get_name()} player wins.  Checkmate.")
             return True
+        for move in self.create_available_moves():
+            print(move)
         return False
-    def check_illegal_move(self, promote, initial_position, final_position):
-        """
-        Check if move is illegal based on promotion, start, and end positions.
-
-        :param promote: Boolean indicating where piece should be promoted
-        :param initial_position: Loc object indicating start of piece
-        :param final_position: Loc object indicating end of piece
 
-        :return Boolean indicating True if move is illegal or False if move is valid
+    def get_legal_moves(self):
         """
+        Returns the set of legal moves for the current position, computing it on first use.
+        The set is cleared after every turn.
 
-        if initial_position == final_position:
-            return True
-        
-        #Checking if locations and piece are valid
-        if (not self.board.is_valid(initial_position.get_x(), initial_position.get_y()) or 
-            not self.board.is_valid(final_position.get_x(), final_position.get_y()) or 
-            not self.board.is_occupied(initial_position.get_x(), initial_position.get_y())):
-
-            return True
-        
-        current_piece = self.board.get_piece(initial_position.get_x(), initial_position.get_y())
+        :return: A set of move strings.
+        """
+        if self.legal_moves is None:
+            self.legal_moves = set(Position.from_game(self).legal_moves())
+        return self.legal_moves
 
-        if not current_piece.belongs_to(self.cur_player):
-            return True
-        
-        if promote and (not current_piece.can_be_promoted() or current_piece.is_promoted()):
-            return True
-        
-        return False
-    
-    def make_move(self, split):
+    def apply_legal_move(self, split):
         """
-        Processes a 'move' command from the input, executing the move if it's valid.
+        Executes a move taken from get_legal_moves() without validating it again.
 
         :param split: A list of strings representing the move command and its parameters.
         """
-               
-        promote = False
-        if len(split) == 4 and split[3] == "promote":
-            promote = True
-        
-        # Converting positions from string to Loc objects
-        initial_position = Loc(ord(split[1][0]) - ord('a'), int(split[1][1]) - 1)
-        final_position = Loc(ord(split[2][0]) - ord('a'), int(split[2][1]) - 1)
-
-        if self.check_illegal_move(promote, initial_position, final_position):
-            self.end_game_for_current_player()
+        if split[0] == "drop":
+            to_drop = self.cur_player.captured_piece(split[1])
+            loc = Loc(ord(split[2][0]) - ord('a'), int(split[2][1]) - 1)
+            self.board.set_piece(loc, to_drop)
+            self.cur_player.remove_captured(to_drop)
             return
 
+        initial_position = Loc(ord(split[1][0]) - ord('a'), int(split[1][1]) - 1)
+        final_position = Loc(ord(split[2][0]) - ord('a'), int(split[2][1]) - 1)
         current_piece = self.board.get_piece(initial_position.get_x(), initial_position.get_y())
+        end_piece = self.board.get_piece(final_position.get_x(), final_position.get_y())
 
-        # Check if valid move for this piece type
-        if current_piece.can_move(self.board, initial_position, final_position):
-            #Check if piece should be promoted
-            if promote and ((self.cur_player.piece_in_promote_row(final_position) or
-                                self.cur_player.piece_in_promote_row(initial_position)) and
-                            current_piece.can_be_promoted() and not current_piece.is_promoted()):
-                current_piece.promote()
-
-            elif (self.cur_player.piece_in_promote_row(final_position) and
-                    isinstance(current_piece, Preview) and not current_piece.is_promoted()):
-                current_piece.promote()  # Force promotion without mentioning promote for Preview
-            
-            # Case 1: Destination is empty
-            if not self.board.is_occupied(final_position.get_x(), final_position.get_y()):
-                self.board.remove_piece(initial_position)
-                self.board.set_piece(final_position, current_piece)
-                # Check if putting piece here results in check - Illegal
-                if self.is_in_check():
-                    self.board.set_piece(initial_position, current_piece)
-                    self.board.remove_piece(final_position)
-                    self.end_game_for_current_player()
-                    return
-            
-            #Case 2: Destination is occupied
-            else:
-                # Check if player's own piece is occupying space.
-                end_piece = self.board.get_piece(final_position.get_x(), final_position.get_y())
-                if end_piece.belongs_to(self.cur_player):
-                    self.end_game_for_current_player()
-                    return
-                
-                # Opponent's piece is occupying space - so capture
-                end_piece.depromote()
-                end_piece.change_teams()
-                self.board.remove_piece(initial_position)
-                self.board.set_piece(final_position, current_piece)
-                
-                # Check if putting piece here results in check - Illegal
-                if self.is_in_check():
-                    self.board.set_piece(initial_position, current_piece)
-                    self.board.set_piece(final_position, end_piece)
-                    self.end_game_for_current_player()
-                    return
-                
-                self.cur_player.capture_piece(end_piece)
+        if len(split) == 4 and split[3] == "promote":
+            current_piece.promote()
+        elif (self.cur_player.piece_in_last_row(final_position) and
+                isinstance(current_piece, Preview) and not current_piece.is_promoted()):
+            current_piece.promote()  # Force promotion without mentioning promote for Preview
 
-        else:
-            self.end_game_for_current_player()
-            return
+        if end_piece is not None:
+            end_piece.depromote()
+            end_piece.change_teams()
+            self.cur_player.capture_piece(end_piece)
 
-    def drop_move(self, split):
-        """
-        Processes a 'drop' command from the input, placing a previously captured piece on the board if the move is valid.
+        self.board.remove_piece(initial_position)
+        self.board.set_piece(final_position, current_piece)
 
-        :param split: A list of strings representing the drop command and its parameters.
+    def preview_drop_allowed(self, piece, loc, drop_mate_rule=True):
         """
+        Checks the rules for dropping a Preview on an empty square: not on the player's
+        promotion row, not in a column holding another of their unpromoted Previews and,
+        with the drop mate rule, not giving immediate checkmate.
+
+        :param piece: The Preview to drop.
+        :param loc: Loc object of the empty square.
+        :param drop_mate_rule: Whether to reject a drop that gives immediate checkmate.
+        :return: True if the drop is allowed.
+        """
+        if self.cur_player.piece_in_promote_row(loc):
+            return False
 
-        to_drop = self.cur_player.captured_piece(split[1])
-        if to_drop is None:
-            self.end_game_for_current_player()
-            return
-        
-        # Creating a Loc object from the string input
-        loc = Loc(ord(split[2][0]) - ord('a'), int(split[2][1]) - 1)
-        
-        # Check if the position is valid and not occupied
-        if not self.board.is_valid(loc.get_x(), loc.get_y()) or self.board.is_occupied(loc.get_x(), loc.get_y()):
-            self.end_game_for_current_player()
-            return
+        # Check if dropping would create an illegal position (two un-promoted Preview pieces in the same column)
+        for temp_y in range(BOARD_SIZE):
+            temp = self.board.get_piece(loc.get_x(), temp_y)
+            if temp and temp.belongs_to(self.cur_player) and isinstance(temp, Preview) and not temp.is_promoted():
+                return False
 
-        # Special rules for dropping a Preview piece
-        if isinstance(to_drop, Preview):
-            if self.cur_player.piece_in_promote_row(loc):
-                self.end_game_for_current_player()
-                return
-            
-            # Check if dropping would create an illegal position
-            for temp_y in [y for y in range(loc.get_y() - 1, -1, -1)] + [y for y in range(loc.get_y() + 1, BOARD_SIZE)]:
-                temp = self.board.get_piece(loc.get_x(), temp_y)
-                if temp and temp.belongs_to(self.cur_player) and isinstance(temp, Preview) and not temp.is_promoted():
-                    self.end_game_for_current_player()
-                    return
-
-            # Simulate drop and check for checkmate scenario
-            self.board.set_piece(loc, to_drop)
-            self.cur_player = self.get_other_player()
-            if self.is_in_check() and len(self.create_available_moves()) == 0:
-                self.board.remove_piece(loc)
-                self.cur_player = self.get_other_player()
-                self.end_game_for_current_player()
-                return
-            self.cur_player = self.get_other_player()
+        if not drop_mate_rule:
+            return True
 
-        # If all checks pass, officially drop the piece
-        self.board.set_piece(loc, to_drop)
-        self.cur_player.remove_captured(to_drop)
-    
+        # Simulate drop and check for checkmate scenario. The opponent's own Preview drops
+        # are not checked for mate, as in Position.
+        self.board.set_piece(loc, piece)
+        self.cur_player = self.get_other_player()
+        mate = self.is_in_check() and not self.has_legal_move(drop_mate_rule=False)
+        self.cur_player = self.get_other_player()
+        self.board.remove_piece(loc)
+        return not mate
 
-    def get_all_drive_moves(self, available_moves, all_targets):
+    def get_all_drive_moves(self, available_moves):
         """
         Generates all valid moves for the 'drive' piece that do not result in check, adding them to the available moves.
 
         :param available_moves: A set to which valid moves will be added.
-        :param all_targets: A set of locations that represent all possible moves by the opponent.
         """
 
+        opponent_upper = self.get_other_player().get_name() == "UPPER"
         current_drive_loc = self.board.find_drive(self.cur_player)
         drive = self.board.get_piece(current_drive_loc.get_x(), current_drive_loc.get_y())
         drive.make_moves(self.board, current_drive_loc)
 
         for move in drive.get_moves():
-            if move not in all_targets:
+            if not self.board.is_attacked(move, opponent_upper):
                 if self.board.is_occupied(move.get_x(), move.get_y()):
                     cur_piece = self.board.get_piece(move.get_x(), move.get_y())
                     if not cur_piece.belongs_to(self.cur_player):
@@ -293,12 +334,85 @@ class InteractiveGame:
                     loc = Loc(i, j)
                     if not self.board.is_occupied(loc.get_x(), loc.get_y()):
                         self.board.set_piece(loc, piece)
-                        if not self.is_in_check():
+                        safe = not self.is_in_check()
+                        self.board.remove_piece(loc)
+                        if safe and (not isinstance(piece, Preview) or self.preview_drop_allowed(piece, loc)):
                             c = str(piece).lower()[0]
                             str_move = "drop " + c + " " + str(loc)
                             available_moves.add(str_move)
-                        
+
+    def has_legal_move(self, drop_mate_rule=True):
+        """
+        Checks if the current player has a move out of check, stopping at the first one found.
+        The candidates are those of create_available_moves, tried cheapest first: Drive
+        escapes, captures, interpositions on squares the opponent reaches, then drops.
+
+        :param drop_mate_rule: Whether to reject Preview drops that give immediate checkmate.
+        :return: True if create_available_moves would return at least one move.
+        """
+        opponent_upper = self.get_other_player().get_name() == "UPPER"
+        drive_loc = self.board.find_drive(self.cur_player)
+        drive = self.board.get_piece(drive_loc.get_x(), drive_loc.get_y())
+        drive.make_moves(self.board, drive_loc)
+        for move in drive.get_moves():
+            if not self.board.is_attacked(move, opponent_upper) and self.move_leaves_drive_safe(drive_loc, move, drive):
+                return True
+
+        pieces = []
+        for i in range(BOARD_SIZE):
+            for j in range(BOARD_SIZE):
+                loc = Loc(i, j)
+                cur_piece = self.board.get_piece(i, j)
+                if cur_piece is not None and cur_piece.belongs_to(self.cur_player) and loc != drive_loc:
+                    cur_piece.make_moves(self.board, loc)
+                    pieces.append((loc, cur_piece))
+
+        interpositions = []
+        for loc, cur_piece in pieces:
+            for move in cur_piece.get_moves():
+                if self.board.is_occupied(move.get_x(), move.get_y()):
+                    if self.move_leaves_drive_safe(loc, move, cur_piece):
+                        return True
+                elif self.board.is_attacked(move, opponent_upper):
+                    interpositions.append((loc, move, cur_piece))
+
+        for loc, move, cur_piece in interpositions:
+            if self.move_leaves_drive_safe(loc, move, cur_piece):
+                return True
+
+        for piece in self.cur_player.get_captured():
+            for i in range(BOARD_SIZE):
+                for j in range(BOARD_SIZE):
+                    if not self.board.is_occupied(i, j):
+                        loc = Loc(i, j)
+                        self.board.set_piece(loc, piece)
+                        safe = not self.is_in_check()
                         self.board.remove_piece(loc)
+                        if safe and (not isinstance(piece, Preview) or
+                                     self.preview_drop_allowed(piece, loc, drop_mate_rule)):
+                            return True
+        return False
+
+    def move_leaves_drive_safe(self, start, end, piece):
+        """
+        Simulates moving a piece and checks that the current player is not left in check.
+        The board is restored afterwards.
+
+        :param start: Loc object the piece moves from.
+        :param end: Loc object the piece moves to.
+        :param piece: The piece being moved.
+        :return: True if the move does not leave the current player in check.
+        """
+        captured = self.board.get_piece(end.get_x(), end.get_y())
+        self.board.set_piece(end, piece)
+        self.board.remove_piece(start)
+        safe = not self.is_in_check()
+        self.board.set_piece(start, piece)
+        if captured is None:
+            self.board.remove_piece(end)
+        else:
+            self.board.set_piece(end, captured)
+        return safe
 
     def create_available_moves(self):
         """
@@ -308,10 +422,9 @@ class InteractiveGame:
         :return: A sorted list of all possible moves that do not result in the player being in check.
         """
         available_moves = set()
-        other_player = self.get_other_player()
-        all_targets = other_player.all_possible_moves(self.board)
-        
-        self.get_all_drive_moves(available_moves, all_targets)
+        opponent_upper = self.get_other_player().get_name() == "UPPER"
+
+        self.get_all_drive_moves(available_moves)
         self.get_potential_drops(available_moves)
 
         for i in range(BOARD_SIZE):  
@@ -334,7 +447,7 @@ class InteractiveGame:
                             self.board.set_piece(loc, cur_piece)
                             self.board.set_piece(move, piece_at_move)
 
-                        if move in all_targets:
+                        if self.board.is_attacked(move, opponent_upper):
                             # Simulate moving the piece and check for check again
                             self.board.set_piece(move, cur_piece)
                             self.board.remove_piece(loc)
@@ -355,9 +468,9 @@ class InteractiveGame:
         :return: True if the king is in check; False otherwise.
         """
         drive_loc = self.board.find_drive(self.cur_player)
-        opponent = self.get_other_player()
-        all_targets = opponent.all_possible_moves(self.board)
-        return drive_loc in all_targets
+        if not drive_loc:
+            return False
+        return self.board.is_attacked(drive_loc, self.get_other_player().get_name() == "UPPER")
     
     def get_other_player(self):
         """Return the opponent player."""
@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict, deque, namedtuple
+
+from game_items.position import parse_square, flip_move
+
+# legal_moves: frozenset of the legal move strings. in_check: whether the player to
+# move is in check. checkmate: whether the player to move is checkmated.
+PonderEntry = namedtuple("PonderEntry", ["legal_moves", "in_check", "checkmate"])
+
+
+class Ponderer:
+    """
+    Analyses positions on a background thread while the interactive player is typing.
+
+    Starting from the position on the board, the positions reachable within a few
+    plies are analysed breadth first, captures and promotions before quiet moves, and
+    kept in a bounded least recently used cache. The cache is keyed on canonical
+    positions, so a position and its color-flipped twin share an entry. The thread
+    checks for cancellation after every position, so stop() returns as soon as the
+    position being analysed is done.
+    """
+
+    def __init__(self, max_entries=4096, depth=2):
+        """
+        :param max_entries: The number of positions kept in the cache.
+        :param depth: How many plies ahead of the position on the board to analyse.
+        """
+        self.max_entries = max_entries
+        self.depth = depth
+        self.cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def analyse(self, position):
+        """
+        Analyse a position and store the result in the cache.
+
+        :param position: A Position.
+        :return: A PonderEntry.
+        """
+        canonical, flipped = position.canonical()
+        legal_moves = canonical.legal_moves()
+        in_check = canonical.in_check()
+        entry = PonderEntry(frozenset(legal_moves), in_check, in_check and not legal_moves)
+        key = canonical.compact_key()
+        with self._lock:
+            self.cache[key] = entry
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return _oriented(entry, flipped)
+
+    def lookup(self, position):
+        """
+        Look up a position in the cache.
+
+        :param position: A Position.
+        :return: A PonderEntry, or None if the position was not analysed yet.
+        """
+        canonical, flipped = position.canonical()
+        key = canonical.compact_key()
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.cache.move_to_end(key)
+        return entry and _oriented(entry, flipped)
+
+    def get(self, position):
+        """
+        Look up a position, analysing it if it is not in the cache.
+
+        :param position: A Position.
+        :return: A PonderEntry.
+        """
+        return self.lookup(position) or self.analyse(position)
+
+    def start(self, position):
+        """
+        Start pondering from a position, stopping any previous pondering first.
+
+        :param position: The Position on the board.
+        """
+        self.stop()
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self._ponder, args=(position,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Cancel pondering and wait for the background thread to finish.
+        """
+        if self._thread is None:
+            return
+        self._cancel.set()
+        self._thread.join()
+        self._thread = None
+
+    def _ponder(self, position):
+        queue = deque([(position, 0)])
+        analysed = 0
+        while queue and analysed < self.max_entries:
+            if self._cancel.is_set():
+                return
+            position, depth = queue.popleft()
+            entry = self.get(position)
+            analysed += 1
+            if depth < self.depth:
+                for move in sorted(entry.legal_moves, key=lambda move: (_move_priority(position, move), move)):
+                    queue.append((position.play(move), depth + 1))
+
+
+def _oriented(entry, flipped):
+    """
+    Turn a cache entry of a canonical position into the entry of the position looked up.
+    """
+    if not flipped:
+        return entry
+    return entry._replace(legal_moves=frozenset(flip_move(move) for move in entry.legal_moves))
+
+
+def _move_priority(position, move):
+    """
+    Sort key putting captures first, then promotions, then the other moves.
+    """
+    split = move.split()
+    if split[0] == "move" and position.squares[parse_square(split[2])]:
+        return 0
+    return 1 if split[-1] == "promote" else 2
+
@@ -0,0 +1,403 @@
+import os
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+from game_items.position import square_name, parse_square
+from analysis.keyframes import encode_keyframe, decode_keyframe
+
+# Messages a subscriber may have queued before its backlog is coalesced into one delta
+DEFAULT_MAX_PENDING = 32
+
+# Seconds close() waits for slow spectators to take the final position
+DEFAULT_DRAIN_SECONDS = 5.0
+
+
+def parse_address(address):
+    """
+    Split an address into a socket family and address: 'host:port' for TCP, anything
+    else is the path of a Unix domain socket.
+
+    :param address: The address string.
+    :return: A tuple (family, address).
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def encode_snapshot(position, ply, status=""):
+    """
+    Encode a full position: 'S <ply> <board> <side> <UPPER hand> <lower hand>',
+    followed by '# <status>' if there is one.
+
+    :param position: The Position.
+    :param ply: The number of plies played.
+    :param status: A status line, e.g. a win message.
+    :return: The message line, newline included.
+    """
+    line = f"S {ply} {encode_keyframe(position)}"
+    return line + (f" # {status}" if status else "") + "\n"
+
+
+def encode_delta(before, after, ply, status=""):
+    """
+    Encode the changes between two positions: 'D <ply>', every changed square as
+    <square>=<piece> (empty after '=' for a square emptied), U=<hand> and L=<hand> for
+    changed hands, then '# <status>' if there is one. The player to move follows
+    from the ply.
+
+    :param before: The Position the receiver has.
+    :param after: The new Position.
+    :param ply: The number of plies played at the new position.
+    :param status: A status line, e.g. a win message.
+    :return: The message line, newline included.
+    """
+    tokens = ["D", str(ply)]
+    for index, (old, new) in enumerate(zip(before.squares, after.squares)):
+        if old != new:
+            tokens.append(f"{square_name(index)}={new}")
+    if before.upper_hand != after.upper_hand:
+        tokens.append("U=" + "".join(after.upper_hand))
+    if before.lower_hand != after.lower_hand:
+        tokens.append("L=" + "".join(after.lower_hand))
+    if status:
+        tokens.append("# " + status)
+    return " ".join(tokens) + "\n"
+
+
+def apply_message(state, line):
+    """
+    Apply a snapshot or delta message to a spectator's state.
+
+    :param state: A tuple (position, ply, status, snapshot side, snapshot ply), or None before the first snapshot.
+    :param line: The message line.
+    :return: The new state tuple.
+    """
+    body, _, status = line.rstrip("\n").partition(" # ")
+    tokens = body.split()
+    ply = int(tokens[1])
+    if tokens[0] == "S":
+        position = decode_keyframe(" ".join(tokens[2:]))
+        return position, ply, status, position.side, ply
+    if state is None:
+        raise ValueError("Delta received before a snapshot")
+
+    position, _, _, snapshot_side, snapshot_ply = state
+    position = position.copy()
+    for token in tokens[2:]:
+        name, _, value = token.partition("=")
+        if name == "U":
+            position.upper_hand = list(value)
+        elif name == "L":
+            position.lower_hand = list(value)
+        else:
+            position.put(parse_square(name), value)
+    if (ply - snapshot_ply) % 2:
+        position.side = "lower" if snapshot_side == "UPPER" else "UPPER"
+    else:
+        position.side = snapshot_side
+    return position, ply, status, snapshot_side, snapshot_ply
+
+
+class _Subscriber:
+    """
+    A connected spectator: its queue of encoded messages and the state it has been sent.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.pending = deque()
+        self.out = b""
+        self.base = None
+
+    def push(self, message, position, ply, status, max_pending):
+        """
+        Queue a message. When more than max_pending messages wait, they are replaced by
+        a single delta from the last state handed to the socket to the newest one, or
+        by a snapshot if nothing was handed to the socket yet.
+        """
+        self.pending.append((message, position))
+        if len(self.pending) > max_pending:
+            self.coalesce(position, ply, status)
+
+    def coalesce(self, position, ply, status):
+        """
+        Replace the queued messages by one delta from the last state handed to the
+        socket to the given one, or by a snapshot if nothing was handed to the socket yet.
+        """
+        if self.base is None:
+            message = encode_snapshot(position, ply, status)
+        else:
+            message = encode_delta(self.base, position, ply, status)
+        self.pending = deque([(message.encode(), position)])
+
+    def wants_write(self):
+        return bool(self.out or self.pending)
+
+    def flush(self):
+        """
+        Send as much as the socket accepts without blocking.
+
+        :return: False if the connection is gone.
+        """
+        while True:
+            if not self.out:
+                if not self.pending:
+                    return True
+                self.out, self.base = self.pending.popleft()
+            try:
+                sent = self.sock.send(self.out)
+            except BlockingIOError:
+                return True
+            except OSError:
+                return False
+            self.out = self.out[sent:]
+
+
+class Broadcaster:
+    """
+    Publishes the positions of a game to any number of spectators over a socket.
+
+    The game calls publish() after every move, and publish_status() with the result
+    once it ends. Every move is encoded once as a delta
+    and queued for every spectator; spectators joining late are first sent a snapshot.
+    Sockets are written without blocking from a background thread, so a slow
+    spectator never holds up the game or the others: once it has too many messages
+    waiting, they are coalesced into one delta.
+    """
+
+    def __init__(self, address, max_pending=DEFAULT_MAX_PENDING):
+        """
+        :param address: 'host:port' or the path of a Unix domain socket to listen on.
+        :param max_pending: Messages a spectator may have queued before coalescing.
+        """
+        family, self.address = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(self.address)
+        self.server.listen(128)
+        self.server.setblocking(False)
+        self.max_pending = max_pending
+        self.position = None
+        self.ply = 0
+        self.status = ""
+        self.subscribers = {}
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.server, selectors.EVENT_READ)
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, position, status=""):
+        """
+        Send a new position of the game to every spectator.
+
+        :param position: The Position after the latest move, or the starting position.
+        :param status: A status line, e.g. a win message.
+        """
+        with self._lock:
+            if self.position is None:
+                message = encode_snapshot(position, self.ply, status)
+            else:
+                self.ply += 1
+                message = encode_delta(self.position, position, self.ply, status)
+            message = message.encode()
+            self.position, self.status = position, status
+            for subscriber in self.subscribers.values():
+                subscriber.push(message, position, self.ply, status, self.max_pending)
+        self._wake()
+
+    def publish_status(self, status):
+        """
+        Send a status line to every spectator without a new position or ply, e.g. the
+        result of the game.
+
+        :param status: The status line.
+        """
+        with self._lock:
+            if self.position is None:
+                return
+            message = encode_delta(self.position, self.position, self.ply, status).encode()
+            self.status = status
+            for subscriber in self.subscribers.values():
+                subscriber.push(message, self.position, self.ply, status, self.max_pending)
+        self._wake()
+
+    def _wake(self):
+        """
+        Wake the background thread. A full wake socket already holds a wake-up.
+        """
+        try:
+            self._wake_w.send(b"\0")
+        except BlockingIOError:
+            pass
+
+    def close(self, drain_seconds=DEFAULT_DRAIN_SECONDS):
+        """
+        Stop serving and disconnect every spectator, once it has the final position
+        and status.
+
+        The queue of every spectator still behind is coalesced into one message
+        bringing it to the final position, and the sockets are drained for at most
+        drain_seconds, so a spectator that stopped reading cannot hold up the game's exit.
+
+        :param drain_seconds: Seconds to wait for slow spectators.
+        """
+        self._closed = True
+        self._wake()
+        self._thread.join()
+        self._selector.unregister(self.server)
+        self._selector.unregister(self._wake_r)
+        if self.position is not None:
+            for subscriber in self.subscribers.values():
+                if subscriber.pending:
+                    subscriber.coalesce(self.position, self.ply, self.status)
+        self._drain(drain_seconds)
+        self._selector.close()
+        for subscriber in self.subscribers.values():
+            subscriber.sock.close()
+        self.server.close()
+        self._wake_r.close()
+        self._wake_w.close()
+        if self.server.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def _drain(self, seconds):
+        """
+        Send every spectator what it has queued, dropping those that disconnect, until
+        all are done or the time is up.
+        """
+        deadline = time.monotonic() + seconds
+        for sock, subscriber in list(self.subscribers.items()):
+            if subscriber.wants_write():
+                self._selector.modify(sock, selectors.EVENT_WRITE)
+            else:
+                self._selector.unregister(sock)
+        while self._selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in self._selector.select(remaining):
+                sock = key.fileobj
+                subscriber = self.subscribers[sock]
+                if not subscriber.flush():
+                    self._drop(sock)
+                elif not subscriber.wants_write():
+                    self._selector.unregister(sock)
+
+    def _accept(self):
+        try:
+            sock, _ = self.server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        subscriber = _Subscriber(sock)
+        with self._lock:
+            if self.position is not None:
+                subscriber.push(encode_snapshot(self.position, self.ply, self.status).encode(),
+                                self.position, self.ply, self.status, self.max_pending)
+            self.subscribers[sock] = subscriber
+        self._selector.register(sock, selectors.EVENT_READ)
+
+    def _drop(self, sock):
+        with self._lock:
+            self.subscribers.pop(sock, None)
+        self._selector.unregister(sock)
+        sock.close()
+
+    def _run(self):
+        while not self._closed:
+            with self._lock:
+                for sock, subscriber in self.subscribers.items():
+                    events = selectors.EVENT_READ | (selectors.EVENT_WRITE if subscriber.wants_write() else 0)
+                    if self._selector.get_key(sock).events != events:
+                        self._selector.modify(sock, events)
+            for key, events in self._selector.select():
+                sock = key.fileobj
+                if sock is self.server:
+                    self._accept()
+                elif sock is self._wake_r:
+                    try:
+                        while sock.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    alive = True
+                    if events & selectors.EVENT_READ:
+                        alive = self._recv_ok(sock)
+                    if alive and events & selectors.EVENT_WRITE:
+                        with self._lock:
+                            alive = self.subscribers[sock].flush()
+                    if not alive:
+                        self._drop(sock)
+
+    def _recv_ok(self, sock):
+        """
+        Read and discard anything a spectator sends. Returns False once it disconnects.
+        """
+        try:
+            return bool(sock.recv(4096))
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+
+class Spectator:
+    """
+    Follows a game published by a Broadcaster, rebuilding every position from the
+    snapshot and deltas received.
+    """
+
+    def __init__(self, address):
+        """
+        :param address: 'host:port' or the path of a Unix domain socket.
+        """
+        family, address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        self.file = self.sock.makefile("r")
+        self.state = None
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def updates(self):
+        """
+        Yield (position, ply, status) after every message, until the game is closed.
+        """
+        for line in self.file:
+            self.state = apply_message(self.state, line)
+            yield self.state[:3]
+
+
+def run_watch_mode(address):
+    """
+    Print the board every time a watched game changes.
+
+    :param address: 'host:port' or the path of a Unix domain socket.
+    """
+    spectator = Spectator(address)
+    try:
+        for position, ply, status in spectator.updates():
+            print(position.to_board())
+            print(f"Captures UPPER: {' '.join(position.upper_hand)}")
+            print(f"Captures lower: {' '.join(position.lower_hand)}")
+            print()
+            print(status or f"{position.side}>")
+    finally:
+        spectator.close()
@@ -0,0 +1,165 @@
+import io
+import os
+import random
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+from game_items.gamevars import MOVE_LIMIT
+from game_items.board import Board
+from game_items.position import Position, square_name
+from game_modes.filegame import replay_game
+from analysis.policies import get_policy
+
+# Reason recorded for a game file mode leaves unfinished: the player to move has no legal
+# move but is not in check, which the file format cannot express, as no move follows
+NOT_FINISHED = "Not finished."
+
+
+def initial_position():
+    """
+    Return the starting position of a BoxShogi game.
+    """
+    board = Board()
+    board.init_pieces()
+    squares = [board.board[x][y] for x in range(len(board.board)) for y in range(len(board.board))]
+    return Position(squares)
+
+
+def format_game(position, moves):
+    """
+    Write a game in the file mode format read by utils.parseTestCase.
+
+    :param position: The starting Position.
+    :param moves: The list of move strings played from it.
+    :return: The contents of the .in file.
+    """
+    lines = [f"{piece_repr} {square_name(index)}" for index, piece_repr in enumerate(position.squares) if piece_repr]
+    lines.append("")
+    lines.append("[" + " ".join(position.upper_hand) + "]")
+    lines.append("[" + " ".join(position.lower_hand) + "]")
+    lines.append("")
+    lines.extend(moves)
+    return "\n".join(lines) + "\n"
+
+
+def play_game(position, lower_policy, upper_policy, rng):
+    """
+    Play one game between two policies.
+
+    :param position: The starting Position.
+    :param lower_policy: Policy callable for the lower player.
+    :param upper_policy: Policy callable for the UPPER player.
+    :param rng: A random.Random instance handed to the policies.
+    :return: A tuple (moves, winner, reason). winner is None for a tie, or when the
+        player to move has no legal move without being in check ("Stalemate.").
+    """
+    moves = []
+    while len(moves) < MOVE_LIMIT:
+        legal_moves = position.legal_moves()
+        if not legal_moves:
+            if position.in_check():
+                return moves, position.other_side(), "Checkmate."
+            return moves, None, "Stalemate."
+        policy = upper_policy if position.side == "UPPER" else lower_policy
+        move = policy(position, legal_moves, rng)
+        moves.append(move)
+        position = position.play(move)
+    return moves, None, "Too many moves."
+
+
+def _run_tournament_game(task):
+    """
+    Worker entry point: play one game and write its .in file.
+
+    The result recorded is the one file mode gives for the file written, so that the
+    games can serve as a regression corpus: a stalemate, for one, is left unfinished.
+
+    :param task: A tuple (game_id, lower_name, upper_name, seed, out_dir).
+    :return: A tuple (game_id, lower_name, upper_name, winner, reason, plies).
+    """
+    game_id, lower_name, upper_name, seed, out_dir = task
+    start = initial_position()
+    moves, _, _ = play_game(start, get_policy(lower_name), get_policy(upper_name), random.Random(seed))
+    text = format_game(start, moves)
+    with open(os.path.join(out_dir, f"game{game_id:06d}.in"), "w") as f:
+        f.write(text)
+    result = replay_game(io.StringIO(text))
+    reason = f"{result.reason}." if result.reason else NOT_FINISHED
+    return game_id, lower_name, upper_name, result.winner, reason, result.plies
+
+
+def run_tournament(games, out_dir, policy_names, workers=None, seed=0):
+    """
+    Play games between every pair of policies across a pool of worker processes.
+
+    Each pairing is played with both colour assignments in turn. Every game is
+    written to out_dir as a .in file, and a results.csv summary is written next to them.
+    Results are those of file mode for the files: winner 'tie' for a drawn game, and
+    'none' with reason NOT_FINISHED for a game file mode leaves unfinished.
+
+    :param games: The total number of games to play.
+    :param out_dir: The directory to write games and results to.
+    :param policy_names: Names of the policies taking part, see analysis.policies.get_policy.
+    :param workers: Number of worker processes, defaults to the number of CPUs.
+    :param seed: Base random seed; game i uses seed + i.
+    :return: A list of result tuples, ordered by game id.
+    """
+    for name in policy_names:
+        get_policy(name)
+    os.makedirs(out_dir, exist_ok=True)
+    pairings = [(a, b) for a in policy_names for b in policy_names if a != b] or [(policy_names[0], policy_names[0])]
+    tasks = []
+    for game_id in range(games):
+        lower_name, upper_name = pairings[game_id % len(pairings)]
+        tasks.append((game_id, lower_name, upper_name, seed + game_id, out_dir))
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, games // (workers * 8))
+    with Pool(workers) as pool:
+        results = sorted(pool.imap_unordered(_run_tournament_game, tasks, chunksize))
+
+    with open(os.path.join(out_dir, "results.csv"), "w") as f:
+        f.write("game,lower,upper,winner,reason,plies\n")
+        for game_id, lower_name, upper_name, winner, reason, plies in results:
+            f.write(f"game{game_id:06d}.in,{lower_name},{upper_name},{winner or ('none' if reason == NOT_FINISHED else 'tie')},{reason},{plies}\n")
+    return results
+
+
+def print_tournament_stats(results, seconds):
+    """
+    Print per-policy scores and overall statistics of a tournament. Games without a
+    winner, unfinished ones included, count as ties.
+
+    :param results: The list returned by run_tournament.
+    :param seconds: The wall clock time taken.
+    """
+    wins, losses, ties = Counter(), Counter(), Counter()
+    reasons = Counter()
+    total_plies = 0
+    for _, lower_name, upper_name, winner, reason, plies in results:
+        reasons[reason] += 1
+        total_plies += plies
+        if winner is None:
+            ties[lower_name] += 1
+            ties[upper_name] += 1
+        else:
+            winner_name, loser_name = (lower_name, upper_name) if winner == "lower" else (upper_name, lower_name)
+            wins[winner_name] += 1
+            losses[loser_name] += 1
+
+    print(f"Games: {len(results)} in {seconds:.1f}s ({len(results) / max(seconds, 1e-9):.1f} games/sec)")
+    print(f"Average length: {total_plies / max(len(results), 1):.1f} plies")
+    for name in sorted(set(wins) | set(losses) | set(ties)):
+        print(f"{name}: {wins[name]} wins, {losses[name]} losses, {ties[name]} ties")
+    for reason, count in reasons.most_common():
+        print(f"{reason} {count}")
+
+
+def run_tournament_mode(games, out_dir, policy_names, workers=None):
+    """
+    Run a tournament from the command line and print its statistics.
+    """
+    start = time.time()
+    results = run_tournament(games, out_dir, policy_names, workers)
+    print_tournament_stats(results, time.time() - start)
@@ -0,0 +1,388 @@
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from multiprocessing import Process
+
+from game_modes.daemon import run_request
+from game_modes.spectate import parse_address
+from analysis.archive import iter_game_files, output_paths
+
+DEFAULT_BATCH_SIZE = 16
+
+# Attempts of a batch before its games are reported as failed
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Seconds a worker may take over a batch before it is handed to another worker
+DEFAULT_LEASE_SECONDS = 300
+
+# Seconds the coordinator waits without any worker connecting or batch ending before it gives up
+DEFAULT_IDLE_SECONDS = 900
+
+
+def _send(sock, message):
+    sock.sendall((json.dumps(message) + "\n").encode())
+
+
+def expected_output(path):
+    """
+    Read the expected output stored next to a game file, game.out for game.in.
+
+    :param path: Path to the game file.
+    :return: The expected output, or None if there is none.
+    """
+    out_path = os.path.splitext(path)[0] + ".out"
+    if not os.path.exists(out_path):
+        return None
+    with open(out_path) as f:
+        return f.read()
+
+
+def same_output(output, expected):
+    """
+    Compare two file mode outputs, ignoring trailing whitespace as the test runner does.
+    """
+    def lines(text):
+        return [line.rstrip() for line in text.rstrip().splitlines()]
+    return lines(output) == lines(expected)
+
+
+class Coordinator:
+    """
+    Hands out batches of game files to workers connecting over TCP and collects the
+    output of file mode for every game.
+
+    The protocol is one JSON object per line. A worker says hello, is sent a batch
+    holding the text of its games, and answers with the outputs or an error, until it
+    is told the work is done. A batch whose worker reports an error or disconnects is
+    queued again, and so is a batch held for longer than the lease; the worker keeps
+    its connection and its late answer is still used if the batch is not finished by
+    then. After max_attempts the games of a batch are reported as failed.
+    """
+
+    def __init__(self, address, paths, batch_size=DEFAULT_BATCH_SIZE, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, idle_seconds=DEFAULT_IDLE_SECONDS, progress=None):
+        """
+        :param address: 'host:port' to listen on, port 0 to pick a free port.
+        :param paths: Files, directories or glob patterns, see analysis.archive.iter_game_files().
+        :param batch_size: The number of games per batch.
+        :param max_attempts: Attempts of a batch before its games are reported as failed.
+        :param lease_seconds: Seconds a worker may take over a batch.
+        :param idle_seconds: Seconds run() waits for a worker to connect or a batch to end before giving up.
+        :param progress: Optional callable receiving a status string after every batch.
+        """
+        files = iter_game_files(paths)
+        self.batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+        self.pending = deque(range(len(self.batches)))
+        self.attempts = [0] * len(self.batches)
+        self.done = [False] * len(self.batches)
+        # batch number -> (deadline, connection, worker name) of the worker holding it
+        self.leases = {}
+        self.finished_batches = 0
+        self.outputs = {}
+        self.failures = {}
+        self.workers = set()
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.idle_seconds = idle_seconds
+        self.progress = progress
+        self.closed = False
+        self._condition = threading.Condition()
+        self._threads = []
+        self._connections = []
+        # Bumped whenever a worker says hello or a batch ends, to tell an idle run from a slow one
+        self._activity = 0
+
+        _, address = parse_address(address)
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(address)
+        self.server.listen(128)
+        self.server.settimeout(0.2)
+        host, port = self.server.getsockname()
+        self.address = f"{host}:{port}"
+
+    def finished(self):
+        return self.finished_batches == len(self.batches)
+
+    def run(self, alive=None):
+        """
+        Serve workers until every batch is finished.
+
+        :param alive: Optional callable returning False once no worker is left to
+            connect or answer, e.g. when every local worker process has exited.
+        :return: A tuple (outputs, failures): dicts mapping game file paths to the
+            output of file mode, and to the error of the last failed attempt.
+        :raises ConnectionError: If alive() returns False, or no worker connects and no
+            batch ends for idle_seconds, before every batch is finished.
+        """
+        activity, last_activity = self._activity, time.monotonic()
+        try:
+            while not self.finished():
+                try:
+                    conn, _ = self.server.accept()
+                    thread = threading.Thread(target=self._handle, args=(conn,), daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+                    self._connections.append(conn)
+                except socket.timeout:
+                    pass
+                self._expire_leases()
+                if self.finished():
+                    break
+                if alive is not None and not alive():
+                    raise ConnectionError(f"Every worker exited with {self._unfinished()}")
+                if self._activity != activity:
+                    activity, last_activity = self._activity, time.monotonic()
+                elif time.monotonic() - last_activity > self.idle_seconds:
+                    raise ConnectionError(f"No worker activity for {self.idle_seconds} seconds "
+                                          f"with {self._unfinished()}")
+        finally:
+            self.server.close()
+            with self._condition:
+                self.closed = True
+                self._condition.notify_all()
+            # Wake the handlers still waiting for a worker that will not answer
+            for conn in self._connections:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            for thread in self._threads:
+                thread.join(1)
+        return self.outputs, self.failures
+
+    def _unfinished(self):
+        return f"{len(self.batches) - self.finished_batches} of {len(self.batches)} batches unfinished"
+
+    def _next_batch(self, conn, name):
+        """
+        Wait for a batch to hand out, and lease it to a worker.
+
+        :param conn: The connection of the worker.
+        :param name: The name of the worker.
+        :return: The batch number, or None once every batch is finished.
+        """
+        with self._condition:
+            while not self.pending and not self.finished() and not self.closed:
+                self._condition.wait()
+            if not self.pending or self.closed:
+                return None
+            batch = self.pending.popleft()
+            self.leases[batch] = (time.monotonic() + self.lease_seconds, conn, name)
+            return batch
+
+    def _expire_leases(self):
+        """
+        Queue the batches whose lease ran out again.
+        """
+        now = time.monotonic()
+        with self._condition:
+            for batch, (deadline, _, name) in list(self.leases.items()):
+                if deadline < now:
+                    del self.leases[batch]
+                    self._retry(batch, f"{name}: lease of {self.lease_seconds} seconds expired")
+
+    def _handle(self, conn):
+        """
+        Serve one worker connection.
+        """
+        reader = conn.makefile("rb")
+        name = None
+        batch = None
+        try:
+            hello = json.loads(reader.readline())
+            name = hello.get("worker", "?")
+            with self._condition:
+                self.workers.add(name)
+                self._activity += 1
+            while True:
+                batch = self._next_batch(conn, name)
+                if batch is None:
+                    _send(conn, {"type": "done"})
+                    return
+                games = []
+                for path in self.batches[batch]:
+                    try:
+                        with open(path) as f:
+                            games.append([path, f.read()])
+                    except OSError as e:
+                        with self._condition:
+                            self.outputs[path] = f"Error with opening filepath: {e}\n"
+                _send(conn, {"type": "batch", "id": batch, "games": games})
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError("worker disconnected")
+                message = json.loads(line)
+                if message.get("type") == "result":
+                    self._complete(batch, message["outputs"])
+                else:
+                    self._fail(batch, conn, f"{name}: {message.get('error', 'bad reply')}")
+                batch = None
+        except (OSError, ValueError) as e:
+            if batch is not None:
+                self._fail(batch, conn, f"{name}: {e}")
+        finally:
+            with self._condition:
+                self.workers.discard(name)
+            reader.close()
+            conn.close()
+
+    def _complete(self, batch, outputs):
+        with self._condition:
+            # A batch queued again after its lease expired may be answered twice
+            if self.done[batch]:
+                return
+            self.done[batch] = True
+            self.leases.pop(batch, None)
+            if batch in self.pending:
+                self.pending.remove(batch)
+            self.outputs.update(outputs)
+            self.finished_batches += 1
+            self._activity += 1
+            self._report()
+            self._condition.notify_all()
+
+    def _fail(self, batch, conn, error):
+        with self._condition:
+            # Only the worker holding the lease may give the batch back
+            lease = self.leases.get(batch)
+            if lease is None or lease[1] is not conn:
+                return
+            del self.leases[batch]
+            self._retry(batch, error)
+
+    def _retry(self, batch, error):
+        with self._condition:
+            self.attempts[batch] += 1
+            if self.attempts[batch] < self.max_attempts:
+                self.pending.append(batch)
+            else:
+                for path in self.batches[batch]:
+                    self.failures[path] = error
+                self.done[batch] = True
+                self.finished_batches += 1
+            self._activity += 1
+            self._report()
+            self._condition.notify_all()
+
+    def _report(self):
+        if self.progress:
+            self.progress(f"{self.finished_batches}/{len(self.batches)} batches, {len(self.outputs)} games replayed, "
+                          f"{len(self.failures)} failed, {len(self.workers)} workers")
+
+
+def _connect(address, connect_seconds):
+    deadline = time.monotonic() + connect_seconds
+    while True:
+        try:
+            return socket.create_connection(address)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def run_worker(address, name=None, connect_seconds=30.0):
+    """
+    Replay batches of games handed out by a Coordinator until it has no more.
+
+    A worker whose connection drops connects again and carries on. It stops when the
+    coordinator says the work is done, or can no longer be reached.
+
+    :param address: The 'host:port' of the coordinator.
+    :param name: The name reported to the coordinator, defaults to host:pid.
+    :param connect_seconds: How long to keep trying to connect, so workers may be started first.
+    :return: The number of batches replayed.
+    """
+    _, address = parse_address(address)
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    batches = 0
+    sock = _connect(address, connect_seconds)
+    while True:
+        try:
+            with sock, sock.makefile("rb") as reader:
+                _send(sock, {"type": "hello", "worker": name})
+                for line in reader:
+                    message = json.loads(line)
+                    if message["type"] == "done":
+                        return batches
+                    try:
+                        outputs = {path: run_request("text\n" + text) for path, text in message["games"]}
+                    except Exception as e:
+                        _send(sock, {"type": "error", "id": message["id"], "error": repr(e)})
+                        continue
+                    _send(sock, {"type": "result", "id": message["id"], "outputs": outputs})
+                    batches += 1
+        except OSError:
+            pass
+        try:
+            sock = _connect(address, connect_seconds)
+        except OSError:
+            return batches
+
+
+def print_validation(outputs, failures, out_dir=None):
+    """
+    Compare the outputs with the expected ones stored next to the game files and print
+    every mismatch and failure, then a summary. Outputs are written to
+    <out_dir>/<name>.out if out_dir is given, mirroring the directories of the game
+    files (see analysis.archive.output_paths()).
+
+    :return: True if every game was replayed and matched its expected output, if any.
+    """
+    out_paths = output_paths(sorted(set(outputs) | set(failures)), out_dir) if out_dir else {}
+    checked = mismatched = 0
+    for path in sorted(outputs):
+        if out_dir:
+            os.makedirs(os.path.dirname(out_paths[path]), exist_ok=True)
+            with open(out_paths[path], "w") as f:
+                f.write(outputs[path])
+        expected = expected_output(path)
+        if expected is None:
+            continue
+        checked += 1
+        if not same_output(outputs[path], expected):
+            mismatched += 1
+            print(f"MISMATCH {path}")
+    for path in sorted(failures):
+        print(f"FAILED {path}: {failures[path]}")
+    print(f"Replayed {len(outputs)} games, {checked} checked against expected outputs, "
+          f"{mismatched} mismatched, {len(failures)} failed.")
+    return mismatched == 0 and not failures
+
+
+def run_coordinator_mode(address, paths, batch_size=DEFAULT_BATCH_SIZE, out_dir=None):
+    """
+    Coordinate the validation of game files by workers on any number of hosts.
+    """
+    coordinator = Coordinator(address, paths, batch_size, progress=print)
+    print(f"Coordinating {len(coordinator.batches)} batches on {coordinator.address}")
+    try:
+        results = coordinator.run()
+    except ConnectionError as e:
+        print(f"Validation stopped: {e}")
+        return
+    print_validation(*results, out_dir)
+
+
+def run_validate_mode(paths, workers=None, batch_size=DEFAULT_BATCH_SIZE, out_dir=None):
+    """
+    Validate game files with a coordinator on localhost and local worker processes.
+    """
+    coordinator = Coordinator("127.0.0.1:0", paths, batch_size, progress=print)
+    processes = [Process(target=run_worker, args=(coordinator.address, f"local-{i}"), daemon=True)
+                 for i in range(workers or os.cpu_count() or 1)]
+    for process in processes:
+        process.start()
+    try:
+        results = coordinator.run(alive=lambda: any(process.is_alive() for process in processes))
+    except ConnectionError as e:
+        print(f"Validation stopped: {e}")
+        return
+    finally:
+        for process in processes:
+            process.join(5)
+    print_validation(*results, out_dir)
@@ -58,12 +58,12 @@ class Governance(Piece):
         dx = end.get_x() - start.get_x()
         dy = end.get_y() - start.get_y()
         
-        # Check for diagonal movement
-        if abs(dx) == abs(dy):
-            direction = (dx, dy)  
-        # Check for orthogonal movement if promoted
-        elif self.promoted and ((dx == 0 and dy != 0) or (dy == 0 and dx != 0)):
-            direction = (dx, dy) 
+        # Check for diagonal movement, one square at a time along the path
+        if abs(dx) == abs(dy) and dx != 0:
+            direction = (dx // abs(dx), dy // abs(dy))
+        # Check for a single orthogonal step if promoted
+        elif self.promoted and abs(dx) + abs(dy) == 1:
+            direction = (dx, dy)
         else:
             return False  # The move is not allowed
         
@@ -36,7 +36,7 @@ class Notes(Piece):
         # Check for basic horizontal or vertical movement
         if dx == 0 or dy == 0:  # Horizontal or vertical move
             if abs(dx) > 1 or abs(dy) > 1:  # Moves more than one square
-                direction = (dx, dy)  # Normalize direction for more than one step
+                direction = ((dx > 0) - (dx < 0), (dy > 0) - (dy < 0))  # One square at a time along the path
                 return self.is_path_clear(board, start, end, direction)
             # Single step horizontal or vertical move
             return board.is_valid(end_x, end_y) and (not board.is_occupied(end_x, end_y) or board.is_capturable(end_x, end_y, self))
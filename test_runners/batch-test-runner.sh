@@ -0,0 +1,64 @@
+#!/bin/bash
+
+# Replays the games in test_cases, prefixes of them and prefixes of a few tournament
+# games, which share their opening moves, in one batch, and compares the output written
+# for every game with the output of file mode. Then does the same for test_cases_rep
+# with the repetition rule on.
+
+echo "Running batch test runner."
+
+gameDir=$(mktemp -d)
+outDir=$(mktemp -d)
+cp test_cases/*.in $gameDir
+python3 boxshogi.py -tournament 6 $gameDir/tournament random greedy > /dev/null
+python3 - $gameDir test_cases/*.in $gameDir/tournament/*.in <<'EOF2'
+import os
+import sys
+
+from utils import parseTestCase
+
+game_dir = sys.argv[1]
+for path in sys.argv[2:]:
+    with open(path) as f:
+        lines = f.read().rstrip().splitlines()
+    num_moves = len(parseTestCase(path)['moves'])
+    setup = lines[:len(lines) - num_moves]
+    name = os.path.splitext(os.path.basename(path))[0]
+    for length in sorted({num_moves // 3, 2 * num_moves // 3} | set(range(0, num_moves, 25))):
+        with open(os.path.join(game_dir, f"{name}Prefix{length}.in"), "w") as f:
+            f.write("\n".join(setup + lines[len(setup):len(setup) + length]) + "\n")
+EOF2
+
+actualFile="batchTestResult.out"
+passed=0
+failed=0
+compare() {
+    if cmp -s "$1" $actualFile; then
+        passed=$((passed + 1))
+    else
+        failed=$((failed + 1))
+        echo "❌ $2"
+        diff -y "$1" $actualFile
+    fi
+}
+
+python3 boxshogi.py -batch $gameDir -out $outDir
+for game in $gameDir/*.in $gameDir/tournament/*.in; do
+    name="${game#$gameDir/}"
+    python3 boxshogi.py -f "$game" > $actualFile
+    compare "$outDir/${name%.in}.out" "$name"
+done
+
+rm -rf $outDir/*
+python3 boxshogi.py -batch test_cases_rep -out $outDir -rep
+for game in test_cases_rep/*.in; do
+    name=$(basename "${game%.in}")
+    cp "${game%.in}.out" $actualFile
+    compare "$outDir/$name.out" "$game (-rep)"
+done
+rm -rf $gameDir $outDir $actualFile
+
+echo "$passed passed, $failed failed."
+if [ $failed -ne 0 ]; then
+    exit 1
+fi
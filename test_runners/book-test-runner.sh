@@ -0,0 +1,104 @@
+#!/bin/bash
+
+# Builds an opening book from a short tournament and from the color-flipped twins of
+# its games, then probes every position of the games and compares the book moves
+# with counts taken over the games, a position and its twin counting together.
+
+echo "Running opening book test runner."
+
+plies=8
+gameDir=$(mktemp -d)
+bookFile="$gameDir/openings.bk"
+python3 boxshogi.py -tournament 20 $gameDir/games random random > /dev/null
+python3 - $gameDir <<'EOF2'
+import glob
+import os
+import sys
+
+from analysis.archive import replay_file
+from game_items.position import flip_move
+from game_modes.tournament import format_game
+from utils import parseTestCase
+
+# The twin of a game starts after its first move, seen from the other player
+os.makedirs(os.path.join(sys.argv[1], "flipped"))
+for path in sorted(glob.glob(os.path.join(sys.argv[1], "games", "*.in"))):
+    moves = parseTestCase(path)['moves']
+    position = next(position for ply, position, _ in replay_file(path) if ply == 1)
+    with open(os.path.join(sys.argv[1], "flipped", os.path.basename(path)), "w") as f:
+        f.write(format_game(position.flipped(), [flip_move(move) for move in moves[1:]]))
+EOF2
+python3 boxshogi.py -bookgen $bookFile $gameDir/games $gameDir/flipped -plies $plies > /dev/null
+python3 - $bookFile $plies $gameDir/games/*.in $gameDir/flipped/*.in <<'EOF2'
+import sys
+from collections import Counter
+
+from analysis.archive import replay_file
+from analysis.book import OpeningBook
+from game_items.position import flip_move
+from game_modes.filegame import replay_game
+
+book = OpeningBook(sys.argv[1])
+plies = int(sys.argv[2])
+
+
+def twin_key(position):
+    """The key shared by a position and its twin, and whether the position is the flipped one."""
+    key, flipped_key = position.key(), position.flipped().key()
+    return min(key, flipped_key), flipped_key < key
+
+
+games = Counter()
+wins = Counter()
+losses = Counter()
+orientations = {}
+positions = []
+for path in sys.argv[3:]:
+    result = replay_game(path)
+    for ply, position, move in replay_file(path):
+        positions.append(position)
+        if move is None or ply >= min(plies, result.plies):
+            continue
+        key, flipped = twin_key(position)
+        entry = (key, flip_move(move) if flipped else move)
+        games[entry] += 1
+        wins[entry] += result.winner == position.side
+        losses[entry] += result.winner == position.other_side()
+        orientations.setdefault(key, set()).add(flipped)
+
+
+def expected_moves(position):
+    key, flipped = twin_key(position)
+    return sorted((flip_move(move) if flipped else move, games[key, move], wins[key, move], losses[key, move])
+                  for entry_key, move in games if entry_key == key)
+
+
+def probes():
+    wrong = [position for position in positions
+             if sorted((m.move, m.games, m.wins, m.losses) for m in book.probe(position)) != expected_moves(position)]
+    if wrong:
+        print(wrong[0].to_board())
+    return not wrong
+
+
+def book_size():
+    return book.size == len(games)
+
+
+def twins_merged():
+    return any(len(flipped) == 2 for flipped in orientations.values())
+
+
+passed = failed = 0
+for check in (probes, book_size, twins_merged):
+    if check():
+        passed += 1
+    else:
+        failed += 1
+        print(f"❌ {check.__name__}")
+print(f"{passed} passed, {failed} failed.")
+sys.exit(1 if failed else 0)
+EOF2
+status=$?
+rm -rf $gameDir
+exit $status
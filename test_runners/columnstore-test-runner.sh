@@ -0,0 +1,98 @@
+#!/bin/bash
+
+# Stores test_cases and then a short tournament in a column store, in two runs, and
+# checks every game and move row against a replay of its game, and the statistics
+# against the same sums taken over the replays, also printed by -stats. A third run
+# must add nothing.
+
+echo "Running column store test runner."
+
+gameDir=$(mktemp -d)
+storeDir=$(mktemp -d)
+python3 boxshogi.py -tournament 10 $gameDir random random > /dev/null
+python3 boxshogi.py -store $storeDir test_cases > /dev/null
+python3 boxshogi.py -store $storeDir $gameDir > /dev/null
+python3 boxshogi.py -store $storeDir test_cases $gameDir > /dev/null
+python3 - $storeDir test_cases/*.in $gameDir/*.in <<'EOF2'
+import subprocess
+import sys
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    print("numpy is not installed, skipping.")
+    sys.exit(0)
+
+from analysis.archive import replay_file
+from analysis.columnstore import ColumnStore, WINNERS, REASONS
+from analysis.export import action_move
+from game_items.position import PIECE_REPRS, parse_square
+from game_modes.filegame import replay_game
+
+store = ColumnStore(sys.argv[1])
+results = {path: replay_game(path) for path in sys.argv[2:]}
+moves = {path: [(position.squares[parse_square(move.split()[2])] if move.startswith("move") else "",
+                 move, position.play(move).in_check())
+                for ply, position, move in replay_file(path) if move is not None][:results[path].plies]
+         for path in results}
+
+
+def games_stored_once():
+    return sorted(store.game_paths) == sorted(results)
+
+
+def game_rows():
+    games = store.games
+    return all((WINNERS[games["winner"][i]], REASONS[games["reason"][i]], games["plies"][i])
+               == (results[path].winner, results[path].reason, results[path].plies)
+               for i, path in enumerate(store.game_paths))
+
+
+def move_rows():
+    plies = store.plies
+    for i, path in enumerate(store.game_paths):
+        start = store.games["ply_start"][i]
+        rows = range(start, start + store.games["plies"][i])
+        stored = [(PIECE_REPRS[plies["captured"][row] - 1] if plies["captured"][row] else "",
+                   action_move(plies["move"][row]), bool(plies["check"][row])) for row in rows]
+        if (stored != moves[path] or list(plies["game"][rows.start:rows.stop]) != [i] * len(rows)
+                or list(plies["ply"][rows.start:rows.stop]) != list(range(len(rows)))):
+            print(f"{path}: stored move rows differ from the replay")
+            return False
+    return len(plies["game"]) == sum(len(played) for played in moves.values())
+
+
+def statistics():
+    played = [move for game in moves.values() for move in game]
+    first_moves = Counter((game[0][1], results[path].winner) for path, game in moves.items() if game)
+    win_rates = {move: (sum(count for (m, _), count in first_moves.items() if m == move),
+                        first_moves[move, "lower"], first_moves[move, "UPPER"], first_moves[move, None])
+                 for move, _ in first_moves}
+    captures = Counter(captured[-1].lower() for captured, _, _ in played if captured)
+    return (store.average_length() == np.mean([result.plies for result in results.values()])
+            and store.check_rate() == np.mean([check for _, _, check in played])
+            and store.reason_rates() == {reason: sum(result.reason == reason for result in results.values()) / len(results)
+                                         for reason in REASONS}
+            and {letter: count for letter, (count, _) in store.capture_frequency().items() if count} == captures
+            and store.win_rates_by_first_move() == win_rates)
+
+
+def stats_mode():
+    stats = subprocess.run([sys.executable, "boxshogi.py", "-stats", sys.argv[1]], capture_output=True, text=True)
+    return stats.returncode == 0 and stats.stdout.startswith(f"Games: {len(results)}  moves: {len(store.plies['game'])}")
+
+
+passed = failed = 0
+for check in (games_stored_once, game_rows, move_rows, statistics, stats_mode):
+    if check():
+        passed += 1
+    else:
+        failed += 1
+        print(f"❌ {check.__name__}")
+print(f"{passed} passed, {failed} failed.")
+sys.exit(1 if failed else 0)
+EOF2
+status=$?
+rm -rf $gameDir $storeDir
+exit $status
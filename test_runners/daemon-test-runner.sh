@@ -0,0 +1,51 @@
+#!/bin/bash
+
+# Starts the daemon, sends it every game in test_cases both as a path and as game
+# text through boxshogi_client.py, and compares each reply with the output of file
+# mode. Then stops the daemon and checks that it removed its socket.
+
+echo "Running daemon test runner."
+
+socketDir=$(mktemp -d)
+socketPath="$socketDir/boxshogi.sock"
+python3 boxshogi.py -daemon $socketPath -workers 2 > /dev/null 2>&1 &
+daemon=$!
+for attempt in $(seq 50); do
+    if [ -S $socketPath ]; then
+        break
+    fi
+    sleep 0.1
+done
+
+expectedFile="daemonTestExpected.out"
+actualFile="daemonTestResult.out"
+passed=0
+failed=0
+for game in test_cases/*.in; do
+    python3 boxshogi.py -f "$game" > $expectedFile
+    for request in "-f $game" "-t"; do
+        python3 boxshogi_client.py $request -s $socketPath < "$game" > $actualFile
+        if cmp -s $expectedFile $actualFile; then
+            passed=$((passed + 1))
+        else
+            failed=$((failed + 1))
+            echo "❌ $game ($request)"
+            diff -y $expectedFile $actualFile
+        fi
+    done
+done
+
+kill $daemon
+wait $daemon
+if [ -e $socketPath ]; then
+    failed=$((failed + 1))
+    echo "❌ socket left behind after the daemon stopped"
+else
+    passed=$((passed + 1))
+fi
+rm -rf $socketDir $expectedFile $actualFile
+
+echo "$passed passed, $failed failed."
+if [ $failed -ne 0 ]; then
+    exit 1
+fi
@@ -0,0 +1,75 @@
+#!/bin/bash
+
+# Exports test_cases and a short tournament as training shards, small enough that
+# there are several, then decodes every exported row and compares it with the
+# position, legal moves and move played in a replay of its game.
+
+echo "Running export test runner."
+
+gameDir=$(mktemp -d)
+shardDir=$(mktemp -d)
+python3 boxshogi.py -tournament 4 $gameDir random greedy > /dev/null
+python3 boxshogi.py -export $shardDir test_cases $gameDir -shard 300 > /dev/null
+python3 - $shardDir <<'EOF2'
+import glob
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    print("numpy is not installed, skipping.")
+    sys.exit(0)
+
+from analysis.archive import replay_file
+from analysis.export import NUM_ACTIONS, PIECE_REPRS, HAND_LETTERS, action_index, action_move
+from game_items.gamevars import BOARD_SIZE
+
+shard_dir = sys.argv[1]
+shards = [np.load(path) for path in sorted(glob.glob(os.path.join(shard_dir, "shard_*.npz")))]
+rows = {name: np.concatenate([shard[name] for shard in shards]) for name in shards[0].files}
+with open(os.path.join(shard_dir, "games.txt")) as f:
+    games = f.read().splitlines()
+expected = [(game, ply, position, move) for game, path in enumerate(games)
+            for ply, position, move in replay_file(path) if move is not None]
+
+
+def action_space():
+    return all(action_index(action_move(index)) == index for index in range(NUM_ACTIONS))
+
+
+def row_count():
+    return len(shards) > 1 and len(rows["move"]) == len(expected)
+
+
+def rows_match():
+    for i, (game, ply, position, move) in enumerate(expected):
+        squares = [""] * len(position.squares)
+        for plane, x, y in zip(*np.nonzero(rows["planes"][i])):
+            squares[x * BOARD_SIZE + y] = PIECE_REPRS[plane]
+        hands = [[HAND_LETTERS[letter]] * count for hand in rows["hands"][i] for letter, count in enumerate(hand)]
+        lower_hand = sorted(sum(hands[:len(HAND_LETTERS)], []))
+        upper_hand = sorted(sum(hands[len(HAND_LETTERS):], []))
+        legal = {action_move(index) for index in np.nonzero(rows["legal"][i])[0]}
+        if (squares != position.squares or lower_hand != sorted(position.lower_hand)
+                or upper_hand != sorted(p.lower() for p in position.upper_hand)
+                or rows["side"][i] != (position.side == "UPPER") or legal != set(position.legal_moves())
+                or action_move(rows["move"][i]) != move or (rows["game"][i], rows["ply"][i]) != (game, ply)):
+            print(f"row {i}: {games[game]} ply {ply}")
+            return False
+    return True
+
+
+passed = failed = 0
+for check in (action_space, row_count, rows_match):
+    if check():
+        passed += 1
+    else:
+        failed += 1
+        print(f"❌ {check.__name__}")
+print(f"{passed} passed, {failed} failed.")
+sys.exit(1 if failed else 0)
+EOF2
+status=$?
+rm -rf $gameDir $shardDir
+exit $status
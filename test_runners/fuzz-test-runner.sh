@@ -0,0 +1,21 @@
+#!/bin/bash
+
+# Runs the differential fuzzer on a fixed range of seeds. Every position reached is
+# checked by FileGame and Position alike, and Position.has_legal_move() is checked
+# against its full legal move list, so any divergence fails the run.
+
+echo "Running fuzz test runner."
+
+games=200
+actualFile="fuzzTestResult.out"
+python3 boxshogi.py -fuzz $games -workers 2 -seed 0 > $actualFile
+if [ "$(tail -n 1 $actualFile)" = "No divergence found." ]; then
+    rm -f $actualFile
+    echo "1 passed, 0 failed."
+else
+    echo "❌ fuzz -seed 0"
+    cat $actualFile
+    rm -f $actualFile
+    echo "0 passed, 1 failed."
+    exit 1
+fi
@@ -0,0 +1,29 @@
+#!/bin/bash
+
+# Runs the mate solver on every puzzle in test_cases_mate and compares the mate length
+# and principal variation with the expected output. The node count line is left out,
+# as it depends on the search order.
+
+echo "Running mate solver test runner."
+
+max_moves=4
+actualFile="mateTestResult.out"
+passed=0
+failed=0
+for puzzle in test_cases_mate/*.in; do
+    expected="${puzzle%.in}.out"
+    python3 boxshogi.py -mate $max_moves "$puzzle" | grep -v '^Nodes:' > $actualFile
+    if diff -q "$expected" $actualFile > /dev/null; then
+        passed=$((passed + 1))
+    else
+        failed=$((failed + 1))
+        echo "❌ $puzzle"
+        diff -y "$expected" $actualFile
+    fi
+done
+rm -f $actualFile
+
+echo "$passed passed, $failed failed."
+if [ $failed -ne 0 ]; then
+    exit 1
+fi
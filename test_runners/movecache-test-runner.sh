@@ -0,0 +1,58 @@
+#!/bin/bash
+
+# Replays test_cases and a short tournament in file mode and, after every move,
+# compares every move list cached by the board with the moves its piece generates
+# from scratch. Then asks for the moves of every square, so that the next move
+# invalidates a full cache.
+
+echo "Running move cache test runner."
+
+gameDir=$(mktemp -d)
+python3 boxshogi.py -tournament 10 $gameDir random random > /dev/null
+python3 - test_cases/*.in $gameDir/*.in <<'EOF2'
+import sys
+
+from game_items.gamevars import BOARD_SIZE
+from game_items.loc import Loc
+from game_modes.filegame import FileGame
+from utils import parseTestCase
+
+
+def fresh_moves(board, x, y):
+    piece = board._create_piece_from_repr(board.board[x][y])
+    piece.make_moves(board, Loc(x, y))
+    return piece.get_moves()
+
+
+def stale_squares(board):
+    return [(x, y) for (x, y), (piece_repr, moves) in board.move_cache.items()
+            if piece_repr == board.board[x][y] and moves != fresh_moves(board, x, y)]
+
+
+passed = failed = 0
+for path in sys.argv[1:]:
+    game_setup = parseTestCase(path)
+    game = FileGame()
+    game.initialize_game_state(game_setup)
+    stale = []
+    for ply, move in enumerate(game_setup['moves']):
+        if game.play_file_move(move):
+            break
+        stale = stale_squares(game.board)
+        if stale:
+            break
+        for x in range(BOARD_SIZE):
+            for y in range(BOARD_SIZE):
+                game.board.piece_moves(x, y)
+    if stale:
+        failed += 1
+        print(f"❌ {path}: stale moves on {stale} after {move}")
+        print(game.board)
+    else:
+        passed += 1
+print(f"{passed} passed, {failed} failed.")
+sys.exit(1 if failed else 0)
+EOF2
+status=$?
+rm -rf $gameDir
+exit $status
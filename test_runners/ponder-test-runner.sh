@@ -0,0 +1,30 @@
+#!/bin/bash
+
+# Plays every move list in test_cases_interactive through interactive mode, with and
+# without -ponder, and compares the output with the expected output. Pondering runs
+# between turns and must not change anything that is printed.
+
+echo "Running ponder test runner."
+
+actualFile="ponderTestResult.out"
+passed=0
+failed=0
+for moves in test_cases_interactive/*.in; do
+    expected="${moves%.in}.out"
+    for flags in "-i" "-i -ponder"; do
+        python3 boxshogi.py $flags < "$moves" > $actualFile
+        if cmp -s "$expected" $actualFile; then
+            passed=$((passed + 1))
+        else
+            failed=$((failed + 1))
+            echo "❌ $moves ($flags)"
+            diff "$expected" $actualFile | head -20
+        fi
+    done
+done
+rm -f $actualFile
+
+echo "$passed passed, $failed failed."
+if [ $failed -ne 0 ]; then
+    exit 1
+fi
@@ -0,0 +1,27 @@
+#!/bin/bash
+
+# Runs every game in test_cases_rep in file mode with the repetition rule on and
+# compares the output with the expected output.
+
+echo "Running repetition test runner."
+
+actualFile="repetitionTestResult.out"
+passed=0
+failed=0
+for game in test_cases_rep/*.in; do
+    expected="${game%.in}.out"
+    python3 boxshogi.py -f "$game" -rep > $actualFile
+    if diff -q "$expected" $actualFile > /dev/null; then
+        passed=$((passed + 1))
+    else
+        failed=$((failed + 1))
+        echo "❌ $game"
+        diff -y "$expected" $actualFile
+    fi
+done
+rm -f $actualFile
+
+echo "$passed passed, $failed failed."
+if [ $failed -ne 0 ]; then
+    exit 1
+fi
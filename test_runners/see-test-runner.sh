@@ -0,0 +1,89 @@
+#!/bin/bash
+
+# Compares the static exchange evaluation of every legal move, in every position of
+# test_cases and a short tournament, with a brute-force exchange search. The search
+# scans the whole board for attackers and tries every least valuable one, as ties
+# may end differently, so the evaluation must be one of the values it finds.
+
+echo "Running static exchange evaluation test runner."
+
+gameDir=$(mktemp -d)
+python3 boxshogi.py -tournament 10 $gameDir random random > /dev/null
+python3 - test_cases/*.in $gameDir/*.in <<'EOF2'
+import sys
+
+from analysis.archive import replay_file
+from analysis.see import see, piece_value, capture_value, _recapturing_piece
+from game_items.position import PROMOTABLE, parse_square, in_last_row, move_tables
+
+_, LINES, _ = move_tables()
+
+
+def attackers(squares, target, upper):
+    """Every square holding a piece of the player that can move to the target."""
+    return [start for start, piece_repr in enumerate(squares)
+            if piece_repr and piece_repr[-1].isupper() == upper and target in LINES[piece_repr][start]
+            and not any(squares[between] for between in LINES[piece_repr][start][target])]
+
+
+def exchange(squares, target, upper):
+    """The values the player can reach by going on capturing on the target, or stopping."""
+    candidates = attackers(squares, target, upper)
+    if not candidates:
+        return {0}
+    least = min(piece_value(squares[start]) for start in candidates)
+    values = set()
+    for start in candidates:
+        attacker_repr = squares[start]
+        if piece_value(attacker_repr) != least:
+            continue
+        after = squares[:]
+        after[start] = ""
+        if attacker_repr in ("d", "D") and attackers(after, target, not upper):
+            values.add(0)
+            continue
+        recapturing = _recapturing_piece(attacker_repr, start, target, upper)
+        after[target] = recapturing
+        gain = capture_value(squares[target]) + piece_value(recapturing) - piece_value(attacker_repr)
+        values |= {max(0, gain - reply) for reply in exchange(after, target, not upper)}
+    return values
+
+
+def brute_force(position, move):
+    squares = position.squares[:]
+    upper = position.side == "UPPER"
+    split = move.split()
+    if split[0] == "drop":
+        target = parse_square(split[2])
+        squares[target] = split[1].upper() if upper else split[1].lower()
+        gain = 0
+    else:
+        start, target = parse_square(split[1]), parse_square(split[2])
+        piece_repr = squares[start]
+        gain = capture_value(squares[target]) if squares[target] else 0
+        if piece_repr in PROMOTABLE and (len(split) > 3 or (piece_repr in ("p", "P") and in_last_row(target, upper))):
+            gain += piece_value("+" + piece_repr) - piece_value(piece_repr)
+            piece_repr = "+" + piece_repr
+        squares[start] = ""
+        squares[target] = piece_repr
+    return {gain - reply for reply in exchange(squares, target, not upper)}
+
+
+passed = failed = 0
+for path in sys.argv[1:]:
+    wrong = [(ply, position, move) for ply, position, _ in replay_file(path)
+             for move in position.legal_moves() if see(position, move) not in brute_force(position, move)]
+    if wrong:
+        failed += 1
+        ply, position, move = wrong[0]
+        print(f"❌ {path}: {len(wrong)} moves, e.g. {move} at ply {ply}: "
+              f"{see(position, move)} not in {sorted(brute_force(position, move))}")
+        print(position.to_board())
+    else:
+        passed += 1
+print(f"{passed} passed, {failed} failed.")
+sys.exit(1 if failed else 0)
+EOF2
+status=$?
+rm -rf $gameDir
+exit $status
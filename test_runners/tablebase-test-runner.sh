@@ -0,0 +1,58 @@
+#!/bin/bash
+
+# Generates the tablebase of a Shield and both Drives and checks it: every index
+# decodes to a position that encodes back to the same index, a position and its
+# color-flipped twin share their entry, and every entry agrees with a one-ply search
+# over the entries of the positions its legal moves lead to.
+
+echo "Running tablebase test runner."
+
+material="s"
+tableDir=$(mktemp -d)
+python3 boxshogi.py -tbgen $material $tableDir > /dev/null
+python3 - "$tableDir/$material.tb" <<'EOF'
+import sys
+
+from analysis.tablebase import Tablebase, WIN, LOSS
+
+table = Tablebase(sys.argv[1])
+positions = [(index, table.index.position_at(index)) for index in range(table.index.size)]
+positions = [(index, position) for index, position in positions if position is not None]
+
+
+def round_trip(index, position):
+    return table.index.index_of(position) == index and table.index.index_of(position.flipped()) == index
+
+
+def flipped_twin(index, position):
+    return table.probe(position) == table.probe(position.flipped())
+
+
+def one_ply_search(index, position):
+    entry = table.probe(position)
+    children = [table.probe(position.play(move)) for move in position.legal_moves()]
+    if not children:
+        return entry == (LOSS, 0)
+    losses = [child.plies for child in children if child.outcome == LOSS]
+    if losses:
+        return entry == (WIN, min(losses) + 1)
+    if all(child.outcome == WIN for child in children):
+        return entry == (LOSS, max(child.plies for child in children) + 1)
+    return entry == (None, None)
+
+
+passed = failed = 0
+for check in (round_trip, flipped_twin, one_ply_search):
+    wrong = [index for index, position in positions if not check(index, position)]
+    if wrong:
+        failed += 1
+        print(f"❌ {check.__name__}: {len(wrong)} of {len(positions)} positions, e.g. index {wrong[0]}")
+        print(table.index.position_at(wrong[0]).to_board())
+    else:
+        passed += 1
+print(f"{passed} passed, {failed} failed.")
+sys.exit(1 if failed else 0)
+EOF
+status=$?
+rm -rf $tableDir
+exit $status
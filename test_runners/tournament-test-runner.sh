@@ -0,0 +1,48 @@
+#!/bin/bash
+
+# Plays a short tournament with one and with two worker processes, checks that both
+# write the same games, and replays every game in file mode to check the result
+# recorded in results.csv.
+
+echo "Running tournament test runner."
+
+games=24
+oneWorker=$(mktemp -d)
+twoWorkers=$(mktemp -d)
+actualFile="tournamentTestResult.out"
+python3 boxshogi.py -tournament $games $oneWorker random greedy -workers 1 > /dev/null
+python3 boxshogi.py -tournament $games $twoWorkers random greedy -workers 2 > /dev/null
+
+passed=0
+failed=0
+if diff -r -q $oneWorker $twoWorkers > /dev/null; then
+    passed=$((passed + 1))
+else
+    failed=$((failed + 1))
+    echo "❌ games differ with one and two workers"
+    diff -r -q $oneWorker $twoWorkers
+fi
+
+tail -n +2 $oneWorker/results.csv | while IFS=, read game lower upper winner reason plies; do
+    case $winner in
+        none) expected="lower>|UPPER>" ;;
+        tie) expected="Tie game.  $reason" ;;
+        *) expected="$winner player wins.  $reason" ;;
+    esac
+    python3 boxshogi.py -f $oneWorker/$game | tail -n 1 > $actualFile
+    if ! grep -q -x -E "$expected" $actualFile; then
+        echo "❌ $game: expected $expected, file mode says $(cat $actualFile)"
+    fi
+done > mismatches.txt
+if [ -s mismatches.txt ]; then
+    failed=$((failed + 1))
+    cat mismatches.txt
+else
+    passed=$((passed + 1))
+fi
+rm -rf $oneWorker $twoWorkers $actualFile mismatches.txt
+
+echo "$passed passed, $failed failed."
+if [ $failed -ne 0 ]; then
+    exit 1
+fi
@@ -0,0 +1,90 @@
+#!/bin/bash
+
+# Tunes an evaluation on a short tournament and checks that the error never rises as
+# the fit runs longer and ends below the error of the starting weights, and that the
+# written module evaluates every position as the tuned weights do. Then checks that
+# the module written by -tune evaluates a game in file mode.
+
+echo "Running tuning test runner."
+
+gameDir=$(mktemp -d)
+python3 boxshogi.py -tournament 30 $gameDir/games random greedy > /dev/null
+python3 boxshogi.py -tune $gameDir/cli_eval.py $gameDir/games -iterations 20 > /dev/null
+python3 - $gameDir test_cases/winOnLastMove.in <<'EOF2'
+import glob
+import importlib.util
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    print("numpy is not installed, skipping.")
+    sys.exit(0)
+
+from analysis.archive import replay_file
+from analysis.tuning import (KEY_SIZE, extract_positions, features, fit, fit_scale, initial_weights, evaluate_keys,
+                             write_module, _error, _evaluate_all)
+from game_items.position import Position
+from game_modes.filegame import FileGame
+from utils import parseTestCase
+
+game_dir = sys.argv[1]
+keys, labels = extract_positions([os.path.join(game_dir, "games")])
+matrix = features(keys)
+weights = initial_weights()
+scale = fit_scale(matrix, labels, weights)
+errors = [_error(_evaluate_all(matrix, weights), labels, scale)]
+for iterations in (5, 20, 60):
+    tuned, _, error = fit(matrix, labels, weights, scale, iterations=iterations)
+    errors.append(error)
+
+
+def load(path):
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def error_decreases():
+    return all(later <= earlier for earlier, later in zip(errors, errors[1:])) and errors[-1] < errors[0]
+
+
+def module_matches_weights():
+    path = os.path.join(game_dir, "tuned_eval.py")
+    write_module(path, tuned, scale, len(labels), errors[-1])
+    module = load(path)
+    positions = [position for game in sorted(glob.glob(os.path.join(game_dir, "games", "*.in")))
+                 for _, position, _ in replay_file(game)]
+    position_keys = np.frombuffer(b"".join(position.compact_key() for position in positions), dtype=np.uint8)
+    expected = evaluate_keys(position_keys.reshape(len(positions), KEY_SIZE), tuned)
+    values = [module.evaluate_squares(position.squares, position.upper_hand, position.lower_hand, position.side)
+              for position in positions]
+    # The module rounds every value to 4 decimals
+    return all(abs((value if position.side == "lower" else -value) - lower_value) < 0.01
+               for position, value, lower_value in zip(positions, values, expected))
+
+
+def cli_module_evaluates():
+    module = load(os.path.join(game_dir, "cli_eval.py"))
+    game = FileGame()
+    game.initialize_game_state(parseTestCase(sys.argv[2]))
+    position = Position.from_game(game)
+    value = module.evaluate(game.board, game.upper, game.lower, game.cur_player)
+    return value == module.evaluate_squares(position.squares, position.upper_hand, position.lower_hand, position.side)
+
+
+passed = failed = 0
+for check in (error_decreases, module_matches_weights, cli_module_evaluates):
+    if check():
+        passed += 1
+    else:
+        failed += 1
+        print(f"❌ {check.__name__}")
+print(f"{passed} passed, {failed} failed.")
+sys.exit(1 if failed else 0)
+EOF2
+status=$?
+rm -rf $gameDir
+exit $status
@@ -1,9 +1,9 @@
 def parseTestCase(path):
     """
     Utility function to help parse test cases.
-    :param path: Path to test case file.
+    :param path: Path to test case file, or an open file-like object holding one.
     """
-    f = open(path)
+    f = open(path) if isinstance(path, str) else path
     line = f.readline()
     initialBoardState = []
     while line != '\n':